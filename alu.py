@@ -0,0 +1,75 @@
+from ricoh2a03 import Ricoh2A03
+
+# Flag bits as they appear in the status register. Flag tables pack the flags
+# an operation changes into one byte with this layout.
+C_FLAG = 0x01
+Z_FLAG = 0x02
+N_FLAG = 0x80
+
+
+def _nz(value):
+    return (Z_FLAG if value == 0 else 0) | (value & N_FLAG)
+
+
+def _build_compare():
+    """CMP/CPX/CPY C/Z/N flags, indexed by (register << 8) | operand."""
+    flags = bytearray(0x10000)
+    for reg in range(256):
+        for value in range(256):
+            packed = _nz((reg - value) & 0xFF)
+            if reg >= value:
+                packed |= C_FLAG
+            flags[(reg << 8) | value] = packed
+    return bytes(flags)
+
+
+def _build_shifts():
+    """ASL/LSR results and C/Z/N flags, indexed by operand."""
+    tables = {}
+    operations = {
+        "asl": (lambda value: (value << 1) & 0xFF, 0x80),
+        "lsr": (lambda value: value >> 1, 0x01),
+    }
+    for name, (operation, carry_out) in operations.items():
+        results = bytes(operation(value) for value in range(256))
+        flags = bytes(_nz(results[value]) | (C_FLAG if value & carry_out else 0) for value in range(256))
+        tables[name] = (results, flags)
+    return tables
+
+
+COMPARE_FLAGS = _build_compare()
+SHIFTS = _build_shifts()
+ASL_RESULT, ASL_FLAGS = SHIFTS["asl"]
+LSR_RESULT, LSR_FLAGS = SHIFTS["lsr"]
+
+
+class TableALU(Ricoh2A03):
+    """Ricoh2A03 whose compares, ASL and LSR read results and flags from precomputed tables.
+
+    Behaviour is identical to the branching ALU in Ricoh2A03; only the cost
+    per operation differs. Tables are kept only where they win: for ADC, SBC,
+    ROL and ROR, unpacking the flags costs as much as computing them, and
+    benchmark.py measured those slower than the branching code.
+    """
+
+    __slots__ = ()
+
+    def _compare(self, reg, value):
+        flags = COMPARE_FLAGS[(reg << 8) | value]
+        self.C = flags & C_FLAG
+        self.Z = flags & Z_FLAG != 0
+        self.N = flags >= N_FLAG
+
+    def _asl(self, value):
+        flags = ASL_FLAGS[value]
+        self.C = flags & C_FLAG
+        self.Z = flags & Z_FLAG != 0
+        self.N = flags >= N_FLAG
+        return ASL_RESULT[value]
+
+    def _lsr(self, value):
+        flags = LSR_FLAGS[value]
+        self.C = flags & C_FLAG
+        self.Z = flags & Z_FLAG != 0
+        self.N = False
+        return LSR_RESULT[value]
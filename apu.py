@@ -0,0 +1,613 @@
+import copy
+import wave
+from collections import deque
+
+import numpy as np
+
+CPU_FREQUENCY = 1789773    # NTSC CPU clock in Hz
+
+LENGTH_TABLE = (
+    10, 254, 20, 2, 40, 4, 80, 6, 160, 8, 60, 10, 14, 12, 26, 14,
+    12, 16, 24, 18, 48, 20, 96, 22, 192, 24, 72, 26, 16, 28, 32, 30,
+)
+NOISE_PERIODS = (4, 8, 16, 32, 64, 96, 128, 160, 202, 254, 380, 508, 762, 1016, 2034, 4068)
+DMC_RATES = (428, 380, 340, 320, 286, 254, 226, 214, 190, 160, 142, 128, 106, 84, 72, 54)
+
+DUTY_TABLE = np.array([
+    [0, 1, 0, 0, 0, 0, 0, 0],
+    [0, 1, 1, 0, 0, 0, 0, 0],
+    [0, 1, 1, 1, 1, 0, 0, 0],
+    [1, 0, 0, 1, 1, 1, 1, 1],
+], dtype=np.float64)
+TRIANGLE_TABLE = np.array(list(range(15, -1, -1)) + list(range(16)), dtype=np.float64)
+
+# Frame sequencer steps, in CPU cycles from the start of the sequence:
+# (cycle, quarter frame, half frame, frame IRQ)
+FRAME_STEPS = (
+    ((7457, True, False, False), (14913, True, True, False),
+     (22371, True, False, False), (29829, True, True, True)),
+    ((7457, True, False, False), (14913, True, True, False),
+     (22371, True, False, False), (37281, True, True, False)),
+)
+FRAME_PERIODS = (29830, 37282)
+
+
+def _noise_sequence(tap):
+    """Returns whether the noise channel sounds for each LFSR state, starting from 1."""
+    state = 1
+    output = []
+    while True:
+        output.append(not state & 1)
+        feedback = (state ^ (state >> tap)) & 1
+        state = (state >> 1) | (feedback << 14)
+        if state == 1:
+            return np.array(output, dtype=np.float64)
+
+# The LFSR visits every state of its cycle in a fixed order, so the output
+# for any stretch of time is a slice of one precomputed sequence per mode.
+NOISE_SEQUENCES = (_noise_sequence(1), _noise_sequence(6))
+
+
+class _Envelope:
+    def __init__(self):
+        self.start = False
+        self.divider = 0
+        self.decay = 0
+        self.period = 0
+        self.loop = False
+        self.constant = False
+
+    def control(self, value):
+        self.loop = bool(value & 0x20)
+        self.constant = bool(value & 0x10)
+        self.period = value & 0x0F
+
+    def clock(self):
+        if self.start:
+            self.start = False
+            self.decay = 15
+            self.divider = self.period
+        elif self.divider == 0:
+            self.divider = self.period
+            if self.decay:
+                self.decay -= 1
+            elif self.loop:
+                self.decay = 15
+        else:
+            self.divider -= 1
+
+    def volume(self):
+        return self.period if self.constant else self.decay
+
+
+class _Pulse:
+    def __init__(self, ones_complement):
+        self.ones_complement = ones_complement  # Pulse 1 negates with one's complement
+        self.envelope = _Envelope()
+        self.enabled = False
+        self.length = 0
+        self.duty = 0
+        self.timer = 0
+        self.phase = 0.0
+        self.sweep_enabled = False
+        self.sweep_period = 0
+        self.sweep_negate = False
+        self.sweep_shift = 0
+        self.sweep_divider = 0
+        self.sweep_reload = False
+
+    def write(self, register, value):
+        if register == 0:
+            self.duty = value >> 6
+            self.envelope.control(value)
+        elif register == 1:
+            self.sweep_enabled = bool(value & 0x80)
+            self.sweep_period = (value >> 4) & 0x07
+            self.sweep_negate = bool(value & 0x08)
+            self.sweep_shift = value & 0x07
+            self.sweep_reload = True
+        elif register == 2:
+            self.timer = (self.timer & 0x700) | value
+        else:
+            self.timer = (self.timer & 0x0FF) | ((value & 0x07) << 8)
+            if self.enabled:
+                self.length = LENGTH_TABLE[value >> 3]
+            self.envelope.start = True
+            self.phase = 0.0
+
+    def _sweep_target(self):
+        change = self.timer >> self.sweep_shift
+        if self.sweep_negate:
+            return self.timer - change - (1 if self.ones_complement else 0)
+        return self.timer + change
+
+    def _muted(self):
+        return self.timer < 8 or self._sweep_target() > 0x7FF
+
+    def clock_half(self):
+        if self.length and not self.envelope.loop:
+            self.length -= 1
+        if self.sweep_divider == 0 and self.sweep_enabled and self.sweep_shift and not self._muted():
+            self.timer = max(self._sweep_target(), 0)
+        if self.sweep_divider == 0 or self.sweep_reload:
+            self.sweep_divider = self.sweep_period
+            self.sweep_reload = False
+        else:
+            self.sweep_divider -= 1
+
+    def render(self, offsets, span):
+        """Returns the output (0-15) at the given cycle offsets into a segment of span cycles."""
+        period = 2 * (self.timer + 1)
+        start = self.phase
+        self.phase = (start + span / period) % 8
+        volume = self.envelope.volume()
+        if not self.length or not volume or self._muted():
+            return None
+        steps = (start + offsets / period).astype(np.intp) & 7
+        return DUTY_TABLE[self.duty][steps] * volume
+
+
+class _Triangle:
+    def __init__(self):
+        self.enabled = False
+        self.length = 0
+        self.control = False
+        self.linear = 0
+        self.linear_reload_value = 0
+        self.linear_reload = False
+        self.timer = 0
+        self.phase = 0.0
+
+    def write(self, register, value):
+        if register == 0:
+            self.control = bool(value & 0x80)
+            self.linear_reload_value = value & 0x7F
+        elif register == 2:
+            self.timer = (self.timer & 0x700) | value
+        elif register == 3:
+            self.timer = (self.timer & 0x0FF) | ((value & 0x07) << 8)
+            if self.enabled:
+                self.length = LENGTH_TABLE[value >> 3]
+            self.linear_reload = True
+
+    def clock_quarter(self):
+        if self.linear_reload:
+            self.linear = self.linear_reload_value
+        elif self.linear:
+            self.linear -= 1
+        if not self.control:
+            self.linear_reload = False
+
+    def clock_half(self):
+        if self.length and not self.control:
+            self.length -= 1
+
+    def render(self, offsets, span):
+        start = self.phase
+        # The sequencer only advances while both counters are non-zero. Ultrasonic
+        # periods are held rather than rendered, as they are inaudible.
+        if self.length and self.linear and self.timer >= 2:
+            period = self.timer + 1
+            self.phase = (start + span / period) % 32
+            steps = (start + offsets / period).astype(np.intp) & 31
+            return TRIANGLE_TABLE[steps]
+        return np.full(len(offsets), TRIANGLE_TABLE[int(start) & 31])
+
+
+class _Noise:
+    def __init__(self):
+        self.envelope = _Envelope()
+        self.enabled = False
+        self.length = 0
+        self.mode = 0
+        self.period = NOISE_PERIODS[0]
+        self.phase = 0.0
+
+    def write(self, register, value):
+        if register == 0:
+            self.envelope.control(value)
+        elif register == 2:
+            self.mode = value >> 7
+            self.period = NOISE_PERIODS[value & 0x0F]
+        elif register == 3:
+            if self.enabled:
+                self.length = LENGTH_TABLE[value >> 3]
+            self.envelope.start = True
+
+    def clock_half(self):
+        if self.length and not self.envelope.loop:
+            self.length -= 1
+
+    def render(self, offsets, span):
+        sequence = NOISE_SEQUENCES[self.mode]
+        start = self.phase
+        self.phase = (start + span / self.period) % len(sequence)
+        volume = self.envelope.volume()
+        if not self.length or not volume:
+            return None
+        steps = (start + offsets / self.period).astype(np.intp) % len(sequence)
+        return sequence[steps] * volume
+
+
+class _DMC:
+    def __init__(self, read_memory):
+        self.read_memory = read_memory
+        self.irq_enabled = False
+        self.loop = False
+        self.rate = DMC_RATES[0]
+        self.level = 0
+        self.sample_address = 0xC000
+        self.sample_length = 1
+        self.address = 0xC000
+        self.remaining = 0      # Sample bytes not yet fetched
+        self.shift = 0          # Bits of the current byte not yet played
+        self.bits = 0
+        self.phase = 0.0        # Cycles into the current output bit
+        self.irq = False
+
+    def write(self, register, value):
+        if register == 0:
+            self.irq_enabled = bool(value & 0x80)
+            self.loop = bool(value & 0x40)
+            self.rate = DMC_RATES[value & 0x0F]
+            if not self.irq_enabled:
+                self.irq = False
+        elif register == 1:
+            self.level = value & 0x7F
+        elif register == 2:
+            self.sample_address = 0xC000 | (value << 6)
+        else:
+            self.sample_length = (value << 4) | 1
+
+    def restart(self):
+        self.address = self.sample_address
+        self.remaining = self.sample_length
+
+    def _next_bit(self):
+        """Returns the next sample bit, fetching bytes from CPU memory as needed, or None."""
+        if not self.bits:
+            if not self.remaining:
+                return None
+            self.shift = self.read_memory(self.address)
+            self.address = 0x8000 | ((self.address + 1) & 0x7FFF)
+            self.bits = 8
+            self.remaining -= 1
+            if not self.remaining:
+                if self.loop:
+                    self.restart()
+                elif self.irq_enabled:
+                    self.irq = True
+        bit = self.shift & 1
+        self.shift >>= 1
+        self.bits -= 1
+        return bit
+
+    def cycles_until_idle(self):
+        """Cycles until the last sample byte is fetched, or None when not playing."""
+        if not self.remaining:
+            return None
+        return (self.rate - self.phase) + (self.bits + (self.remaining - 1) * 8) * self.rate
+
+    def render(self, offsets, span):
+        start = self.phase
+        count = int((start + span) // self.rate)
+        self.phase = (start + span) % self.rate
+        if not self.remaining and not self.bits:
+            return np.full(len(offsets), float(self.level))
+        # The 7 bit counter saturates, so the deltas have to be applied one
+        # bit at a time; there are at most a few hundred bits per frame.
+        levels = [self.level]
+        for _ in range(count):
+            bit = self._next_bit()
+            if bit is None:
+                break
+            if bit and self.level <= 125:
+                self.level += 2
+            elif not bit and self.level >= 2:
+                self.level -= 2
+            levels.append(self.level)
+        levels = np.array(levels, dtype=np.float64)
+        steps = np.minimum(((offsets + start) // self.rate).astype(np.intp), len(levels) - 1)
+        return levels[steps]
+
+
+# Scalar attributes of the APU saved by save_state(); channels are saved separately.
+_STATE_FIELDS = (
+    "cycle", "frame_mode", "irq_inhibit", "frame_irq", "_frame_start", "_frame_step", "_sample_cycle",
+)
+
+
+def _channel_state(channel):
+    state = {name: value for name, value in vars(channel).items() if name not in ("envelope", "read_memory")}
+    if hasattr(channel, "envelope"):
+        state["envelope"] = dict(vars(channel.envelope))
+    return state
+
+
+def _load_channel_state(channel, state):
+    for name, value in state.items():
+        if name == "envelope":
+            vars(channel.envelope).update(value)
+        else:
+            setattr(channel, name, value)
+
+
+def _copy_channel(channel):
+    other = copy.copy(channel)
+    if hasattr(channel, "envelope"):
+        other.envelope = copy.copy(channel.envelope)
+    return other
+
+
+class APU:
+    """NES Audio Processing Unit: two pulse channels, triangle, noise and DMC.
+
+    Register writes are recorded with the CPU cycle on which they happened and
+    replayed in order by run(), which synthesizes audio for the stretch of time
+    between consecutive events (writes and frame sequencer steps) as NumPy
+    blocks. Within such a stretch every channel parameter is constant, so each
+    channel's output is a vectorized function of time. The CPU calls run() at
+    its sync points (at least twice per frame when a PPU is attached), when
+    $4015 is read and when the frame sequencer raises an IRQ.
+
+    Pass sample_rate=None to emulate the registers and IRQs without producing audio.
+    Samples not collected with take_samples() are kept for buffer_seconds;
+    older blocks are dropped, so a machine nobody listens to does not grow.
+    """
+
+    def __init__(self, sample_rate=44100, read_memory=None, buffer_seconds=1.0):
+        self.sample_rate = sample_rate
+        self.buffer_seconds = buffer_seconds
+        self.pulse1 = _Pulse(ones_complement=True)
+        self.pulse2 = _Pulse(ones_complement=False)
+        self.triangle = _Triangle()
+        self.noise = _Noise()
+        self.dmc = _DMC(read_memory or (lambda addr: 0))
+        self._channels = (self.pulse1, self.pulse2, self.triangle, self.noise)
+
+        self.cycle = 0              # CPU cycle the APU has been run up to
+        self.frame_mode = 0
+        self.irq_inhibit = False
+        self.frame_irq = False
+        self._frame_start = 0
+        self._frame_step = 0
+
+        self._writes = []           # (cycle, address, value) not yet applied
+        self._sample_cycle = 0.0    # CPU cycle of the next output sample
+        self._samples = deque()     # int16 blocks not yet taken, oldest first
+        self._buffered = 0          # Samples in _samples
+
+    def clone(self, read_memory=None):
+        """Returns an APU in the same state whose DMC fetches through read_memory."""
+        other = copy.copy(self)
+        other.pulse1, other.pulse2, other.triangle, other.noise, other.dmc = (
+            _copy_channel(channel) for channel in (self.pulse1, self.pulse2, self.triangle, self.noise, self.dmc)
+        )
+        other.dmc.read_memory = read_memory or (lambda addr: 0)
+        other._channels = (other.pulse1, other.pulse2, other.triangle, other.noise)
+        other._writes = list(self._writes)
+        other._samples = deque(self._samples)
+        return other
+
+    def save_state(self):
+        """Returns the frame counter, channel and pending write state as a dict of plain values."""
+        state = {name: getattr(self, name) for name in _STATE_FIELDS}
+        state["writes"] = list(self._writes)
+        state["channels"] = [_channel_state(channel) for channel in (*self._channels, self.dmc)]
+        return state
+
+    def load_state(self, state):
+        """Restores a state returned by save_state(). Samples not yet taken are discarded."""
+        for name in _STATE_FIELDS:
+            setattr(self, name, state[name])
+        self._writes = list(state["writes"])
+        for channel, channel_state in zip((*self._channels, self.dmc), state["channels"]):
+            _load_channel_state(channel, channel_state)
+        self._samples = deque()
+        self._buffered = 0
+
+    @property
+    def irq(self):
+        """State of the IRQ line driven by the frame counter and DMC."""
+        return self.frame_irq or self.dmc.irq
+
+    def write_register(self, addr, value, cycle):
+        """Records a write to $4000-$4013, $4015 or $4017."""
+        self._writes.append((cycle, addr, value))
+        # Writes that change when the next IRQ fires are applied straight away
+        # so that next_sync_cycle() stays correct.
+        if addr in (0x4010, 0x4015, 0x4017):
+            self.run(cycle)
+
+    def read_status(self, cycle):
+        """Reads $4015, which acknowledges the frame IRQ."""
+        self.run(cycle)
+        value = (
+            (self.pulse1.length > 0)
+            | (self.pulse2.length > 0) << 1
+            | (self.triangle.length > 0) << 2
+            | (self.noise.length > 0) << 3
+            | (self.dmc.remaining > 0) << 4
+            | self.frame_irq << 6
+            | self.dmc.irq << 7
+        )
+        self.frame_irq = False
+        return value
+
+    def next_sync_cycle(self):
+        """Predicts the CPU cycle of the next IRQ, or None if no IRQ is coming."""
+        deadline = None
+        if not self.frame_mode and not self.irq_inhibit and not self.frame_irq:
+            deadline = self._frame_start + FRAME_STEPS[0][3][0]
+        if self.dmc.irq_enabled and not self.dmc.loop and not self.dmc.irq:
+            idle = self.dmc.cycles_until_idle()
+            if idle is not None:
+                dmc_deadline = self.cycle + int(idle)
+                if deadline is None or dmc_deadline < deadline:
+                    deadline = dmc_deadline
+        return deadline
+
+    def run(self, cycle):
+        """Applies recorded writes and frame sequencer steps up to cycle, synthesizing audio."""
+        writes = self._writes
+        index = 0
+        while True:
+            next_write = writes[index][0] if index < len(writes) else None
+            if next_write is not None and next_write > cycle:
+                next_write = None
+            steps = FRAME_STEPS[self.frame_mode]
+            next_step = self._frame_start + steps[self._frame_step][0]
+
+            if next_write is not None and next_write <= next_step:
+                self._synthesize(next_write)
+                _, addr, value = writes[index]
+                index += 1
+                self._apply(addr, value)
+            elif next_step <= cycle:
+                self._synthesize(next_step)
+                self._clock_frame_step()
+            else:
+                self._synthesize(cycle)
+                break
+        del writes[:index]
+
+    def take_samples(self):
+        """Returns the int16 samples synthesized since the last call."""
+        if not self._samples:
+            return np.zeros(0, dtype=np.int16)
+        samples = np.concatenate(self._samples)
+        self._samples = deque()
+        self._buffered = 0
+        return samples
+
+    # Frame sequencer
+
+    def _clock_frame_step(self):
+        _, quarter, half, irq = FRAME_STEPS[self.frame_mode][self._frame_step]
+        if quarter:
+            self._clock_quarter()
+        if half:
+            self._clock_half()
+        if irq and not self.irq_inhibit:
+            self.frame_irq = True
+        self._frame_step += 1
+        if self._frame_step == 4:
+            self._frame_step = 0
+            self._frame_start += FRAME_PERIODS[self.frame_mode]
+
+    def _clock_quarter(self):
+        self.pulse1.envelope.clock()
+        self.pulse2.envelope.clock()
+        self.noise.envelope.clock()
+        self.triangle.clock_quarter()
+
+    def _clock_half(self):
+        self.pulse1.clock_half()
+        self.pulse2.clock_half()
+        self.triangle.clock_half()
+        self.noise.clock_half()
+
+    def _apply(self, addr, value):
+        if addr < 0x4004:
+            self.pulse1.write(addr & 3, value)
+        elif addr < 0x4008:
+            self.pulse2.write(addr & 3, value)
+        elif addr < 0x400C:
+            self.triangle.write(addr & 3, value)
+        elif addr < 0x4010:
+            self.noise.write(addr & 3, value)
+        elif addr < 0x4014:
+            self.dmc.write(addr & 3, value)
+        elif addr == 0x4015:
+            for bit, channel in enumerate(self._channels):
+                channel.enabled = bool(value & (1 << bit))
+                if not channel.enabled:
+                    channel.length = 0
+            if value & 0x10:
+                if not self.dmc.remaining:
+                    self.dmc.restart()
+            else:
+                self.dmc.remaining = 0
+            self.dmc.irq = False
+        elif addr == 0x4017:
+            self.frame_mode = value >> 7
+            self.irq_inhibit = bool(value & 0x40)
+            if self.irq_inhibit:
+                self.frame_irq = False
+            self._frame_start = self.cycle
+            self._frame_step = 0
+            if self.frame_mode:
+                self._clock_quarter()
+                self._clock_half()
+
+    # Synthesis
+
+    def _synthesize(self, cycle):
+        """Renders the samples that fall between self.cycle and cycle."""
+        span = cycle - self.cycle
+        if span <= 0:
+            return
+        start = self.cycle
+        self.cycle = cycle
+
+        if self.sample_rate is None:
+            for channel in self._channels:
+                channel.render(np.zeros(0), span)
+            self.dmc.render(np.zeros(0), span)
+            return
+
+        step = CPU_FREQUENCY / self.sample_rate
+        count = int(np.ceil((cycle - self._sample_cycle) / step))
+        offsets = self._sample_cycle - start + np.arange(max(count, 0)) * step
+        self._sample_cycle += max(count, 0) * step
+
+        outputs = [channel.render(offsets, span) for channel in self._channels]
+        dmc = self.dmc.render(offsets, span)
+        if not count:
+            return
+        zero = np.zeros(count)
+        pulse1, pulse2, triangle, noise = (zero if out is None else out for out in outputs)
+
+        # Nonlinear mixer from the 2A03 DACs.
+        pulse = pulse1 + pulse2
+        with np.errstate(divide='ignore'):
+            pulse_out = np.where(pulse > 0, 95.88 / (8128.0 / pulse + 100), 0.0)
+            tnd = triangle / 8227 + noise / 12241 + dmc / 22638
+            tnd_out = np.where(tnd > 0, 159.79 / (1 / tnd + 100), 0.0)
+        mixed = np.clip((pulse_out + tnd_out) * 32767, 0, 32767)
+        samples = self._samples
+        samples.append(mixed.astype(np.int16))
+        self._buffered += count
+        # Drop the oldest blocks while the rest still cover buffer_seconds.
+        limit = self.buffer_seconds * self.sample_rate
+        while self._buffered - len(samples[0]) >= limit:
+            self._buffered -= len(samples.popleft())
+
+
+def write_wav(filename, samples, sample_rate=44100):
+    """Writes mono int16 samples to a WAV file."""
+    with wave.open(filename, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(np.asarray(samples, dtype='<i2').tobytes())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from nes import Cartridge, power_on
+
+    parser = argparse.ArgumentParser(description="Render a ROM's audio to a WAV file without a display.")
+    parser.add_argument("rom")
+    parser.add_argument("frames", type=int)
+    parser.add_argument("output")
+    parser.add_argument("--rate", type=int, default=44100, choices=(44100, 48000))
+    args = parser.parse_args()
+
+    cpu = power_on(Cartridge.from_file(args.rom), sample_rate=args.rate)
+    blocks = []
+    for _ in range(args.frames):
+        cpu.run_frame()
+        blocks.append(cpu.apu.take_samples())
+    write_wav(args.output, np.concatenate(blocks), args.rate)
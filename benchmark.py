@@ -0,0 +1,231 @@
+"""Micro benchmarks for the emulator core.
+
+    python benchmark.py [name ...]
+
+Runs every benchmark when no names are given.
+"""
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from alu import TableALU
+from memory import RAM_SIZE, ROM_SIZE, Memory
+from ramsearch import RamSearch
+from ricoh2a03 import Ricoh2A03
+
+
+def _best(statement, number, repeat=5):
+    """Best time per call in nanoseconds."""
+    return min(timeit.repeat(statement, number=number, repeat=repeat)) / number * 1e9
+
+
+def bench_alu(number=200000):
+    """Branching ALU helpers against the table driven ones in alu.TableALU."""
+    rng = random.Random(6502)
+    operands = [rng.randrange(256) for _ in range(number)]
+    print(f"{'operation':<10}{'branching':>12}{'tables':>12}{'speedup':>10}")
+    for name in ("_compare", "_asl", "_lsr"):
+        times = []
+        for cls in (Ricoh2A03, TableALU):
+            cpu = cls(bytearray(0x10000), trace=False)
+            cpu.A = 0x5A
+            method = getattr(cpu, name)
+            if name == "_compare":
+                def run():
+                    for value in operands:
+                        method(0x80, value)
+            else:
+                def run():
+                    for value in operands:
+                        method(value)
+            times.append(_best(run, 1) / number)
+        print(f"{name[1:]:<10}{times[0]:>10.1f}ns{times[1]:>10.1f}ns{times[0] / times[1]:>9.2f}x")
+
+
+def bench_instances(count=10000):
+    """Creates count CPUs and reports the memory per instance.
+
+    Target: under 1 KB for the CPU object itself. With a flat bytearray each
+    instance also owns 64 KB; with a Memory sharing one ROM image it owns only
+    the 2 KB of work RAM.
+    """
+    rom = memoryview(bytes(ROM_SIZE))
+    for label, make_memory in (("flat bytearray", lambda: bytearray(0x10000)), ("shared ROM", lambda: Memory(rom))):
+        tracemalloc.start()
+        start = time.perf_counter()
+        before = tracemalloc.get_traced_memory()[0]
+        cpus = [Ricoh2A03(make_memory(), trace=False) for _ in range(count)]
+        total = tracemalloc.get_traced_memory()[0] - before
+        elapsed = time.perf_counter() - start
+        tracemalloc.stop()
+        print(f"{label}: {count} instances in {elapsed:.2f}s, {total / count / 1024:.1f} KB per instance")
+        del cpus
+
+
+def bench_fusion(instructions=200000):
+    """Interpreter with and without superinstructions on a nested DEX/BNE, DEY/BNE delay loop."""
+    program = bytes((
+        0xA0, 0x00,         # $8000 LDY #$00
+        0xA2, 0x00,         # $8002 LDX #$00
+        0xCA, 0xD0, 0xFD,   # $8004 DEX / BNE $8004
+        0x88, 0xD0, 0xF8,   # $8007 DEY / BNE $8002
+        0x4C, 0x00, 0x80,   # $800A JMP $8000
+    ))
+    for fuse in (False, True):
+        memory = bytearray(0x10000)
+        memory[0x8000:0x8000 + len(program)] = program
+        cpu = Ricoh2A03(memory, trace=False)
+        cpu.PC = 0x8000
+        cpu.fuse = fuse
+        step = cpu.step
+        start = time.perf_counter()
+        while cpu.cycles < instructions * 2.5:
+            step()
+        elapsed = time.perf_counter() - start
+        print(f"fuse={fuse!s:<6}{cpu.cycles / elapsed / 1e6:>8.2f} MHz  fusion rate {cpu.fusion_rate():.0%}")
+
+
+class _GenericZeroPage(Ricoh2A03):
+    """Ricoh2A03 whose zero page and stack accessors go through _read_byte()/_write_byte() again.
+
+    Handlers still read zero page operands from _ram directly, so this
+    understates what the direct paths save overall.
+    """
+
+    __slots__ = ()
+
+    def _write_zero_page(self, addr, data):
+        self._write_byte(addr, data)
+
+    def _push(self, value):
+        self._write_byte(0x0100 + self.SP, value)
+        self.SP = (self.SP - 1) & 0xFF
+
+    def _pop(self):
+        self.SP = (self.SP + 1) & 0xFF
+        return self._read_byte(0x0100 + self.SP)
+
+    def _read_word_zero_page(self, addr):
+        return self._read_byte(addr) | (self._read_byte((addr + 1) & 0xFF) << 8)
+
+
+def bench_zero_page(instructions=200000, repeat=3):
+    """Zero page and stack accessors through the generic paths and directly, on a loop dominated by them."""
+    program = bytes((
+        0xA2, 0x40,         # $8000 LDX #$40
+        0xA5, 0x10,         # $8002 LDA $10
+        0x85, 0x11,         # $8004 STA $11
+        0xE6, 0x12,         # $8006 INC $12
+        0xB1, 0x20,         # $8008 LDA ($20),Y
+        0x91, 0x22,         # $800A STA ($22),Y
+        0x48,               # $800C PHA
+        0x20, 0x20, 0x80,   # $800D JSR $8020
+        0x68,               # $8010 PLA
+        0xC8,               # $8011 INY
+        0xCA,               # $8012 DEX
+        0xD0, 0xED,         # $8013 BNE $8002
+        0x4C, 0x00, 0x80,   # $8015 JMP $8000
+    ))
+    subroutine = bytes((
+        0xB5, 0x30,         # $8020 LDA $30,X
+        0x95, 0x31,         # $8022 STA $31,X
+        0x60,               # $8024 RTS
+    ))
+    rom = bytearray(ROM_SIZE)
+    rom[:len(program)] = program
+    rom[0x20:0x20 + len(subroutine)] = subroutine
+    rom = memoryview(bytes(rom))
+    rng = random.Random(6502)
+    zero_page = bytes(rng.randrange(256) for _ in range(0x100))
+    speeds = []
+    for label, cls in (("generic", _GenericZeroPage), ("direct", Ricoh2A03)):
+        best = 0
+        for _ in range(repeat):
+            cpu = cls(Memory(rom), trace=False)
+            cpu.load(0, zero_page)
+            cpu.load(0x20, bytes((0x00, 0x03, 0x00, 0x04)))    # ($20) -> $0300, ($22) -> $0400
+            cpu.PC = 0x8000
+            step = cpu.step
+            start = time.perf_counter()
+            while cpu.cycles < instructions * 3.5:
+                step()
+            best = max(best, cpu.cycles / (time.perf_counter() - start) / 1e6)
+        speeds.append(best)
+        print(f"{label:<10}{best:>8.2f} MHz")
+    print(f"speedup   {speeds[1] / speeds[0]:>8.2f}x")
+
+
+def bench_predecode(instructions=200000):
+    """Interpreter with and without the predecode cache on a loop of loads, arithmetic and stores."""
+    program = bytes((
+        0xA2, 0x10,         # $8000 LDX #$10
+        0xA5, 0x10,         # $8002 LDA $10
+        0x18,               # $8004 CLC
+        0x75, 0x20,         # $8005 ADC $20,X
+        0x9D, 0x00, 0x03,   # $8007 STA $0300,X
+        0xBD, 0x00, 0x04,   # $800A LDA $0400,X
+        0xC9, 0x40,         # $800D CMP #$40
+        0xCA,               # $800F DEX
+        0xD0, 0xF0,         # $8010 BNE $8002
+        0x4C, 0x00, 0x80,   # $8012 JMP $8000
+    ))
+    rom = bytearray(ROM_SIZE)
+    rom[:len(program)] = program
+    rom = memoryview(bytes(rom))
+    for predecode in (False, True):
+        cpu = Ricoh2A03(Memory(rom), trace=False)
+        cpu.PC = 0x8000
+        cpu.predecode = predecode
+        step = cpu.step
+        start = time.perf_counter()
+        while cpu.cycles < instructions * 3:
+            step()
+        elapsed = time.perf_counter() - start
+        print(f"predecode={predecode!s:<6}{cpu.cycles / elapsed / 1e6:>8.2f} MHz")
+
+
+def bench_ramsearch(frames=3600):
+    """Each RAM search filter over an hour's worth of snapshots of a synthetic game."""
+    rng = np.random.default_rng(6502)
+    snapshots = rng.integers(0, 256, (frames, RAM_SIZE), dtype=np.uint8)
+    snapshots[:, :1024] = snapshots[0, :1024]               # Mostly static RAM
+    held = rng.integers(0, 2, frames)
+    snapshots[:, 0x86] = held * 3                           # Speed, while Right is held
+    snapshots[:, 0x7E0] = np.arange(frames) // 60           # Score
+    # Filters that read every snapshot run once per timing; those reading one row are repeated.
+    for name, number, apply in (
+        ("changed", 1, lambda search: search.changed()),
+        ("unchanged", 1, lambda search: search.unchanged()),
+        ("increased", 1, lambda search: search.increased()),
+        ("correlates", 1, lambda search: search.correlates(held)),
+        ("equals", 1000, lambda search: search.equals(59)),
+        ("between", 1000, lambda search: search.between(50, 60)),
+    ):
+        search = RamSearch(snapshots)
+        elapsed = _best(lambda: apply(search), number)
+        search.reset()
+        apply(search)
+        print(f"{name:<12}{elapsed / 1e3:>10.1f} us  {len(search.addresses())} candidates")
+
+
+BENCHMARKS = {
+    "alu": bench_alu,
+    "instances": bench_instances,
+    "fusion": bench_fusion,
+    "zero_page": bench_zero_page,
+    "predecode": bench_predecode,
+    "ramsearch": bench_ramsearch,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit(f"Unknown benchmark {name}; choose from {', '.join(BENCHMARKS)}")
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
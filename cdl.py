@@ -0,0 +1,124 @@
+from ricoh2a03 import DECODE, LENGTHS, Ricoh2A03
+
+# Flag bits in CodeDataLogger.cdl, one byte per CPU address.
+CODE = 0x01        # Fetched as an opcode
+OPERAND = 0x02     # Fetched as an instruction's operand
+DATA = 0x04        # Read as data (including vectors and DMA sources)
+
+
+class CodeDataLogger(Ricoh2A03):
+    """Ricoh2A03 that records how each address was read: as an opcode, an operand or data.
+
+    Build a machine with it through power_on(cartridge, cpu_class=CodeDataLogger)
+    and run it as usual; cdl then holds the CODE/OPERAND/DATA bits of every
+    address, and report() summarizes ROM and opcode coverage. The plain
+    Ricoh2A03 carries none of this, so logging costs nothing unless this class
+    is used.
+
+    Only reads through _read_byte() are seen. That is every fetch and every
+    data read except zero page and stack accesses, which index RAM directly.
+    Superinstructions and the predecode cache skip those fetches, so leave
+    fuse and predecode off, as they are by default; setting either leaves
+    gaps in the log.
+    Clones share the log, so the coverage of a whole search tree collects in
+    one place.
+    """
+
+    __slots__ = ("cdl", "opcodes_seen", "_fetch_pc", "_operand_start", "_operand_end")
+
+    def __init__(self, memory, trace=True):
+        super().__init__(memory, trace)
+        self.cdl = bytearray(0x10000)
+        self.opcodes_seen = bytearray(256)   # 1 for each opcode executed at least once
+        self._fetch_pc = -1                  # Address of the opcode the next step fetches
+        self._operand_start = 0              # Operand bytes of the instruction being run
+        self._operand_end = 0
+
+    def step(self):
+        self._fetch_pc = self.PC & 0xFFFF
+        Ricoh2A03.step(self)
+
+    def _read_byte(self, addr):
+        addr &= 0xFFFF
+        value = Ricoh2A03._read_byte(self, addr)
+        if addr == self._fetch_pc:
+            self.cdl[addr] |= CODE
+            self.opcodes_seen[value] = 1
+            self._fetch_pc = -1
+            self._operand_start = addr + 1
+            self._operand_end = addr + LENGTHS[DECODE[value][1]]
+        elif self._operand_start <= addr < self._operand_end:
+            self.cdl[addr] |= OPERAND
+        else:
+            self.cdl[addr] |= DATA
+        return value
+
+    def _oam_dma(self, page):
+        base = page << 8
+        cdl = self.cdl
+        for addr in range(base, base + 0x100):
+            cdl[addr] |= DATA
+        Ricoh2A03._oam_dma(self, page)
+
+    def clear(self):
+        """Forgets everything logged so far."""
+        self.cdl[:] = bytes(0x10000)
+        self.opcodes_seen[:] = bytes(256)
+
+    def rom_flags(self, prg_size=0x8000):
+        """Returns the flags folded onto a PRG ROM of prg_size bytes, undoing the $8000-$FFFF mirroring."""
+        flags = bytearray(prg_size)
+        for offset in range(0x8000):
+            flags[offset % prg_size] |= self.cdl[0x8000 + offset]
+        return flags
+
+    def coverage(self):
+        """Returns {mnemonic: (addressing modes executed, addressing modes implemented)}."""
+        result = {}
+        for opcode, (mnemonic, mode, _) in enumerate(DECODE):
+            if mnemonic is None:
+                continue
+            seen, implemented = result.setdefault(mnemonic, (set(), set()))
+            implemented.add(mode)
+            if self.opcodes_seen[opcode]:
+                seen.add(mode)
+        return result
+
+    def report(self, prg_size=0x8000):
+        """Returns a text summary of ROM bytes touched and opcode/addressing mode coverage."""
+        flags = self.rom_flags(prg_size)
+        code = sum(1 for flag in flags if flag & CODE)
+        operand = sum(1 for flag in flags if flag & OPERAND and not flag & CODE)
+        data = sum(1 for flag in flags if flag & DATA and not flag & (CODE | OPERAND))
+        unused = flags.count(0)
+        lines = [
+            f"PRG ROM ({prg_size} bytes): {code} code, {operand} operand, {data} data, {unused} never read"
+            f" ({(prg_size - unused) / prg_size:.1%} touched)",
+            f"Opcodes executed: {sum(self.opcodes_seen)} of "
+            f"{sum(1 for mnemonic, _, _ in DECODE if mnemonic is not None)}",
+        ]
+        for mnemonic, (seen, implemented) in sorted(self.coverage().items()):
+            missing = implemented - seen
+            status = "all modes" if not missing else "missing " + ", ".join(sorted(missing))
+            if not seen:
+                status = "never executed"
+            lines.append(f"  {mnemonic}  {len(seen)}/{len(implemented)}  {status}")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from nes import Cartridge, power_on
+
+    parser = argparse.ArgumentParser(description="Run a ROM with the code/data logger and report coverage.")
+    parser.add_argument("rom")
+    parser.add_argument("--frames", type=int, default=600, help="Frames to run")
+    args = parser.parse_args()
+
+    cartridge = Cartridge.from_file(args.rom)
+    cpu = power_on(cartridge, sample_rate=None, cpu_class=CodeDataLogger)
+    cpu.ppu.render = False
+    for _ in range(args.frames):
+        cpu.run_frame()
+    print(cpu.report(len(cartridge.prg_rom)))
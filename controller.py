@@ -0,0 +1,74 @@
+import copy
+
+# Button bits, in the order the shift register reports them.
+A = 0x01
+B = 0x02
+SELECT = 0x04
+START = 0x08
+UP = 0x10
+DOWN = 0x20
+LEFT = 0x40
+RIGHT = 0x80
+
+
+class Controller:
+    """Standard NES joypad on $4016 or $4017.
+
+    Buttons come either from `buttons`, which callers can set at any time, or
+    from a per-frame input sequence given to play(). A sequence is indexed by
+    the PPU frame number when the game strobes the controller, so a whole run's
+    input can be handed over once instead of being fed from Python every frame.
+    """
+
+    def __init__(self):
+        self.buttons = 0x00     # Current button state, one bit per button
+        self.strobe = 0
+        self.shift = 0x00
+        self.inputs = None
+        self.start_frame = 0
+
+    def clone(self):
+        """Returns a controller in the same state, sharing the input sequence."""
+        return copy.copy(self)
+
+    def save_state(self):
+        """Returns the buttons and shift register; the input sequence is not included."""
+        return {"buttons": self.buttons, "strobe": self.strobe, "shift": self.shift}
+
+    def load_state(self, state):
+        self.buttons = state["buttons"]
+        self.strobe = state["strobe"]
+        self.shift = state["shift"]
+
+    def play(self, inputs, start_frame=0):
+        """Plays one byte of buttons per frame from a bytes-like object or uint8 NumPy array.
+
+        The byte at index i is used for frame start_frame + i. Outside the
+        sequence `buttons` is left unchanged.
+        """
+        self.inputs = memoryview(inputs).cast('B')
+        self.start_frame = start_frame
+
+    def stop(self):
+        """Stops playing the input sequence."""
+        self.inputs = None
+
+    def write_strobe(self, value, frame):
+        """Handles a write to $4016; while strobe is high the buttons are continuously latched."""
+        self.strobe = value & 1
+        if self.strobe:
+            inputs = self.inputs
+            if inputs is not None:
+                index = frame - self.start_frame
+                if 0 <= index < len(inputs):
+                    self.buttons = inputs[index]
+            self.shift = self.buttons
+
+    def read(self):
+        """Reads the next button, A first. Bits 5-7 are open bus ($40 on most consoles)."""
+        if self.strobe:
+            return 0x40 | (self.buttons & 1)
+        value = self.shift & 1
+        # Official controllers report 1 once all eight buttons have been read.
+        self.shift = (self.shift >> 1) | 0x80
+        return 0x40 | value
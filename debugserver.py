@@ -0,0 +1,360 @@
+import argparse
+import asyncio
+import inspect
+import json
+
+from nes import Cartridge
+# Import the Ricoh2A03 emulator class
+from ricoh2a03 import Ricoh2A03
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+class RPCError(Exception):
+    """An error that is reported back to the client as a JSON-RPC error object."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class DebugServer:
+    """Serves a Ricoh2A03 instance to external tools as line-delimited JSON-RPC.
+
+    Each request is a single JSON object terminated by a newline, e.g.
+
+        {"jsonrpc": "2.0", "id": 1, "method": "step", "params": {"count": 10}}
+
+    and each response is written back on its own line. Execution started with
+    `continue` runs in a background task that yields to the event loop every
+    `yield_every` instructions, so other clients (or the same client) can keep
+    reading registers and memory, or `pause` the CPU, while it runs.
+    """
+
+    def __init__(self, cpu, yield_every=1000):
+        self.cpu = cpu
+        self.yield_every = yield_every
+        self.breakpoints = set()
+        self.instructions = 0       # Total instructions executed through the server
+        self.stop_reason = "paused"
+        self._run_task = None
+        self._methods = {
+            "registers": self.registers,
+            "set_registers": self.set_registers,
+            "read_memory": self.read_memory,
+            "write_memory": self.write_memory,
+            "step": self.step,
+            "continue": self.continue_,
+            "pause": self.pause,
+            "status": self.status,
+            "reset": self.reset,
+            "add_breakpoint": self.add_breakpoint,
+            "remove_breakpoint": self.remove_breakpoint,
+            "list_breakpoints": self.list_breakpoints,
+        }
+
+    # Methods exposed over RPC
+
+    def registers(self):
+        """Returns the CPU registers as integers."""
+        cpu = self.cpu
+        return {
+            "A": cpu.A,
+            "X": cpu.X,
+            "Y": cpu.Y,
+            "SP": cpu.SP,
+            "PC": cpu.PC,
+            "P": cpu._get_status(),
+        }
+
+    def set_registers(self, **registers):
+        """Sets any of A, X, Y, SP, PC and P."""
+        self._require_halted()
+        cpu = self.cpu
+        for name, value in registers.items():
+            if name == "P":
+                cpu._set_status(_int(value, 0xFF))
+            elif name == "PC":
+                cpu.PC = _int(value, 0xFFFF)
+            elif name in ("A", "X", "Y", "SP"):
+                setattr(cpu, name, _int(value, 0xFF))
+            else:
+                raise RPCError(INVALID_PARAMS, f"Unknown register {name}")
+        return self.registers()
+
+    def read_memory(self, ranges):
+        """Reads a batch of [address, length] ranges, returning one hex string per range.
+
+        Memory is read directly rather than through _read_byte so that peeking at
+        I/O registers has no side effects.
+        """
+        memory = self.cpu.memory
+        result = []
+        for entry in ranges:
+            if len(entry) != 2:
+                raise RPCError(INVALID_PARAMS, "Ranges must be [address, length] pairs")
+            addr = _int(entry[0], 0xFFFF)
+            length = _int(entry[1], 0x10000)
+            result.append(bytes(memory[(addr + i) & 0xFFFF] for i in range(length)).hex())
+        return result
+
+    def write_memory(self, address, data):
+        """Writes a hex string of bytes starting at address."""
+        addr = _int(address, 0xFFFF)
+        try:
+            values = bytes.fromhex(data)
+        except (TypeError, ValueError):
+            raise RPCError(INVALID_PARAMS, "Data must be a hex string")
+        memory = self.cpu.memory
+        for i, value in enumerate(values):
+            memory[(addr + i) & 0xFFFF] = value
+        self.cpu.invalidate_state_hash()
+        self.cpu.invalidate_decoded()
+        return len(values)
+
+    async def step(self, count=1):
+        """Executes count instructions, ignoring breakpoints, and returns the registers.
+
+        Up to yield_every instructions run at once. Longer steps run in the
+        background like `continue`, so the server stays responsive and `pause`
+        can stop them.
+        """
+        self._require_halted()
+        count = _int(count, 0xFFFFFFFF)
+        if count > self.yield_every:
+            await self._start(count, ())
+            if self.stop_reason == "count":
+                self.stop_reason = "step"
+            return self.registers()
+        cpu = self.cpu
+        for _ in range(count):
+            cpu.step()
+            self.instructions += 1
+        self.stop_reason = "step"
+        return self.registers()
+
+    async def continue_(self, count=None):
+        """Runs until a breakpoint, a pause request or count instructions have executed."""
+        self._require_halted()
+        limit = None if count is None else _int(count, 0xFFFFFFFF)
+        await self._start(limit, self.breakpoints)
+        return self.status()
+
+    def pause(self):
+        """Stops a running `continue` or long `step` at the next instruction boundary."""
+        if self._run_task is not None:
+            self._run_task.cancel()
+        return self.status()
+
+    def status(self):
+        """Reports whether the CPU is running and why it last stopped."""
+        return {
+            "running": self._run_task is not None and not self._run_task.done(),
+            "reason": self.stop_reason,
+            "instructions": self.instructions,
+            "registers": self.registers(),
+        }
+
+    def reset(self):
+        """Resets the CPU through its reset vector."""
+        self._require_halted()
+        self.cpu.reset()
+        self.stop_reason = "reset"
+        return self.registers()
+
+    def add_breakpoint(self, address):
+        self.breakpoints.add(_int(address, 0xFFFF))
+        return sorted(self.breakpoints)
+
+    def remove_breakpoint(self, address):
+        self.breakpoints.discard(_int(address, 0xFFFF))
+        return sorted(self.breakpoints)
+
+    def list_breakpoints(self):
+        return sorted(self.breakpoints)
+
+    # Execution
+
+    async def _start(self, limit, breakpoints):
+        """Runs _run as the background task and waits for it to stop."""
+        self._run_task = asyncio.ensure_future(self._run(limit, breakpoints))
+        try:
+            await asyncio.shield(self._run_task)
+        finally:
+            if self._run_task is not None and self._run_task.done():
+                self._run_task = None
+
+    async def _run(self, limit, breakpoints):
+        """Executes instructions in batches, yielding to the event loop between batches."""
+        cpu = self.cpu
+        executed = 0
+        self.stop_reason = "running"
+        try:
+            while limit is None or executed < limit:
+                batch = self.yield_every
+                if limit is not None:
+                    batch = min(batch, limit - executed)
+                for _ in range(batch):
+                    # Always execute the first instruction so that continuing from a
+                    # breakpoint makes progress.
+                    if executed and cpu.PC in breakpoints:
+                        self.stop_reason = "breakpoint"
+                        return
+                    cpu.step()
+                    executed += 1
+                    self.instructions += 1
+                await asyncio.sleep(0)
+            self.stop_reason = "count"
+        except asyncio.CancelledError:
+            self.stop_reason = "paused"
+        except Exception:
+            self.stop_reason = "error"
+            raise
+
+    def _require_halted(self):
+        if self._run_task is not None and not self._run_task.done():
+            raise RPCError(INVALID_REQUEST, "CPU is running; pause it first")
+
+    # Transport
+
+    async def handle_client(self, reader, writer):
+        """Serves one connection until the client disconnects.
+
+        Once the client stops sending, requests still being handled get their
+        replies before the connection is closed; if the connection fails, they
+        are cancelled. A cancelled `continue` leaves the CPU running.
+        """
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                # Requests are handled concurrently so that `pause` can reach a
+                # `continue` that is still running on the same connection.
+                task = asyncio.ensure_future(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            # The client has sent everything; answer what is still in flight before closing.
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _respond(self, line, writer):
+        response = await self.dispatch(line)
+        if response is not None and not writer.is_closing():
+            writer.write(json.dumps(response).encode() + b"\n")
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, line):
+        """Executes one JSON-RPC request and returns the response object."""
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return _error(None, PARSE_ERROR, "Parse error")
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return _error(None, INVALID_REQUEST, "Invalid request")
+
+        request_id = request.get("id")
+        method = self._methods.get(request["method"])
+        if method is None:
+            return _error(request_id, METHOD_NOT_FOUND, f"Unknown method {request['method']}")
+
+        params = request.get("params", {})
+        try:
+            if isinstance(params, list):
+                bound = inspect.signature(method).bind(*params)
+            elif isinstance(params, dict):
+                bound = inspect.signature(method).bind(**params)
+            else:
+                raise RPCError(INVALID_PARAMS, "Params must be an array or object")
+        except TypeError as e:
+            return _error(request_id, INVALID_PARAMS, str(e))
+        except RPCError as e:
+            return _error(request_id, e.code, e.message)
+
+        try:
+            result = method(*bound.args, **bound.kwargs)
+            if asyncio.iscoroutine(result):
+                result = await result
+        except RPCError as e:
+            return _error(request_id, e.code, e.message)
+        except Exception as e:
+            # Anything else is a bug in a handler or the emulator; report it rather than drop the request.
+            return _error(request_id, INTERNAL_ERROR, f"{type(e).__name__}: {e}")
+
+        # Requests without an id are notifications and get no response.
+        if "id" not in request:
+            return None
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    async def serve_tcp(self, host="127.0.0.1", port=6502):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def serve_unix(self, path):
+        server = await asyncio.start_unix_server(self.handle_client, path)
+        async with server:
+            await server.serve_forever()
+
+
+def _int(value, limit):
+    """Accepts ints or hex strings ("$C000", "0xC000") and range checks them."""
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            if text.startswith("$"):
+                value = int(text[1:], 16)
+            else:
+                value = int(text, 0)
+        except ValueError:
+            raise RPCError(INVALID_PARAMS, f"Invalid number {value!r}")
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= limit:
+        raise RPCError(INVALID_PARAMS, f"Value {value!r} out of range")
+    return value
+
+
+def _error(request_id, code, message):
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+def load_rom(filename):
+    """Loads an NROM image's PRG ROM into $8000-$FFFF of a flat 64KB memory."""
+    memory = bytearray(0x10000)
+    Cartridge.from_file(filename).load_prg(memory)
+    return memory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a Ricoh2A03 over JSON-RPC.")
+    parser.add_argument("rom", help="Path to the ROM to load")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6502)
+    parser.add_argument("--unix", help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--yield-every", type=int, default=1000,
+                        help="Instructions to execute between event loop yields")
+    args = parser.parse_args()
+
+    cpu = Ricoh2A03(load_rom(args.rom), trace=False)
+    cpu.reset()
+
+    server = DebugServer(cpu, yield_every=args.yield_every)
+    if args.unix:
+        asyncio.run(server.serve_unix(args.unix))
+    else:
+        asyncio.run(server.serve_tcp(args.host, args.port))
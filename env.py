@@ -0,0 +1,78 @@
+from nes import Cartridge, power_on
+
+OBSERVATIONS = ("ram", "frame", "rgb")
+
+
+class NESEnv:
+    """Headless Gym-style environment around a Ricoh2A03 machine.
+
+    Actions are controller 1 button bytes (see controller.py), held for
+    `frame_skip` frames per step. Observations are:
+
+        "ram"   - a memoryview of work RAM at $0000-$07FF
+        "frame" - the PPU framebuffer, a (240, 256) array of palette indices
+        "rgb"   - the framebuffer converted to a (240, 256, 3) RGB array
+
+    The "ram" and "frame" observations are zero-copy views of the live machine
+    and change on the next step; copy them to keep them. In "ram" mode the PPU
+    never draws, and in the frame modes only the last frame of each step is
+    drawn, so skipped frames cost CPU emulation only.
+
+    reward_fn and done_fn, when given, are called with the environment after
+    each step and return the reward and whether the episode is over.
+    skip_idle fast-forwards loops that wait for vblank (see Ricoh2A03.run_frame).
+    """
+
+    def __init__(self, rom, frame_skip=4, observation="ram", reward_fn=None, done_fn=None, max_steps=None,
+                 skip_idle=True):
+        if observation not in OBSERVATIONS:
+            raise ValueError(f"Observation must be one of {', '.join(OBSERVATIONS)}")
+        if frame_skip < 1:
+            raise ValueError("frame_skip must be at least 1")
+        self.cartridge = rom if isinstance(rom, Cartridge) else Cartridge.from_file(rom)
+        self.frame_skip = frame_skip
+        self.observation = observation
+        self.reward_fn = reward_fn
+        self.done_fn = done_fn
+        self.max_steps = max_steps
+        self.skip_idle = skip_idle
+        self.cpu = None
+        self.ram = None
+        self.steps = 0
+
+    def reset(self):
+        """Powers the machine on from scratch and returns the first observation."""
+        self.cpu = power_on(self.cartridge, sample_rate=None)
+        self.cpu.ppu.render = False
+        self.cpu.skip_idle = self.skip_idle
+        self.ram = memoryview(self.cpu.memory.ram)
+        self.steps = 0
+        return self._observe()
+
+    def step(self, action):
+        """Holds the buttons in action for frame_skip frames; returns (observation, reward, done, info)."""
+        cpu = self.cpu
+        ppu = cpu.ppu
+        cpu.controllers[0].buttons = action & 0xFF
+
+        drawn = self.observation != "ram"
+        for _ in range(self.frame_skip - 1):
+            cpu.run_frame()
+        ppu.render = drawn
+        cpu.run_frame()
+        ppu.render = False
+        self.steps += 1
+
+        reward = self.reward_fn(self) if self.reward_fn is not None else 0.0
+        done = self.done_fn(self) if self.done_fn is not None else False
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            done = True
+        info = {"frame": ppu.frame, "cycles": cpu.cycles}
+        return self._observe(), reward, done, info
+
+    def _observe(self):
+        if self.observation == "ram":
+            return self.ram
+        if self.observation == "frame":
+            return self.cpu.ppu.framebuffer
+        return self.cpu.ppu.rgb()
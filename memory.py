@@ -0,0 +1,150 @@
+import mmap
+import os
+
+RAM_SIZE = 0x800        # 2KB of work RAM, mirrored through $0000-$1FFF
+SRAM_SIZE = 0x2000      # 8KB of cartridge RAM at $6000-$7FFF
+ROM_SIZE = 0x8000       # PRG ROM window at $8000-$FFFF
+PAGE_SIZE = 0x100
+
+
+class Memory:
+    """CPU address space built from a private work RAM and a shared, read-only PRG ROM.
+
+    Many machines running the same game can map one ROM buffer: pass the same
+    bytes object (see Cartridge.rom()) to each Memory and only the 2KB of work
+    RAM is per instance. Writes to ROM are ignored, as on a cartridge without a
+    mapper. Cartridge RAM (sram, often battery backed) appears at $6000-$7FFF
+    when given; $4020-$5FFF, and $6000-$7FFF without it, are unmapped: they
+    read as zero and ignore writes.
+
+    Indexing with an address or a slice reads and writes through the same map
+    as the CPU (without the I/O registers), which is what tools like the debug
+    server need. The CPU itself reads `ram` and `rom` directly.
+    """
+
+    __slots__ = ("ram", "rom", "sram")
+
+    def __init__(self, rom, ram=None, sram=None):
+        if len(rom) != ROM_SIZE:
+            raise ValueError(f"ROM image must be {ROM_SIZE} bytes")
+        if sram is not None and len(sram) != SRAM_SIZE:
+            raise ValueError(f"Cartridge RAM must be {SRAM_SIZE} bytes")
+        self.ram = bytearray(RAM_SIZE) if ram is None else ram
+        self.rom = rom if isinstance(rom, memoryview) else memoryview(bytes(rom))
+        self.sram = sram  # A bytearray, an mmap from open_sram(), or None
+
+    def clone(self):
+        """Returns a Memory with a copy of the work RAM that maps the same ROM.
+
+        Cartridge RAM is copied too; the clone's copy is not backed by the save file.
+        """
+        return Memory(self.rom, bytearray(self.ram), None if self.sram is None else bytearray(self.sram))
+
+    def __len__(self):
+        return 0x10000
+
+    def __getitem__(self, addr):
+        if isinstance(addr, slice):
+            start, stop, step = addr.indices(0x10000)
+            if step == 1 and 0x8000 <= start <= stop:
+                return bytes(self.rom[start - 0x8000:stop - 0x8000])
+            return bytes(self[i] for i in range(start, stop, step))
+        addr &= 0xFFFF
+        if addr < 0x2000:
+            return self.ram[addr & 0x7FF]
+        if addr >= 0x8000:
+            return self.rom[addr - 0x8000]
+        if addr >= 0x6000 and self.sram is not None:
+            return self.sram[addr - 0x6000]
+        return 0x00
+
+    def __setitem__(self, addr, value):
+        if isinstance(addr, slice):
+            start, stop, step = addr.indices(0x10000)
+            if step != 1:
+                for i, byte in zip(range(start, stop, step), value):
+                    self[i] = byte
+                return
+            # Copy into RAM one mirror at a time, then into cartridge RAM; ROM
+            # and unmapped space ignore writes.
+            data = memoryview(bytes(value))[:max(stop - start, 0)]
+            stop = start + len(data)
+            addr = start
+            end = min(stop, 0x2000)
+            while addr < end:
+                offset = addr & (RAM_SIZE - 1)
+                count = min(RAM_SIZE - offset, end - addr)
+                self.ram[offset:offset + count] = data[addr - start:addr - start + count]
+                addr += count
+            low, high = max(start, 0x6000), min(stop, 0x8000)
+            if low < high and self.sram is not None:
+                self.sram[low - 0x6000:high - 0x6000] = data[low - start:high - start]
+            return
+        addr &= 0xFFFF
+        if addr < 0x2000:
+            self.ram[addr & 0x7FF] = value
+        elif 0x6000 <= addr < 0x8000 and self.sram is not None:
+            self.sram[addr - 0x6000] = value
+
+
+def open_sram(path):
+    """Maps a battery save file as cartridge RAM, creating it zero filled if needed.
+
+    Writes go straight to the mapped file, so save data persists without any
+    explicit save, and opening costs the same whatever the file holds.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        if os.fstat(fd).st_size < SRAM_SIZE:
+            os.ftruncate(fd, SRAM_SIZE)
+        return mmap.mmap(fd, SRAM_SIZE)
+    finally:
+        os.close(fd)
+
+
+def banks(memory):
+    """Returns (ram, ram_mask, rom) views that the CPU reads $0000-$1FFF and $8000-$FFFF through.
+
+    memory is either a Memory or a flat 64KB bytearray, which keeps the
+    original unmirrored, fully writable layout used by test.py.
+    """
+    if isinstance(memory, Memory):
+        return memory.ram, RAM_SIZE - 1, memory.rom
+    return memory, 0x1FFF, memoryview(memory)[0x8000:0x10000]
+
+
+def view(memory, start, stop):
+    """Returns memory[start:stop] as a memoryview, without I/O side effects.
+
+    A range within one bank (one mirror of RAM, the ROM, or anywhere in a flat
+    bytearray) is a live view; a range spanning banks is a read-only copy.
+    """
+    if not isinstance(memory, Memory):
+        return memoryview(memory)[start:stop]
+    if stop <= 0x2000 and start // RAM_SIZE == (stop - 1) // RAM_SIZE:
+        offset = start & (RAM_SIZE - 1)
+        return memoryview(memory.ram)[offset:offset + stop - start]
+    if start >= 0x8000:
+        return memory.rom[start - 0x8000:stop - 0x8000]
+    if start >= 0x6000 and stop <= 0x8000 and memory.sram is not None:
+        return memoryview(memory.sram)[start - 0x6000:stop - 0x6000]
+    return memoryview(memory[start:stop])
+
+
+def page_views(memory):
+    """Returns {page number: 256 byte view} for every writable page of memory.
+
+    Pages are numbered by CPU address ($0300-$03FF is page 3), using the first
+    mirror of RAM. A Memory has its work RAM pages and any cartridge RAM pages
+    ($60-$7F); a flat bytearray has all 256.
+    """
+    if not isinstance(memory, Memory):
+        whole = memoryview(memory)
+        return {page: whole[page * PAGE_SIZE:(page + 1) * PAGE_SIZE] for page in range(0x10000 // PAGE_SIZE)}
+    ram = memoryview(memory.ram)
+    views = {page: ram[page * PAGE_SIZE:(page + 1) * PAGE_SIZE] for page in range(RAM_SIZE // PAGE_SIZE)}
+    if memory.sram is not None:
+        sram = memoryview(memory.sram)
+        for page in range(SRAM_SIZE // PAGE_SIZE):
+            views[0x60 + page] = sram[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+    return views
@@ -0,0 +1,149 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from memory import PAGE_SIZE
+
+DEFAULT_PORT = 9650
+
+# name -> (type, help text) for every metric, in output order.
+_METRICS = {
+    "py6502_cycles_total": ("counter", "CPU cycles emulated."),
+    "py6502_instructions_total": ("counter", "Instructions executed."),
+    "py6502_frames_total": ("counter", "PPU frames completed."),
+    "py6502_idle_cycles_total": ("counter", "Cycles fast-forwarded by idle loop skipping."),
+    "py6502_nmis_total": ("counter", "NMIs serviced."),
+    "py6502_irqs_total": ("counter", "IRQs serviced."),
+    "py6502_cycles_per_second": ("gauge", "Emulated CPU cycles per wall clock second over the last update."),
+    "py6502_instructions_per_second": ("gauge", "Instructions per second over the last update."),
+    "py6502_frames_per_second": ("gauge", "Frames per second over the last update."),
+    "py6502_predecode_entries": ("gauge", "Instructions in the predecode cache."),
+    "py6502_predecode_misses_total": ("counter", "Instructions decoded because they were not cached."),
+    "py6502_predecode_hit_rate": ("gauge", "Fraction of instructions since the last update run from the predecode cache."),
+    "py6502_fusion_rate": ("gauge", "Fraction of instructions run inside superinstructions."),
+    "py6502_recompiled_blocks_total": ("counter", "Recompiled blocks executed."),
+    "py6502_recompiler_fallback_instructions_total": ("counter", "Instructions the recompiler left to the interpreter."),
+    "py6502_snapshot_pages": ("gauge", "Distinct pages in the snapshot page store."),
+    "py6502_snapshot_bytes": ("gauge", "Bytes of page data in the snapshot page store."),
+}
+
+
+class Metrics:
+    """Collects emulator metrics and serves them as Prometheus text over HTTP.
+
+    The run loop calls update() every so often (once a frame, or once every
+    few hundred), which reads counters the machine already keeps:
+
+        metrics = Metrics()
+        metrics.serve()                 # http://127.0.0.1:9650/metrics
+        while True:
+            for _ in range(60):
+                cpu.run_frame()
+            metrics.update(cpu)
+
+    Several machines can report into one collector under different names,
+    which become the "machine" label. Rates are computed between consecutive
+    updates of the same machine.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._machines = {}      # name -> {metric: value}
+        self._previous = {}      # name -> (time, cycles, instructions, frames, decode misses)
+        self._server = None
+
+    def update(self, cpu, machine="0", compiled=None, store=None):
+        """Records the current counters of cpu.
+
+        compiled is a recompiler.CompiledROM and store a snapshot.PageStore,
+        when in use.
+        """
+        now = time.monotonic()
+        frames = cpu.ppu.frame if cpu.ppu is not None else 0
+        instructions = cpu.instructions
+        values = {
+            "py6502_cycles_total": cpu.cycles,
+            "py6502_instructions_total": instructions,
+            "py6502_frames_total": frames,
+            "py6502_idle_cycles_total": cpu.idle_cycles,
+            "py6502_nmis_total": cpu.nmis,
+            "py6502_irqs_total": cpu.irqs,
+            "py6502_predecode_entries": len(cpu._decoded),
+            "py6502_predecode_misses_total": cpu.decode_misses,
+            "py6502_fusion_rate": cpu.fusion_rate(),
+        }
+        if compiled is not None:
+            values["py6502_recompiled_blocks_total"] = compiled.compiled
+            values["py6502_recompiler_fallback_instructions_total"] = compiled.interpreted
+        if store is not None:
+            values["py6502_snapshot_pages"] = len(store)
+            values["py6502_snapshot_bytes"] = len(store) * PAGE_SIZE
+
+        previous = self._previous.get(machine)
+        if previous is not None and now > previous[0]:
+            elapsed = now - previous[0]
+            values["py6502_cycles_per_second"] = (cpu.cycles - previous[1]) / elapsed
+            values["py6502_frames_per_second"] = (frames - previous[3]) / elapsed
+            executed = instructions - previous[2]
+            values["py6502_instructions_per_second"] = executed / elapsed
+            if cpu.predecode and executed > 0:
+                misses = cpu.decode_misses - previous[4]
+                values["py6502_predecode_hit_rate"] = max(0.0, 1 - misses / executed)
+        self._previous[machine] = (now, cpu.cycles, instructions, frames, cpu.decode_misses)
+        with self._lock:
+            self._machines[machine] = values
+
+    def remove(self, machine):
+        """Stops reporting a machine."""
+        with self._lock:
+            self._machines.pop(machine, None)
+        self._previous.pop(machine, None)
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            machines = {name: dict(values) for name, values in self._machines.items()}
+        lines = []
+        for metric, (kind, text) in _METRICS.items():
+            samples = [(name, values[metric]) for name, values in sorted(machines.items()) if metric in values]
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric} {text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, value in samples:
+                lines.append(f'{metric}{{machine="{_escape(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=DEFAULT_PORT, host="127.0.0.1"):
+        """Serves /metrics from a daemon thread and returns the server's (host, port)."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="py6502-metrics", daemon=True).start()
+        return self._server.server_address
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
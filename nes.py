@@ -0,0 +1,86 @@
+from apu import APU
+from controller import Controller
+from memory import SRAM_SIZE, Memory, open_sram
+from ricoh2a03 import Ricoh2A03
+from ricoh2c02 import Ricoh2C02
+
+INES_MAGIC = b"NES\x1a"
+
+
+class Cartridge:
+    """An iNES ROM image split into its PRG and CHR data."""
+
+    def __init__(self, data):
+        data = bytes(data)
+        if data[:4] != INES_MAGIC:
+            raise ValueError("Not an iNES ROM image")
+
+        prg_size = data[4] * 0x4000
+        chr_size = data[5] * 0x2000
+        flags6 = data[6]
+        flags7 = data[7]
+
+        self.mapper = (flags7 & 0xF0) | (flags6 >> 4)
+        self.battery = bool(flags6 & 0x02)
+        if flags6 & 0x08:
+            self.mirroring = "four"
+        elif flags6 & 0x01:
+            self.mirroring = "vertical"
+        else:
+            self.mirroring = "horizontal"
+
+        # Skip the 16 byte header and the optional 512 byte trainer.
+        offset = 16 + (512 if flags6 & 0x04 else 0)
+        self.prg_rom = data[offset:offset + prg_size]
+        self.chr_rom = data[offset + prg_size:offset + prg_size + chr_size]
+        if len(self.prg_rom) != prg_size or len(self.chr_rom) != chr_size:
+            raise ValueError("ROM image is truncated")
+        self._rom = None
+
+    @classmethod
+    def from_file(cls, filename):
+        with open(filename, 'rb') as f:
+            return cls(f.read())
+
+    def load_prg(self, memory):
+        """Copies PRG ROM into $8000-$FFFF of a flat 64KB memory."""
+        memory[0x8000:0x10000] = self.rom()
+
+    def rom(self):
+        """Returns the read-only $8000-$FFFF image, mirroring a 16KB bank into both halves.
+
+        The same memoryview is returned on every call, so every machine built
+        from this cartridge shares one copy of the ROM.
+        """
+        if self._rom is None:
+            if self.mapper != 0:
+                raise NotImplementedError(f"Mapper {self.mapper} is not supported")
+            prg = self.prg_rom
+            if len(prg) == 0x4000:
+                prg = prg + prg
+            self._rom = memoryview(prg[:0x8000])
+        return self._rom
+
+
+def power_on(cartridge, trace=False, sample_rate=44100, save_path=None, cpu_class=Ricoh2A03, prg_ram=False):
+    """Creates a CPU with the cartridge loaded, a PPU, APU and two controllers attached, and resets it.
+
+    Pass sample_rate=None to skip audio synthesis, and cpu_class to use a
+    Ricoh2A03 subclass such as alu.TableALU or cdl.CodeDataLogger.
+
+    Battery backed cartridges get 8KB of RAM at $6000-$7FFF, as do all
+    cartridges with prg_ram set (test ROMs report results there). With
+    save_path it is mapped from that .sav file (see memory.open_sram), so save
+    data persists as the game writes it.
+    """
+    sram = None
+    if save_path is not None:
+        sram = open_sram(save_path)
+    elif cartridge.battery or prg_ram:
+        sram = bytearray(SRAM_SIZE)
+    cpu = cpu_class(Memory(cartridge.rom(), sram=sram), trace=trace)
+    cpu.attach_ppu(Ricoh2C02(cartridge.chr_rom, cartridge.mirroring))
+    cpu.attach_apu(APU(sample_rate, read_memory=cpu._read_byte))
+    cpu.attach_controllers(Controller(), Controller())
+    cpu.reset()
+    return cpu
@@ -0,0 +1,68 @@
+"""Loading nestest.nes in automation mode and reading its log, shared by test.py and romsuite.py."""
+
+def load_test_rom(filename):
+    """Loads the test ROM into memory."""
+    with open(filename, 'rb') as f:
+        rom_data = f.read()
+    return rom_data
+
+def extract_register_value(register, line):
+    # Search line for "register:" and extract its value
+    start = line.find(register + ":") + len(register) + 1
+    end = line.find(" ", start)
+    if end == -1:  # If no space is found, take the rest of the line
+        end = len(line)
+    return line[start:end].strip()
+
+def load_expected_log(log_filename):
+    """Loads expected states from a log file."""
+    expected_states = []
+    with open(log_filename, 'r') as f:
+        for line in f:
+            parts = line.strip().split()
+            if parts:
+                expected_states.append({
+                    "PC": parts[0],
+                    "OP": parts[1],
+                    "A": extract_register_value("A", line),
+                    "X": extract_register_value("X", line),
+                    "Y": extract_register_value("Y", line),
+                    "P": extract_register_value("P", line),
+                    "SP": extract_register_value("SP", line),
+                    "CYC": "IGNORED",
+                })
+            else:
+                print ("Empty line in log file!")
+                return
+    return expected_states
+
+def initialize_memory(rom_data):
+    """Initializes memory and loads the ROM data."""
+    memory = bytearray(0x10000)  # 64KB of memory
+
+    # NES ROMs have a header of 16 bytes; we'll skip it
+    header_size = 16
+    prg_rom_size = len(rom_data) - header_size
+    prg_rom = rom_data[header_size:]
+
+    # Load PRG ROM into $C000-$FFFF
+    memory[0xC000:0xC000+prg_rom_size] = prg_rom
+
+    # Set the reset vector to point to $C004 for automatic mode
+    memory[0xFFFC] = 0x00
+    memory[0xFFFD] = 0xC0
+
+    return memory
+
+def state_of(cpu):
+    """The CPU's registers in the log's format."""
+    return {
+        "PC": f"{cpu.PC:04X}",
+        "OP": f"{cpu.memory[cpu.PC]:02X}",
+        "A": f"{cpu.A:02X}",
+        "X": f"{cpu.X:02X}",
+        "Y": f"{cpu.Y:02X}",
+        "P": f"{cpu._get_status():02X}",
+        "SP": f"{cpu.SP:02X}",
+        "CYC": "IGNORED"  # Placeholder if cycle exact timing isn't being tested
+    }
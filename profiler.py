@@ -0,0 +1,148 @@
+import signal
+from collections import Counter
+
+# JSR opcode; a return address on the stack is only trusted if it follows one.
+_JSR = 0x20
+
+
+class Profiler:
+    """Statistical profiler for guest code: samples the PC and a shallow call stack now and then.
+
+    Each sample records the PC and the subroutines it is nested in. The call
+    stack is rebuilt from the stack page by looking for return addresses that
+    point just past a JSR. Interrupt frames and pushed registers are skipped
+    when they don't look like one. Samples are taken either by a timer signal
+    while your own code runs the machine:
+
+        with Profiler(cpu):
+            for _ in range(600):
+                cpu.run_frame()
+
+    or every `every` instructions by run(). Neither touches the CPU's per
+    instruction path, so the overhead is the cost of the samples themselves.
+    report() lists the hottest functions; collapsed() writes stacks in the
+    format flame graph tools read.
+    """
+
+    def __init__(self, cpu, depth=4, interval=0.005):
+        self.cpu = cpu
+        self.depth = depth            # Most callers recorded per sample
+        self.interval = interval      # Seconds of CPU time between timer samples
+        self.samples = 0
+        self.pcs = Counter()          # PC -> samples
+        self.stacks = Counter()       # (outermost function, ..., innermost function, PC) -> samples
+        self._previous_handler = None
+
+    # Sampling
+
+    def sample(self):
+        """Records the machine's current PC and call stack."""
+        cpu = self.cpu
+        pc = cpu.PC & 0xFFFF
+        self.samples += 1
+        self.pcs[pc] += 1
+        self.stacks[tuple(reversed(self.call_stack())) + (pc,)] += 1
+
+    def call_stack(self):
+        """Returns the entry points of the subroutines being run, innermost first."""
+        memory = self.cpu.memory
+        stack = self.cpu.dump(0x100, 0x100)
+        functions = []
+        position = self.cpu.SP + 1
+        while position < 0xFF and len(functions) < self.depth:
+            # JSR pushes the address of its last byte, high byte first.
+            last = stack[position] | (stack[position + 1] << 8)
+            call = (last - 2) & 0xFFFF
+            if memory[call] == _JSR:
+                functions.append(memory[(call + 1) & 0xFFFF] | (memory[last] << 8))
+                position += 2
+            else:
+                position += 1
+        return functions
+
+    def run(self, instructions, every=1000):
+        """Steps the CPU instructions times, sampling every `every` instructions."""
+        step = self.cpu.step
+        for _ in range(instructions // every):
+            for _ in range(every):
+                step()
+            self.sample()
+        for _ in range(instructions % every):
+            step()
+
+    def start(self):
+        """Starts sampling on a SIGPROF timer. Only works in the main thread, on Unix."""
+        self._previous_handler = signal.signal(signal.SIGPROF, self._on_signal)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGPROF, self._previous_handler)
+            self._previous_handler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _on_signal(self, signum, frame):
+        self.sample()
+
+    # Results
+
+    def functions(self):
+        """Returns (self samples, total samples) per function, keyed by entry point.
+
+        Self samples are those taken directly in the function, and total samples
+        include its callees. Code outside any recorded subroutine is under None.
+        """
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            functions = stack[:-1]
+            own[functions[-1] if functions else None] += count
+            for function in set(functions) or {None}:
+                total[function] += count
+        return {function: (own[function], total[function]) for function in total}
+
+    def report(self, top=20):
+        """Returns a text table of the functions with the most samples of their own."""
+        if not self.samples:
+            return "No samples"
+        lines = [f"{self.samples} samples", f"{'function':<10}{'self':>8}{'total':>8}"]
+        ranked = sorted(self.functions().items(), key=lambda item: -item[1][0])
+        for function, (own, total) in ranked[:top]:
+            name = "(top)" if function is None else f"${function:04X}"
+            lines.append(f"{name:<10}{own / self.samples:>8.1%}{total / self.samples:>8.1%}")
+        return "\n".join(lines)
+
+    def collapsed(self):
+        """Returns the stacks as "$C000;$C123;$C130 42" lines, for flame graph tools."""
+        return "\n".join(
+            ";".join(f"${address:04X}" for address in stack) + f" {count}"
+            for stack, count in sorted(self.stacks.items())
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from nes import Cartridge, power_on
+
+    parser = argparse.ArgumentParser(description="Profile a ROM and print its hottest functions.")
+    parser.add_argument("rom")
+    parser.add_argument("--frames", type=int, default=600, help="Frames to run")
+    parser.add_argument("--collapsed", help="Also write flame graph stacks to this file")
+    args = parser.parse_args()
+
+    cpu = power_on(Cartridge.from_file(args.rom), sample_rate=None)
+    with Profiler(cpu) as profiler:
+        for _ in range(args.frames):
+            cpu.run_frame()
+    print(profiler.report())
+    if args.collapsed:
+        with open(args.collapsed, 'w') as f:
+            f.write(profiler.collapsed() + "\n")
@@ -0,0 +1,129 @@
+import numpy as np
+
+from memory import RAM_SIZE
+
+
+class RamSearch:
+    """Finds the work RAM addresses behind a game variable from snapshots taken over many frames.
+
+    Snapshots are stacked into a (frames, 2048) uint8 array and each filter
+    narrows the set of candidate addresses with one vectorized pass over it:
+
+        search = RamSearch()
+        for _ in range(600):
+            cpu.run_frame()
+            search.record(cpu)
+        search.increased().changed_at_most(20)
+        print(search.addresses())
+
+    Filters return the search, so they chain, and can be applied in any order;
+    reset() brings every address back. Snapshots can also be given whole, e.g.
+    RamSearch(np.stack(observations)) from an NESEnv in "ram" mode.
+    """
+
+    def __init__(self, snapshots=None):
+        self._rows = []
+        self._stacked = np.empty((0, RAM_SIZE), dtype=np.uint8)
+        if snapshots is not None:
+            snapshots = np.asarray(snapshots, dtype=np.uint8)
+            if snapshots.ndim != 2 or snapshots.shape[1] != RAM_SIZE:
+                raise ValueError(f"Snapshots must have shape (frames, {RAM_SIZE})")
+            self._stacked = snapshots
+        self.mask = np.ones(RAM_SIZE, dtype=bool)  # Addresses still in the running
+
+    def __len__(self):
+        """Number of snapshots recorded."""
+        return len(self._stacked) + len(self._rows)
+
+    def record(self, cpu):
+        """Appends a snapshot of the machine's work RAM."""
+        self._rows.append(bytes(cpu.dump(0, RAM_SIZE)))
+
+    @property
+    def snapshots(self):
+        """The (frames, 2048) array of recorded snapshots."""
+        if self._rows:
+            rows = np.frombuffer(b"".join(self._rows), dtype=np.uint8).reshape(-1, RAM_SIZE)
+            self._stacked = np.concatenate((self._stacked, rows))
+            self._rows = []
+        return self._stacked
+
+    def addresses(self):
+        """Candidate addresses, in increasing order."""
+        return np.flatnonzero(self.mask)
+
+    def values(self, frame=-1):
+        """{address: value in frame} for every candidate."""
+        row = self.snapshots[frame]
+        return {int(addr): int(row[addr]) for addr in self.addresses()}
+
+    def reset(self):
+        """Makes every address a candidate again."""
+        self.mask[:] = True
+        return self
+
+    def keep(self, selected):
+        """Narrows the candidates to those where the boolean array selected is set."""
+        self.mask &= selected
+        return self
+
+    # Filters
+
+    def changed(self):
+        """Keeps addresses whose value changed at least once."""
+        return self.keep((self._deltas() != 0).any(axis=0))
+
+    def unchanged(self):
+        """Keeps addresses that held the same value in every snapshot."""
+        return self.keep((self._deltas() == 0).all(axis=0))
+
+    def changed_at_most(self, count):
+        """Keeps addresses that changed value in at most count frames, e.g. to drop timers."""
+        return self.keep((self._deltas() != 0).sum(axis=0) <= count)
+
+    def increased(self):
+        """Keeps addresses that never decreased and ended higher than they started."""
+        deltas = self._deltas()
+        return self.keep((deltas >= 0).all(axis=0) & (deltas.sum(axis=0) > 0))
+
+    def decreased(self):
+        """Keeps addresses that never increased and ended lower than they started."""
+        deltas = self._deltas()
+        return self.keep((deltas <= 0).all(axis=0) & (deltas.sum(axis=0) < 0))
+
+    def equals(self, value, frame=-1):
+        """Keeps addresses holding value in the given snapshot (the last by default)."""
+        return self.keep(self.snapshots[frame] == value)
+
+    def between(self, low, high, frame=-1):
+        """Keeps addresses whose value in the given snapshot is within low..high."""
+        row = self.snapshots[frame]
+        return self.keep((row >= low) & (row <= high))
+
+    def correlates(self, series, threshold=0.8):
+        """Keeps addresses whose values track series, one number per snapshot.
+
+        series is typically derived from the input, e.g. 1 on frames where
+        Right was held and 0 otherwise, or a running count of presses.
+        Addresses are kept when the magnitude of their Pearson correlation
+        with it is at least threshold; constant addresses never are.
+        """
+        snapshots = self.snapshots
+        series = np.asarray(series, dtype=np.float64)
+        if series.shape != (len(snapshots),):
+            raise ValueError(f"Series must have one value per snapshot ({len(snapshots)})")
+        values = snapshots.astype(np.float64)
+        values -= values.mean(axis=0)
+        series = series - series.mean()
+        spread = np.sqrt((values * values).sum(axis=0) * (series @ series))
+        covariance = series @ values
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlation = np.where(spread > 0, covariance / spread, 0.0)
+        return self.keep(np.abs(correlation) >= threshold)
+
+    def _deltas(self):
+        """(frames - 1, 2048) differences between consecutive snapshots."""
+        snapshots = self.snapshots
+        if len(snapshots) < 2:
+            raise ValueError("Need at least two snapshots")
+        return np.diff(snapshots.astype(np.int16), axis=0)
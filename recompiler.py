@@ -0,0 +1,424 @@
+import hashlib
+import importlib.util
+import os
+
+from ricoh2a03 import _CYCLES, _PAGE_PENALTY, DECODE, LENGTHS, Ricoh2A03
+
+# Bump when the generated code changes so that stale cache entries are ignored.
+VERSION = 3
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "py6502")
+
+BRANCHES = {
+    "BPL": "not cpu.N", "BMI": "cpu.N", "BVC": "not cpu.V", "BVS": "cpu.V",
+    "BCC": "not cpu.C", "BCS": "cpu.C", "BNE": "not cpu.Z", "BEQ": "cpu.Z",
+}
+LOADS = {"LDA": ("A",), "LDX": ("X",), "LDY": ("Y",), "LAX": ("A", "X")}
+STORES = {"STA": "cpu.A", "STX": "cpu.X", "STY": "cpu.Y", "SAX": "cpu.A & cpu.X"}
+LOGIC = {"AND": "&", "ORA": "|", "EOR": "^"}
+COMPARES = {"CMP": "cpu.A", "CPX": "cpu.X", "CPY": "cpu.Y"}
+ARITHMETIC = {"ADC": "cpu._adc", "SBC": "cpu._sbc"}
+TRANSFERS = {"TAX": ("X", "A"), "TXA": ("A", "X"), "TAY": ("Y", "A"), "TYA": ("A", "Y"), "TSX": ("X", "SP")}
+COUNTERS = {"INX": ("X", "+ 1"), "DEX": ("X", "- 1"), "INY": ("Y", "+ 1"), "DEY": ("Y", "- 1")}
+FLAGS = {
+    "CLC": "cpu.C = 0", "SEC": "cpu.C = 1", "CLI": "cpu.I = 0", "SEI": "cpu.I = 1",
+    "CLD": "cpu.D = 0", "SED": "cpu.D = 1", "CLV": "cpu.V = 0", "NOP": None,
+}
+# Instructions after which execution does not simply continue with the next one.
+TERMINATORS = {"JMP", "JSR", "RTS", "RTI", "BRK"} | set(BRANCHES)
+
+
+def trace(memory, entries):
+    """Follows control flow from entries through $8000-$FFFF; returns the set of block start addresses.
+
+    Execution is assumed to continue after JSR and past both sides of every
+    branch. Indirect jumps, RTS, RTI and BRK end a path, as does any opcode
+    the interpreter does not implement.
+    """
+    leaders = set()
+    visited = set()
+    pending = [addr for addr in entries if addr >= 0x8000]
+    leaders.update(pending)
+    while pending:
+        pc = pending.pop()
+        while 0x8000 <= pc <= 0xFFFF and pc not in visited:
+            visited.add(pc)
+            mnemonic, mode, _ = DECODE[memory[pc]]
+            if mnemonic is None:
+                break
+            length = LENGTHS[mode]
+            next_pc = pc + length
+            if mnemonic in BRANCHES:
+                offset = memory[(pc + 1) & 0xFFFF]
+                target = (next_pc + (offset - 0x100 if offset & 0x80 else offset)) & 0xFFFF
+                leaders.update((target, next_pc))
+                pending.append(target)
+            elif mnemonic in ("JMP", "JSR") and mode == "absolute":
+                target = memory[(pc + 1) & 0xFFFF] | (memory[(pc + 2) & 0xFFFF] << 8)
+                leaders.add(target)
+                pending.append(target)
+                if mnemonic == "JSR":
+                    leaders.add(next_pc)
+                    pending.append(next_pc)
+                break
+            elif mnemonic in TERMINATORS:
+                break
+            pc = next_pc
+    return {addr for addr in leaders if addr in visited}
+
+
+class _Emitter:
+    def __init__(self):
+        self.lines = []
+        self.pending_cycles = 0
+
+    def emit(self, line, indent=1):
+        self.lines.append("    " * indent + line)
+
+    def flush_cycles(self):
+        if self.pending_cycles:
+            self.emit(f"cpu.cycles += {self.pending_cycles}")
+            self.pending_cycles = 0
+
+
+def _address(out, mode, operand, opcode):
+    """Emits code leaving the effective address in `addr`, or returns a constant address."""
+    penalty = _PAGE_PENALTY[opcode]
+    if mode == "zero_page":
+        return f"0x{operand & 0xFF:02X}"
+    if mode in ("zero_page_x", "zero_page_y"):
+        return f"(0x{operand & 0xFF:02X} + cpu.{mode[-1].upper()}) & 0xFF"
+    if mode == "absolute":
+        return f"0x{operand:04X}"
+    if mode in ("absolute_x", "absolute_y"):
+        index = f"cpu.{mode[-1].upper()}"
+        if penalty:
+            out.emit(f"if 0x{operand & 0xFF:02X} + {index} > 0xFF:")
+            out.emit("cpu.cycles += 1", 2)
+        out.emit(f"addr = (0x{operand:04X} + {index}) & 0xFFFF")
+        return "addr"
+    if mode == "indirect_x":
+        out.emit(f"ptr = (0x{operand & 0xFF:02X} + cpu.X) & 0xFF")
+        out.emit("addr = read(ptr) | (read((ptr + 1) & 0xFF) << 8)")
+        return "addr"
+    if mode == "indirect_y":
+        out.emit(f"base = read(0x{operand & 0xFF:02X}) | (read(0x{(operand + 1) & 0xFF:02X}) << 8)")
+        if penalty:
+            out.emit("if (base & 0xFF) + cpu.Y > 0xFF:")
+            out.emit("cpu.cycles += 1", 2)
+        out.emit("addr = (base + cpu.Y) & 0xFFFF")
+        return "addr"
+    return None
+
+
+def _value(out, mode, operand, opcode):
+    if mode == "immediate":
+        return f"0x{operand & 0xFF:02X}"
+    return f"read({_address(out, mode, operand, opcode)})"
+
+
+def _set_nz(out, register):
+    out.emit(f"cpu.Z = cpu.{register} == 0")
+    out.emit(f"cpu.N = cpu.{register} >= 0x80")
+
+
+def _polls(mode, operand, store):
+    """Whether an access in this mode may reach a device register, SRAM, or (when store is set) ROM.
+
+    Work RAM and ROM reads have no side effects, so instructions confined to
+    them need no interrupt poll afterwards.
+    """
+    if mode in ("immediate", "zero_page", "zero_page_x", "zero_page_y"):
+        return False
+    if mode == "absolute":
+        return 0x2000 <= operand < 0x8000 or (store and operand >= 0x8000)
+    if mode in ("absolute_x", "absolute_y"):
+        # Indexing may carry past $FFFF, but only into the zero page.
+        return operand + 0xFF >= 0x2000 and (store or operand < 0x8000)
+    return True
+
+
+def _emit_instruction(out, memory, pc):
+    """Emits one instruction; returns (next pc, whether the block ends here, whether to poll after it).
+
+    Polling is needed after anything that may run a device, change the I
+    flag or write ROM, since the interpreter would then take an interrupt,
+    end the frame or run the new code before the next instruction.
+    """
+    opcode = memory[pc]
+    mnemonic, mode, name = DECODE[opcode]
+    length = LENGTHS[mode]
+    next_pc = pc + length
+    operand = memory[(pc + 1) & 0xFFFF] | (memory[(pc + 2) & 0xFFFF] << 8) if length == 3 else memory[(pc + 1) & 0xFFFF]
+    out.emit(f"# ${pc:04X}: {mnemonic or '???'} {mode}")
+
+    out.pending_cycles += _CYCLES[opcode]
+    if mnemonic in FLAGS or mnemonic in TRANSFERS or mnemonic in COUNTERS:
+        # Register only instructions accumulate their cycles into the next flush.
+        if FLAGS.get(mnemonic):
+            out.emit(FLAGS[mnemonic])
+        elif mnemonic in TRANSFERS:
+            target, source = TRANSFERS[mnemonic]
+            out.emit(f"cpu.{target} = cpu.{source}")
+            _set_nz(out, target)
+        elif mnemonic in COUNTERS:
+            register, delta = COUNTERS[mnemonic]
+            out.emit(f"cpu.{register} = (cpu.{register} {delta}) & 0xFF")
+            _set_nz(out, register)
+        if mnemonic != "NOP" or mode == "implied":
+            return next_pc, False, mnemonic == "CLI"
+
+    out.flush_cycles()
+    if mnemonic in BRANCHES:
+        offset = operand - 0x100 if operand & 0x80 else operand
+        target = (next_pc + offset) & 0xFFFF
+        extra = 2 if (target ^ next_pc) & 0xFF00 else 1
+        out.emit(f"if {BRANCHES[mnemonic]}:")
+        out.emit(f"cpu.cycles += {extra}", 2)
+        out.emit(f"cpu.PC = 0x{target:04X}", 2)
+        out.emit("else:")
+        out.emit(f"cpu.PC = 0x{next_pc:04X}", 2)
+        return next_pc, True, False
+    if mnemonic == "JMP" and mode == "absolute":
+        out.emit(f"cpu.PC = 0x{operand:04X}")
+        return next_pc, True, False
+    if mnemonic == "JSR":
+        ret = next_pc - 1
+        out.emit(f"cpu._push(0x{ret >> 8:02X})")
+        out.emit(f"cpu._push(0x{ret & 0xFF:02X})")
+        out.emit(f"cpu.PC = 0x{operand:04X}")
+        return next_pc, True, False
+    if mnemonic in LOADS and mode != "implied":
+        out.emit(f"value = {_value(out, mode, operand, opcode)}")
+        for register in LOADS[mnemonic]:
+            out.emit(f"cpu.{register} = value")
+        _set_nz(out, LOADS[mnemonic][0])
+        return next_pc, False, _polls(mode, operand, False)
+    if mnemonic in STORES and mode not in ("immediate", "implied"):
+        out.emit(f"write({_address(out, mode, operand, opcode)}, {STORES[mnemonic]})")
+        return next_pc, False, _polls(mode, operand, True)
+    if mnemonic in LOGIC and mode != "implied":
+        out.emit(f"cpu.A {LOGIC[mnemonic]}= {_value(out, mode, operand, opcode)}")
+        _set_nz(out, "A")
+        return next_pc, False, _polls(mode, operand, False)
+    if mnemonic in COMPARES and mode != "implied":
+        out.emit(f"cpu._compare({COMPARES[mnemonic]}, {_value(out, mode, operand, opcode)})")
+        return next_pc, False, _polls(mode, operand, False)
+    if mnemonic in ARITHMETIC and mode != "implied":
+        out.emit(f"{ARITHMETIC[mnemonic]}({_value(out, mode, operand, opcode)})")
+        return next_pc, False, _polls(mode, operand, False)
+
+    # Everything else runs through the interpreter's handler, which reads its
+    # operands from cpu.PC.
+    out.emit(f"cpu.PC = 0x{(pc + 1) & 0xFFFF:04X}")
+    if _PAGE_PENALTY[opcode]:
+        out.emit("cpu._page_crossed = 0")
+        out.emit(f"cpu.{name}()")
+        out.emit("if cpu._page_crossed:")
+        out.emit("cpu.cycles += 1", 2)
+    else:
+        out.emit(f"cpu.{name}()")
+    if mnemonic in TERMINATORS or mnemonic is None:
+        return next_pc, True, False
+    if mode in ("implied", "accumulator"):
+        return next_pc, False, mnemonic == "PLP"
+    return next_pc, False, _polls(mode, operand, True)
+
+
+def _emit_exit(out, pc, count, condition=""):
+    """Emits a return to the run loop at pc, after count instructions, once the sync deadline is reached.
+
+    condition adds further reasons to return.
+    """
+    pending = out.pending_cycles
+    cycles = f"cpu.cycles + {pending}" if pending else "cpu.cycles"
+    out.emit(f"if {cycles} >= deadline{condition}:")
+    if pending:
+        out.emit(f"cpu.cycles += {pending}", 2)
+    out.emit(f"cpu.instructions += {count}", 2)
+    out.emit(f"cpu.PC = 0x{pc:04X}", 2)
+    out.emit("return", 2)
+
+
+def compile_blocks(memory, entries):
+    """Traces from entries and returns Python source defining BLOCKS, a dict of start address -> function."""
+    leaders = trace(memory, entries)
+    source = [
+        "# Generated by recompiler.py. Do not edit.",
+        "",
+    ]
+    blocks = []
+    for start in sorted(leaders):
+        out = _Emitter()
+        out.emit("read = cpu._read_byte", 1)
+        out.emit("write = cpu._write_byte", 1)
+        out.emit("deadline = cpu._sync_cycle", 1)
+        header = len(out.lines)
+        count = 0
+        polled = False
+        pc = start
+        while True:
+            pc, ends, polls = _emit_instruction(out, memory, pc)
+            count += 1
+            if ends:
+                break
+            if pc in leaders or pc > 0xFFFF:
+                out.flush_cycles()
+                out.emit(f"cpu.PC = 0x{pc & 0xFFFF:04X}")
+                break
+            # The run loop syncs devices and takes interrupts between blocks; inside
+            # one, leave at the instruction boundary where the interpreter would.
+            if polls:
+                polled = True
+                out.emit("deadline = cpu._sync_cycle")
+                _emit_exit(out, pc, count, " or cpu.nmi_pending or cpu.irq_line and not cpu.I"
+                                           " or cpu.ppu.frame != frame or cpu._code_pages != code_pages")
+            else:
+                _emit_exit(out, pc, count)
+        out.flush_cycles()
+        out.emit(f"cpu.instructions += {count}")
+        if polled:
+            out.lines[header:header] = ["    frame = cpu.ppu.frame", "    code_pages = cpu._code_pages"]
+        name = f"block_{start:04x}"
+        source.append(f"def {name}(cpu):")
+        source.extend(out.lines)
+        source.append("")
+        blocks.append((start, pc, name))
+
+    source.append("BLOCKS = {")
+    for start, _, name in blocks:
+        source.append(f"    0x{start:04X}: {name},")
+    source.append("}")
+    source.append("")
+    source.append("# Address range covered by each block, end exclusive.")
+    source.append("RANGES = {")
+    for start, end, _ in blocks:
+        source.append(f"    0x{start:04X}: 0x{min(end, 0x10000):04X},")
+    source.append("}")
+    return "\n".join(source) + "\n"
+
+
+class CompiledROM:
+    """Compiled blocks for one PRG ROM image, and a run loop that uses them.
+
+    Blocks cover code the static trace reached in $8000-$FFFF. Code anywhere
+    else (including RAM, where self-modifying code lives) and code the trace
+    missed, such as jump table targets, runs through the interpreter. When the
+    CPU writes a ROM page that blocks were compiled from, the ROM area is
+    compared against the compiled image and blocks over any byte that has
+    changed are discarded. Devices are synced and interrupts taken at the same
+    instruction boundaries as in the interpreter, so registers, memory and
+    cycle counts match Ricoh2A03.run_frame().
+    """
+
+    def __init__(self, module, prg_image):
+        self.blocks = dict(module.BLOCKS)
+        self.ranges = dict(module.RANGES)
+        self.prg_image = bytes(prg_image)
+        self.compiled = 0           # Blocks executed
+        self.interpreted = 0        # Instructions executed by the interpreter
+        self._pages = 0             # Bit per page that blocks were compiled from
+        for start, end in self.ranges.items():
+            for page in range(start >> 8, ((end - 1) >> 8) + 1):
+                self._pages |= 1 << page
+
+    def check(self, memory):
+        """Drops blocks whose code in memory no longer matches the compiled image."""
+        current = bytes(memory[0x8000:0x10000])
+        if current == self.prg_image:
+            return
+        for start, end in list(self.ranges.items()):
+            if current[start - 0x8000:end - 0x8000] != self.prg_image[start - 0x8000:end - 0x8000]:
+                del self.ranges[start]
+                self.blocks.pop(start, None)
+        self.prg_image = current
+
+    def _watch(self, cpu):
+        """Has cpu flag writes to the pages blocks were compiled from; returns the bits to watch.
+
+        This borrows the predecode cache's record of code pages, so such a
+        write clears the page's bit in cpu._code_pages. A read-only ROM cannot
+        change and needs no watching.
+        """
+        if cpu._rom.readonly:
+            return 0
+        for page in range(0x80, 0x100):
+            if self._pages >> page & 1:
+                cpu._code_by_page.setdefault(page, [])
+        cpu._code_pages |= self._pages
+        return self._pages
+
+    def run_frame(self, cpu):
+        """Runs until the attached PPU completes the current frame."""
+        self.check(cpu.memory)
+        watched = self._watch(cpu)
+        ppu = cpu.ppu
+        frame = ppu.frame
+        blocks = self.blocks
+        while ppu.frame == frame:
+            if cpu._code_pages & watched != watched:
+                self.check(cpu.memory)
+                watched = self._watch(cpu)
+            if cpu.cycles >= cpu._sync_cycle:
+                cpu.sync()
+                if ppu.frame != frame:
+                    # The interpreter finishes the step whose sync ended the frame.
+                    cpu.step()
+                    self.interpreted += 1
+                    break
+            if cpu.nmi_pending:
+                cpu.nmi()
+                continue
+            if cpu.irq_line and not cpu.I:
+                cpu.irq()
+                continue
+            block = blocks.get(cpu.PC)
+            if block is None:
+                cpu.step()
+                self.interpreted += 1
+            else:
+                block(cpu)
+                self.compiled += 1
+
+
+def rom_key(prg_rom):
+    """Cache key for a PRG ROM image."""
+    return hashlib.sha256(b"py6502-recompiler-%d:" % VERSION + bytes(prg_rom)).hexdigest()
+
+
+def load(cartridge, cache_dir=None):
+    """Returns a CompiledROM for the cartridge, compiling it into the cache directory if needed."""
+    cache_dir = cache_dir or os.environ.get("PY6502_CACHE", DEFAULT_CACHE_DIR)
+    memory = bytearray(0x10000)
+    cartridge.load_prg(memory)
+    path = os.path.join(cache_dir, f"rom_{rom_key(cartridge.prg_rom)}.py")
+
+    if not os.path.exists(path):
+        entries = [memory[vector] | (memory[vector + 1] << 8) for vector in (0xFFFA, 0xFFFC, 0xFFFE)]
+        source = compile_blocks(memory, entries)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first so that concurrent runs never see a partial module.
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as f:
+            f.write(source)
+        os.replace(temporary, path)
+
+    spec = importlib.util.spec_from_file_location(f"py6502_rom_{os.path.basename(path)[4:20]}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return CompiledROM(module, memory[0x8000:0x10000])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from nes import Cartridge
+
+    parser = argparse.ArgumentParser(description="Compile a ROM's reachable code into the cache.")
+    parser.add_argument("rom")
+    parser.add_argument("--cache-dir", help=f"Defaults to $PY6502_CACHE or {DEFAULT_CACHE_DIR}")
+    args = parser.parse_args()
+
+    cartridge = Cartridge.from_file(args.rom)
+    compiled = load(cartridge, args.cache_dir)
+    print(f"{len(compiled.blocks)} blocks cached for {rom_key(cartridge.prg_rom)}")
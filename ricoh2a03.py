@@ -1,7 +1,283 @@
+import copy
+import hashlib
 import random
+import struct
+
+from memory import Memory, banks, page_views, view
+
+# Base cycle count of every opcode, including the unofficial ones.
+_CYCLES = bytes((
+    # 0  1  2  3  4  5  6  7  8  9  A  B  C  D  E  F
+    7, 6, 2, 8, 3, 3, 5, 5, 3, 2, 2, 2, 4, 4, 6, 6,  # 0
+    2, 5, 2, 8, 4, 4, 6, 6, 2, 4, 2, 7, 4, 4, 7, 7,  # 1
+    6, 6, 2, 8, 3, 3, 5, 5, 4, 2, 2, 2, 4, 4, 6, 6,  # 2
+    2, 5, 2, 8, 4, 4, 6, 6, 2, 4, 2, 7, 4, 4, 7, 7,  # 3
+    6, 6, 2, 8, 3, 3, 5, 5, 3, 2, 2, 2, 3, 4, 6, 6,  # 4
+    2, 5, 2, 8, 4, 4, 6, 6, 2, 4, 2, 7, 4, 4, 7, 7,  # 5
+    6, 6, 2, 8, 3, 3, 5, 5, 4, 2, 2, 2, 5, 4, 6, 6,  # 6
+    2, 5, 2, 8, 4, 4, 6, 6, 2, 4, 2, 7, 4, 4, 7, 7,  # 7
+    2, 6, 2, 6, 3, 3, 3, 3, 2, 2, 2, 2, 4, 4, 4, 4,  # 8
+    2, 6, 2, 6, 4, 4, 4, 4, 2, 5, 2, 5, 5, 5, 5, 5,  # 9
+    2, 6, 2, 6, 3, 3, 3, 3, 2, 2, 2, 2, 4, 4, 4, 4,  # A
+    2, 5, 2, 5, 4, 4, 4, 4, 2, 4, 2, 4, 4, 4, 4, 4,  # B
+    2, 6, 2, 8, 3, 3, 5, 5, 2, 2, 2, 2, 4, 4, 6, 6,  # C
+    2, 5, 2, 8, 4, 4, 6, 6, 2, 4, 2, 7, 4, 4, 7, 7,  # D
+    2, 6, 2, 8, 3, 3, 5, 5, 2, 2, 2, 2, 4, 4, 6, 6,  # E
+    2, 5, 2, 8, 4, 4, 6, 6, 2, 4, 2, 7, 4, 4, 7, 7,  # F
+))
+
+# Read instructions using absolute,X / absolute,Y / (indirect),Y take one more
+# cycle when the indexed address crosses a page. Stores and read-modify-write
+# instructions always pay that cycle, so it is already in their base count.
+_PAGE_PENALTY = bytes(
+    1 if opcode in (
+        0x11, 0x19, 0x1C, 0x1D, 0x31, 0x39, 0x3C, 0x3D,
+        0x51, 0x59, 0x5C, 0x5D, 0x71, 0x79, 0x7C, 0x7D,
+        0xB1, 0xB3, 0xB9, 0xBC, 0xBD, 0xBE, 0xBF,
+        0xD1, 0xD9, 0xDC, 0xDD, 0xF1, 0xF9, 0xFC, 0xFD,
+    ) else 0
+    for opcode in range(256)
+)
+
+# Sync deadline used while no device needs to be caught up.
+_NEVER = 1 << 62
+
+# Instructions allowed in a loop that run_frame() may fast-forward: none of them
+# write memory, and their reads can be resolved statically. Maps the opcode to
+# its length and addressing: "implied", "immediate", "zero_page" (including
+# indexed zero page, which can only reach RAM), "absolute" or "branch".
+_IDLE_OPCODES = {}
+for _opcodes, _length, _mode in (
+    ((0xEA, 0x18, 0x38, 0xB8, 0xAA, 0x8A, 0xA8, 0x98, 0xBA, 0xE8, 0xCA, 0xC8, 0x88), 1, "implied"),
+    ((0xA9, 0xA2, 0xA0, 0xC9, 0xE0, 0xC0, 0x29, 0x09, 0x49), 2, "immediate"),
+    ((0xA5, 0xB5, 0xA6, 0xB6, 0xA4, 0xB4, 0xC5, 0xD5, 0xE4, 0xC4,
+      0x24, 0x25, 0x35, 0x05, 0x15, 0x45, 0x55), 2, "zero_page"),
+    ((0xAD, 0xAE, 0xAC, 0xCD, 0xEC, 0xCC, 0x2C, 0x2D, 0x0D, 0x4D), 3, "absolute"),
+    ((0x10, 0x30, 0x50, 0x70, 0x90, 0xB0, 0xD0, 0xF0), 2, "branch"),
+    ((0x4C,), 3, "jump"),
+):
+    for _opcode in _opcodes:
+        _IDLE_OPCODES[_opcode] = (_length, _mode)
+
+# Longest loop body, in bytes, that is considered for fast-forwarding.
+_IDLE_LOOP_BYTES = 16
+
+# Registers saved by save_state().
+_STATE_FIELDS = (
+    "A", "X", "Y", "SP", "PC", "C", "Z", "I", "D", "B", "U", "V", "N",
+    "cycles", "nmi_pending", "irq_line",
+)
+
+# Dirty mask with a bit set for every one of the 256 memory pages.
+_ALL_PAGES = (1 << 256) - 1
+
+# Predecoding (see Ricoh2A03.predecode)
+#
+# Common instructions are specialized per addressing mode into a function of
+# (cpu, operand), where operand holds the instruction's bytes already fetched:
+# the zero page address, the absolute address, the immediate value, or for a
+# branch its (target, extra cycles if taken). The functions run with PC
+# already advanced past the instruction.
+
+def _load_a(cpu, value):
+    cpu.A = value
+    cpu._set_flags(value)
+
+def _load_x(cpu, value):
+    cpu.X = value
+    cpu._set_flags(value)
+
+def _load_y(cpu, value):
+    cpu.Y = value
+    cpu._set_flags(value)
+
+def _load_ax(cpu, value):
+    cpu.A = cpu.X = value
+    cpu._set_flags(value)
+
+def _and(cpu, value):
+    cpu.A &= value
+    cpu._set_flags(cpu.A)
+
+def _ora(cpu, value):
+    cpu.A |= value
+    cpu._set_flags(cpu.A)
+
+def _eor(cpu, value):
+    cpu.A ^= value
+    cpu._set_flags(cpu.A)
+
+def _bit(cpu, value):
+    cpu.Z = (cpu.A & value) == 0
+    cpu.N = (value & 0x80) != 0
+    cpu.V = (value & 0x40) != 0
+
+# Mnemonic -> operation on the value read by the instruction.
+_PREDECODED_READS = {
+    "LDA": _load_a,
+    "LDX": _load_x,
+    "LDY": _load_y,
+    "LAX": _load_ax,
+    "AND": _and,
+    "ORA": _ora,
+    "EOR": _eor,
+    "BIT": _bit,
+    "CMP": lambda cpu, value: cpu._compare(cpu.A, value),
+    "CPX": lambda cpu, value: cpu._compare(cpu.X, value),
+    "CPY": lambda cpu, value: cpu._compare(cpu.Y, value),
+    "ADC": lambda cpu, value: cpu._adc(value),
+    "SBC": lambda cpu, value: cpu._sbc(value),
+}
+
+# Mnemonic -> value the instruction stores.
+_PREDECODED_WRITES = {
+    "STA": lambda cpu: cpu.A,
+    "STX": lambda cpu: cpu.X,
+    "STY": lambda cpu: cpu.Y,
+    "SAX": lambda cpu: cpu.A & cpu.X,
+}
+
+def _predecoded_address(mode, penalty):
+    """Returns a function of (cpu, operand) -> effective address for mode, or None."""
+    if mode == "zero_page":
+        return lambda cpu, addr: addr
+    if mode == "zero_page_x":
+        return lambda cpu, base: (base + cpu.X) & 0xFF
+    if mode == "zero_page_y":
+        return lambda cpu, base: (base + cpu.Y) & 0xFF
+    if mode == "absolute":
+        return lambda cpu, addr: addr
+    if mode in ("absolute_x", "absolute_y"):
+        register = mode[-1].upper()
+        def indexed(cpu, base):
+            addr = (base + getattr(cpu, register)) & 0xFFFF
+            if penalty and (base ^ addr) & 0xFF00:
+                cpu.cycles += 1
+            return addr
+        return indexed
+    if mode == "indirect_x":
+        def indexed_indirect(cpu, operand):
+            ram = cpu._ram
+            ptr = (operand + cpu.X) & 0xFF
+            return ram[ptr] | (ram[(ptr + 1) & 0xFF] << 8)
+        return indexed_indirect
+    if mode == "indirect_y":
+        def indirect_indexed(cpu, ptr):
+            ram = cpu._ram
+            base = ram[ptr] | (ram[(ptr + 1) & 0xFF] << 8)
+            addr = (base + cpu.Y) & 0xFFFF
+            if penalty and (base ^ addr) & 0xFF00:
+                cpu.cycles += 1
+            return addr
+        return indirect_indexed
+    return None
+
+def _predecoded_read(operation, mode, penalty):
+    if mode == "immediate":
+        return operation
+    if mode == "zero_page":
+        return lambda cpu, addr: operation(cpu, cpu._ram[addr])
+    address = _predecoded_address(mode, penalty)
+    if address is None:
+        return None
+    return lambda cpu, operand: operation(cpu, cpu._read_byte(address(cpu, operand)))
+
+def _predecoded_write(source, mode):
+    address = _predecoded_address(mode, 0)
+    if address is None:
+        return None
+    return lambda cpu, operand: cpu._write_byte(address(cpu, operand), source(cpu))
+
+def _predecoded_branch(flag, taken_when):
+    def branch(cpu, operand):
+        if getattr(cpu, flag) == taken_when:
+            cpu.PC, extra = operand
+            cpu.cycles += extra
+    return branch
+
+def _predecoded_jmp(cpu, target):
+    cpu.PC = target
+
+def _predecoded_jsr(cpu, target):
+    pc = cpu.PC - 1
+    cpu._push((pc >> 8) & 0xFF)
+    cpu._push(pc & 0xFF)
+    cpu.PC = target
+
+# Branch mnemonic -> (flag, value on which it is taken).
+_BRANCH_CONDITIONS = {
+    "BPL": ("N", 0), "BMI": ("N", 1), "BVC": ("V", 0), "BVS": ("V", 1),
+    "BCC": ("C", 0), "BCS": ("C", 1), "BNE": ("Z", 0), "BEQ": ("Z", 1),
+}
+
+# Operand bytes of each addressing mode.
+_OPERAND_BYTES = {
+    "immediate": 1, "zero_page": 1, "zero_page_x": 1, "zero_page_y": 1,
+    "indirect_x": 1, "indirect_y": 1, "absolute": 2, "absolute_x": 2, "absolute_y": 2,
+}
 
 class Ricoh2A03:
-    def __init__(self, memory):
+    # Instances carry no __dict__, so a session server can host thousands of
+    # them. The object is under 1 KB; with a Memory sharing its ROM the only
+    # other per instance cost is 2KB of work RAM (see benchmark.py).
+    __slots__ = (
+        "A", "X", "Y", "SP", "PC",
+        "C", "Z", "I", "D", "B", "U", "V", "N",
+        "memory", "_ram", "_ram_mask", "_rom", "trace", "cycles", "nmi_pending", "irq_line", "_page_crossed", "_sync_cycle",
+        "skip_idle", "idle_cycles", "_idle_loops", "_idle_candidate",
+        "ppu", "apu", "controllers",
+        "_dirty", "_pages", "_page_hashes", "_memory_hash",
+        "fuse", "fused_counts", "unfused",
+        "predecode", "_decoded", "_code_by_page", "_code_pages", "decode_misses",
+        "instructions", "nmis", "irqs",
+    )
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._build_dispatch()
+
+    @classmethod
+    def _build_dispatch(cls):
+        """Builds the opcode -> handler function table shared by every instance of the class."""
+        cls._dispatch = tuple(
+            getattr(cls, cls._OPCODE_HANDLERS.get(opcode, "_illegal_opcode")) for opcode in range(256)
+        )
+        # Superinstructions by first opcode: (opcode offsets to match, length in bytes,
+        # cycles before the last instruction, total base cycles, handler, name),
+        # longest patterns first.
+        fusions = [[] for _ in range(256)]
+        for opcodes, lengths, name in sorted(cls._FUSIONS, key=lambda fusion: -len(fusion[0])):
+            offsets = [sum(lengths[:i]) for i in range(len(opcodes))]
+            cycles = [_CYCLES[opcode] for opcode in opcodes]
+            fusions[opcodes[0]].append((
+                tuple(zip(offsets[1:], opcodes[1:])), sum(lengths), sum(cycles[:-1]), sum(cycles),
+                getattr(cls, name), name,
+            ))
+        cls._fusions = tuple(tuple(entries) for entries in fusions)
+        # Predecoded forms by opcode: (function of (cpu, operand), length in bytes),
+        # or (None, 1) for instructions that always run their handler. Handlers a
+        # subclass overrides are never specialized.
+        predecoders = []
+        for opcode in range(256):
+            name = cls._OPCODE_HANDLERS.get(opcode, "_illegal_opcode")
+            mnemonic, mode = name[1:4], name[5:]
+            entry = (None, 1)
+            if getattr(cls, name) is getattr(Ricoh2A03, name):
+                if mnemonic in _PREDECODED_READS and mode in _OPERAND_BYTES:
+                    run = _predecoded_read(_PREDECODED_READS[mnemonic], mode, _PAGE_PENALTY[opcode])
+                    entry = (run, 1 + _OPERAND_BYTES[mode])
+                elif mnemonic in _PREDECODED_WRITES and mode in _OPERAND_BYTES:
+                    entry = (_predecoded_write(_PREDECODED_WRITES[mnemonic], mode), 1 + _OPERAND_BYTES[mode])
+                elif name[1:] in _BRANCH_CONDITIONS:
+                    entry = (_predecoded_branch(*_BRANCH_CONDITIONS[name[1:]]), 2)
+                elif name == "_JMP_absolute":
+                    entry = (_predecoded_jmp, 3)
+                elif name == "_JSR":
+                    entry = (_predecoded_jsr, 3)
+            predecoders.append(entry if entry[0] is not None else (None, 1))
+        cls._predecoders = tuple(predecoders)
+
+    def __init__(self, memory, trace=True):
         # Registers
         self.A = 0x00      # Accumulator
         self.X = 0x00      # X Register
@@ -20,7 +296,43 @@ class Ricoh2A03:
         self.V = 0         # Overflow Flag
         self.N = 0         # Negative Flag
 
-        self.memory = memory  # Memory interface (should be 64KB)
+        self.memory = memory  # A Memory, or a flat 64KB bytearray
+        self._ram, self._ram_mask, self._rom = banks(memory)  # Fast paths for RAM and ROM
+        self.trace = trace    # Print each instruction before it executes
+
+        self.cycles = 0              # CPU cycles executed since power on
+        self.nmi_pending = False     # Set by the PPU when vblank raises NMI
+        self.irq_line = False        # Level of the IRQ line driven by the APU
+        self._page_crossed = 0       # Set by indexed addressing modes
+        self._sync_cycle = _NEVER    # Cycle at which attached devices must be caught up
+
+        self.skip_idle = False       # Let run_frame() fast-forward idle loops
+        self.idle_cycles = 0         # Cycles elided by skipping idle loops
+        self._idle_loops = {}        # (head, branch) -> reads $2002, or None if not skippable
+        self._idle_candidate = None  # (head, registers, cycles) at the last backward jump
+
+        self._dirty = _ALL_PAGES     # Bit per memory page written since the last state_hash()
+        self._pages = None           # Page views for hashing, see memory.page_views()
+        self._page_hashes = {}       # Page number -> hash of its contents
+        self._memory_hash = 0        # XOR of all page hashes
+
+        self.fuse = False            # Let step() run common instruction sequences as one handler
+        self.fused_counts = {}       # Superinstruction name -> times it ran
+        self.unfused = 0             # Instructions step() ran on their own while fuse was set
+
+        self.predecode = False       # Let step() run instructions from the predecode cache
+        self._decoded = {}           # Address -> predecoded instruction, see _predecode()
+        self._code_by_page = {}      # Writable page -> addresses of instructions decoded from it
+        self._code_pages = 0         # Bit per page in _code_by_page
+        self.decode_misses = 0       # Instructions decoded because they were not in the cache
+
+        self.instructions = 0        # Instructions executed, for metrics
+        self.nmis = 0                # Interrupts serviced, for metrics
+        self.irqs = 0
+
+        self.ppu = None       # Ricoh2C02 mapped at $2000-$3FFF, see attach_ppu()
+        self.apu = None       # APU mapped at $4000-$4017, see attach_apu()
+        self.controllers = None  # Controllers read through $4016/$4017, see attach_controllers()
 
     def reset(self):
         """Resets the CPU to its initial state."""
@@ -34,8 +346,342 @@ class Ricoh2A03:
         self.V = 0         # Overflow Flag
         self.N = 0         # Negative Flag
         self.PC = self._read_word(0xFFFC)
+        self.cycles += 7
+        self.nmi_pending = False
+        self._schedule()
         # self.P = 0x24
 
+    def attach_ppu(self, ppu):
+        """Maps a PPU into $2000-$3FFF and lets it signal NMI to this CPU."""
+        self.ppu = ppu
+        ppu.cpu = self
+        self.sync()
+
+    def attach_apu(self, apu):
+        """Maps an APU into $4000-$4013, $4015 and $4017."""
+        self.apu = apu
+        apu.run(self.cycles)
+        self.sync()
+
+    def attach_controllers(self, port1, port2=None):
+        """Connects controllers to $4016 and $4017."""
+        self.controllers = (port1, port2) if port2 is not None else (port1,)
+
+    def clone(self):
+        """Returns an independent machine in the same state, for branching searches from one state.
+
+        The clone shares everything that cannot change (PRG and CHR ROM, decoded
+        patterns, the idle loop cache) with this machine, and shares the
+        framebuffer until either one draws. Work RAM, nametables and device state
+        are copied; with a Memory that is a few KB per clone. Flat bytearray
+        memory is copied whole.
+        """
+        other = copy.copy(self)
+        other.memory = self.memory.clone() if isinstance(self.memory, Memory) else bytearray(self.memory)
+        other._ram, other._ram_mask, other._rom = banks(other.memory)
+        other._pages = None
+        other._page_hashes = dict(self._page_hashes)
+        other._decoded = dict(self._decoded)
+        other._code_by_page = {page: list(pcs) for page, pcs in self._code_by_page.items()}
+        other.fused_counts = dict(self.fused_counts)
+        if self.ppu is not None:
+            other.ppu = self.ppu.clone()
+            other.ppu.cpu = other
+        if self.apu is not None:
+            other.apu = self.apu.clone(other._read_byte)
+        if self.controllers is not None:
+            other.controllers = tuple(controller.clone() for controller in self.controllers)
+        return other
+
+    def save_state(self):
+        """Returns the machine state: registers, memory and attached devices as plain values and bytes.
+
+        ROM is not included; restore the state into a machine built from the
+        same cartridge.
+        """
+        state = {name: getattr(self, name) for name in _STATE_FIELDS}
+        if isinstance(self.memory, Memory):
+            state["ram"] = bytes(self.memory.ram)
+            if self.memory.sram is not None:
+                state["sram"] = bytes(self.memory.sram)
+        else:
+            state["ram"] = bytes(self.memory[:0x10000])
+        if self.ppu is not None:
+            state["ppu"] = self.ppu.save_state()
+        if self.apu is not None:
+            state["apu"] = self.apu.save_state()
+        if self.controllers is not None:
+            state["controllers"] = [controller.save_state() for controller in self.controllers]
+        return state
+
+    def load_state(self, state):
+        """Restores a state returned by save_state()."""
+        for name in _STATE_FIELDS:
+            setattr(self, name, state[name])
+        if isinstance(self.memory, Memory):
+            self.memory.ram[:] = state["ram"]
+            if "sram" in state and self.memory.sram is not None:
+                self.memory.sram[:] = state["sram"]
+        else:
+            self.memory[:0x10000] = state["ram"]
+        if "ppu" in state:
+            self.ppu.load_state(state["ppu"])
+        if "apu" in state:
+            self.apu.load_state(state["apu"])
+        if "controllers" in state:
+            for controller, controller_state in zip(self.controllers, state["controllers"]):
+                controller.load_state(controller_state)
+        self._idle_candidate = None
+        self.invalidate_state_hash()
+        self.invalidate_decoded()
+        self._schedule()
+
+    def state_hash(self):
+        """Returns a 64 bit hash of the registers and memory, for deduplicating search states.
+
+        Each memory page's hash is kept between calls and only pages written
+        since the last call are rehashed, so the cost follows the number of
+        pages written rather than the size of memory. Device state (PPU, APU)
+        and the cycle count are not included. Code that changes memory without
+        going through the CPU must call invalidate_state_hash().
+        """
+        if self._dirty:
+            if self._pages is None:
+                self._pages = page_views(self.memory)
+            pages = self._pages
+            hashes = self._page_hashes
+            combined = self._memory_hash
+            dirty = self._dirty
+            while dirty:
+                page = (dirty & -dirty).bit_length() - 1
+                dirty &= dirty - 1
+                view = pages.get(page)
+                if view is None:
+                    continue
+                digest = hashlib.blake2b(view, digest_size=8, salt=page.to_bytes(2, "little"))
+                value = int.from_bytes(digest.digest(), "little")
+                combined ^= hashes.get(page, 0) ^ value
+                hashes[page] = value
+            self._memory_hash = combined
+            self._dirty = 0
+        registers = struct.pack("<BBBBHBQ", self.A, self.X, self.Y, self.SP, self.PC, self._get_status(),
+                                self._memory_hash)
+        return int.from_bytes(hashlib.blake2b(registers, digest_size=8).digest(), "little")
+
+    def invalidate_state_hash(self):
+        """Forces state_hash() to rehash all of memory."""
+        self._dirty = _ALL_PAGES
+
+    def load(self, addr, data):
+        """Copies data into memory starting at addr, e.g. to load a program.
+
+        Writes go through the same map as indexing a Memory, without I/O side
+        effects, and each bank is copied as one slice. state_hash() and the
+        predecode cache see the change.
+        """
+        stop = addr + len(data)
+        if not 0 <= addr <= stop <= 0x10000:
+            raise ValueError(f"Range {addr:#06x}-{stop:#06x} is outside the address space")
+        self.memory[addr:stop] = data
+        for page in range(addr >> 8, (stop + 0xFF) >> 8):
+            if page < 0x20:
+                page = (page << 8 & self._ram_mask) >> 8
+            bit = 1 << page
+            self._dirty |= bit
+            if self._code_pages & bit:
+                self._invalidate_code(page)
+
+    def dump(self, addr, length):
+        """Returns length bytes of memory from addr as a memoryview, without I/O side effects.
+
+        See memory.view(): a range within RAM or ROM is a live view.
+        """
+        stop = addr + length
+        if not 0 <= addr <= stop <= 0x10000:
+            raise ValueError(f"Range {addr:#06x}-{stop:#06x} is outside the address space")
+        return view(self.memory, addr, stop)
+
+    def invalidate_decoded(self):
+        """Empties the predecode cache; needed after changing code without going through the CPU."""
+        self._decoded = {}
+        self._code_by_page = {}
+        self._code_pages = 0
+
+    def _predecode(self, pc):
+        """Decodes the instruction at pc into (function, operand, next PC, base cycles, opcode).
+
+        function is None for instructions without a predecoded form, and operand
+        is then their handler. Instructions in RAM or ROM are cached; those in
+        writable memory are also indexed by page so that _write_byte() drops
+        them as soon as their bytes change.
+        """
+        self.decode_misses += 1
+        opcode = self._read_byte(pc)
+        run, length = self._predecoders[opcode]
+        next_pc = pc + length
+        if run is None:
+            operand = self._dispatch[opcode]
+        elif length == 2:
+            operand = self._read_byte(pc + 1)
+            if opcode & 0x1F == 0x10:
+                # Branches: precompute the target and the cycles taking it costs.
+                target = (next_pc + (operand - 0x100 if operand & 0x80 else operand)) & 0xFFFF
+                operand = (target, 2 if (target ^ next_pc) & 0xFF00 else 1)
+        else:
+            operand = self._read_byte(pc + 1) | (self._read_byte(pc + 2) << 8)
+        entry = (run, operand, next_pc, _CYCLES[opcode], opcode)
+
+        if next_pc <= 0x2000 or (pc >= 0x8000 and next_pc <= 0x10000):
+            self._decoded[pc] = entry
+            if pc < 0x2000 or not self._rom.readonly:
+                mask = self._ram_mask if pc < 0x2000 else 0xFFFF
+                for page in {(pc & mask) >> 8, ((next_pc - 1) & mask) >> 8}:
+                    self._code_by_page.setdefault(page, []).append(pc)
+                    self._code_pages |= 1 << page
+        return entry
+
+    def _invalidate_code(self, page):
+        """Drops the predecoded instructions read from a page that was just written."""
+        decoded = self._decoded
+        for pc in self._code_by_page.pop(page):
+            decoded.pop(pc, None)
+        self._code_pages &= ~(1 << page)
+
+    def sync(self):
+        """Catches attached devices up to the current cycle.
+
+        Devices are run lazily: the CPU only syncs them when one of their
+        registers is accessed, or when the cycle count reaches the next point
+        at which a device can affect the CPU (vblank NMI, end of frame), which
+        the devices predict ahead of time in _schedule().
+        """
+        if self.ppu is not None:
+            self.ppu.run(self.cycles)
+        if self.apu is not None:
+            self.apu.run(self.cycles)
+            self.irq_line = self.apu.irq
+        self._schedule()
+
+    def _schedule(self):
+        deadline = _NEVER
+        if self.ppu is not None:
+            deadline = self.ppu.next_sync_cycle()
+        if self.apu is not None:
+            apu_deadline = self.apu.next_sync_cycle()
+            if apu_deadline is not None and apu_deadline < deadline:
+                deadline = apu_deadline
+        self._sync_cycle = deadline
+
+    def nmi(self):
+        """Services a non-maskable interrupt through the vector at $FFFA."""
+        self.nmi_pending = False
+        self.nmis += 1
+        self._interrupt(0xFFFA)
+
+    def irq(self):
+        """Services a maskable interrupt through $FFFE unless interrupts are disabled."""
+        if not self.I:
+            self.irqs += 1
+            self._interrupt(0xFFFE)
+
+    def _interrupt(self, vector):
+        self._push((self.PC >> 8) & 0xFF)
+        self._push(self.PC & 0xFF)
+        self._push((self._get_status() & ~0x10) | 0x20)  # Break flag clear for hardware interrupts
+        self.I = 1
+        self.PC = self._read_word(vector)
+        self.cycles += 7
+        # An iteration timed across the handler would not be a whole number of loop iterations.
+        self._idle_candidate = None
+
+    def run_frame(self):
+        """Runs until the attached PPU completes the current frame.
+
+        With skip_idle set, short loops that only wait for an interrupt or a
+        change in $2002 are fast-forwarded to the next such event; the cycles
+        skipped are added to idle_cycles.
+        """
+        ppu = self.ppu
+        frame = ppu.frame
+        if not self.skip_idle:
+            while ppu.frame == frame:
+                self.step()
+            return
+        while ppu.frame == frame:
+            pc = self.PC
+            self.step()
+            # Never skip past the end of the frame this call is running.
+            if self.PC <= pc and pc - self.PC < _IDLE_LOOP_BYTES and ppu.frame == frame:
+                self._skip_idle_loop(pc)
+
+    def _skip_idle_loop(self, branch):
+        """Called after the instruction at branch jumped back to self.PC.
+
+        A loop can be skipped when it writes nothing, reads no I/O other than
+        $2002 and arrives back at its head with the same registers as on the
+        previous iteration: it will then keep spinning identically until an
+        interrupt arrives or $2002 changes, both of which are predicted ahead.
+        """
+        head = self.PC
+        key = (head, branch)
+        reads_status = self._idle_loops.get(key, False)
+        if reads_status is False:
+            reads_status = self._analyze_idle_loop(head, branch)
+            if head >= 0x8000:
+                self._idle_loops[key] = reads_status
+        if reads_status is None:
+            return
+
+        registers = (self.A, self.X, self.Y, self.SP, self._get_status())
+        candidate = self._idle_candidate
+        self._idle_candidate = (head, registers, self.cycles)
+        if candidate is None or candidate[0] != head or candidate[1] != registers:
+            return
+
+        iteration = self.cycles - candidate[2]
+        target = self._sync_cycle
+        if reads_status:
+            target = min(target, self.ppu.next_status_cycle())
+        if iteration <= 0 or target >= _NEVER:
+            return
+        skipped = (target - self.cycles) // iteration * iteration
+        if skipped > 0:
+            self.cycles += skipped
+            self.idle_cycles += skipped
+            self._idle_candidate = (head, registers, self.cycles)
+
+    def _analyze_idle_loop(self, head, branch):
+        """Decodes the loop from head; returns whether it reads $2002, or None if it can't be skipped.
+
+        branch is where the step that jumped back started. With fuse set that
+        may be a few instructions before the branch itself, so decoding runs
+        through the first branch or jump at or after it.
+        """
+        memory = self.memory
+        reads_status = False
+        aligned = False
+        pc = head
+        while pc - head < _IDLE_LOOP_BYTES:
+            opcode = memory[pc]
+            entry = _IDLE_OPCODES.get(opcode)
+            if entry is None:
+                return None
+            length, mode = entry
+            aligned = aligned or pc == branch
+            if mode == "absolute":
+                addr = memory[(pc + 1) & 0xFFFF] | (memory[(pc + 2) & 0xFFFF] << 8)
+                if 0x2000 <= addr <= 0x3FFF and addr & 0x07 == 2:
+                    reads_status = True
+                elif 0x2000 <= addr <= 0x401F:
+                    return None
+            elif mode in ("branch", "jump"):
+                if pc >= branch:
+                    return reads_status if aligned else None
+                if mode == "jump":
+                    return None
+            pc += length
+        return None
+
     def randomize(self):
         """Randomizes the CPU registers for training."""
         self.A = random.randint(0, 255)
@@ -55,12 +701,27 @@ class Ricoh2A03:
     def _read_byte(self, addr):
         """Reads a byte from memory."""
         addr = addr & 0xFFFF
-        if 0x2000 <= addr <= 0x3FFF:
+        if addr < 0x2000:
+            return self._ram[addr & self._ram_mask]
+        elif addr >= 0x8000:
+            return self._rom[addr - 0x8000]
+        elif addr <= 0x3FFF:
             # PPU registers (mirrored every 8 bytes)
-            # Return a default value or simulate minimal PPU behavior
+            if self.ppu is not None:
+                self.ppu.run(self.cycles)
+                return self.ppu.read_register(addr & 0x07)
             return 0x00
         elif 0x4000 <= addr <= 0x401F:
             # APU and I/O registers
+            if (addr == 0x4016 or addr == 0x4017) and self.controllers is not None:
+                if addr - 0x4016 < len(self.controllers):
+                    return self.controllers[addr - 0x4016].read()
+                return 0x40
+            if addr == 0x4015 and self.apu is not None:
+                value = self.apu.read_status(self.cycles)
+                self.irq_line = self.apu.irq
+                self._schedule()
+                return value
             return 0x00
         else:
             value = self.memory[addr]
@@ -74,14 +735,54 @@ class Ricoh2A03:
 
         # print (f"Write {data:02X} to {addr:04X}")
 
-        if 0x2000 <= addr <= 0x3FFF:
+        if addr < 0x2000:
+            addr &= self._ram_mask
+            self._ram[addr] = data
+            page = 1 << (addr >> 8)
+            self._dirty |= page
+            if self._code_pages & page:
+                self._invalidate_code(addr >> 8)
+        elif addr >= 0x8000:
+            # A shared ROM is mapped read-only; writes to it are dropped.
+            if not self._rom.readonly:
+                self._rom[addr - 0x8000] = data
+                page = 1 << (addr >> 8)
+                self._dirty |= page
+                if self._code_pages & page:
+                    self._invalidate_code(addr >> 8)
+        elif addr <= 0x3FFF:
             # PPU registers (mirrored every 8 bytes)
-            pass  # Ignore writes or simulate minimal PPU behavior
+            if self.ppu is not None:
+                self.ppu.run(self.cycles)
+                self.ppu.write_register(addr & 0x07, data)
+                self._schedule()
+        elif addr == 0x4014 and self.ppu is not None:
+            self._oam_dma(data)
         elif 0x4000 <= addr <= 0x401F:
             # APU and I/O registers
-            pass  # Ignore writes or simulate minimal APU behavior
+            if addr == 0x4016 and self.controllers is not None:
+                frame = self.ppu.frame if self.ppu is not None else 0
+                for controller in self.controllers:
+                    controller.write_strobe(data, frame)
+            elif self.apu is not None and (addr <= 0x4013 or addr == 0x4015 or addr == 0x4017):
+                self.apu.write_register(addr, data, self.cycles)
+                self.irq_line = self.apu.irq
+                self._schedule()
         else:
             self.memory[addr] = data
+            self._dirty |= 1 << (addr >> 8)
+
+    def _oam_dma(self, page):
+        """Copies a 256 byte page into PPU OAM, stalling the CPU for 513 or 514 cycles."""
+        base = page << 8
+        self.ppu.run(self.cycles)
+        if base < 0x2000 or base >= 0x8000:
+            # RAM and ROM have no read side effects, so the page is copied as one slice.
+            self.ppu.write_oam_dma(view(self.memory, base, base + 0x100))
+        else:
+            self.ppu.write_oam_dma([self._read_byte(base + i) for i in range(256)])
+        # The extra cycle aligns the DMA to an even CPU cycle.
+        self.cycles += 513 + (self.cycles & 1)
 
     def _read_word(self, addr):
         """Reads a word (two bytes) from memory with zero page wraparound."""
@@ -89,17 +790,30 @@ class Ricoh2A03:
         hi = self._read_byte((addr + 1) & 0xFFFF)
         return (hi << 8) | lo
 
+    # The zero page and the stack page are always work RAM, so accesses to them
+    # index it directly instead of going through _read_byte()/_write_byte().
+
+    def _write_zero_page(self, addr, data):
+        """Writes a byte to the zero page address addr ($00-$FF)."""
+        self._ram[addr] = data & 0xFF
+        self._dirty |= 1
+        if self._code_pages & 1:
+            self._invalidate_code(0)
+
     def _push(self, value):
         """Pushes a byte onto the stack."""
         # print (f"Pushing {value:02X} onto stack at {0x0100 + self.SP:04X}")
-        self._write_byte(0x0100 + self.SP, value)
+        self._ram[0x0100 + self.SP] = value & 0xFF
+        self._dirty |= 2
+        if self._code_pages & 2:
+            self._invalidate_code(1)
         self.SP = (self.SP - 1) & 0xFF
         # print (f"Stack Pointer after push: {self.SP:02X}")
 
     def _pop(self):
         """Pops a byte from the stack."""
         self.SP = (self.SP + 1) & 0xFF
-        return self._read_byte(0x0100 + self.SP)
+        return self._ram[0x0100 + self.SP]
 
     def _set_flags(self, value):
         """Sets the Zero and Negative flags based on the value."""
@@ -134,272 +848,439 @@ class Ricoh2A03:
         # self.P = self._get_status()
 
     def step(self):
+        synced = self.cycles >= self._sync_cycle
+        if synced:
+            self.sync()
+        if self.nmi_pending:
+            self.nmi()
+            return
+        if self.irq_line and not self.I:
+            self.irq()
+            return
+        self.instructions += 1
+
+        if self.predecode and not self.trace:
+            entry = self._decoded.get(self.PC)
+            if entry is None:
+                entry = self._predecode(self.PC)
+            run, operand, next_pc, cycles, opcode = entry
+            self.cycles += cycles
+            self.PC = next_pc
+            if run is not None:
+                run(self, operand)
+                return
+            # Anything not specialized runs its handler, which fetches its own operands.
+            self._page_crossed = 0
+            operand(self)
+            if self._page_crossed:
+                self.cycles += _PAGE_PENALTY[opcode]
+            return
+
         current_pc = self.PC
         opcode = self._read_byte(current_pc)
 
-        status = self._get_status()
-        print(f"About to execute opcode: {opcode:02X} at PC: {current_pc:04X},  A: {self.A:02X},  X: {self.X:02X},  Y: {self.Y:02X}, P: {status:02X}, SP: {self.SP:02X}")
+        if self.fuse and not self.trace:
+            # A step that synced may have ended a frame, and must stop after one
+            # instruction as it does without fuse.
+            if not synced and self._fusions[opcode] and self._step_fused(opcode, current_pc):
+                return
+            self.unfused += 1
+
+        if self.trace:
+            status = self._get_status()
+            print(f"About to execute opcode: {opcode:02X} at PC: {current_pc:04X},  A: {self.A:02X},  X: {self.X:02X},  Y: {self.Y:02X}, P: {status:02X}, SP: {self.SP:02X}")
 
         self.PC += 1  # Prepare PC for the next instruction's address
-        instruction = self._decode_opcode(opcode)
-        instruction()  # Execute the instruction
-
-    def _decode_opcode(self, opcode):
-        """Decodes the opcode to an instruction method."""
-        opcode_map = {
-            # LDA
-            0xA9: self._LDA_immediate,
-            0xA5: self._LDA_zero_page,
-            0xB5: self._LDA_zero_page_x,
-            0xAD: self._LDA_absolute,
-            0xBD: self._LDA_absolute_x,
-            0xB9: self._LDA_absolute_y,
-            0xA1: self._LDA_indirect_x,
-            0xB1: self._LDA_indirect_y,
-            # STA
-            0x85: self._STA_zero_page,
-            0x95: self._STA_zero_page_x,
-            0x8D: self._STA_absolute,
-            0x9D: self._STA_absolute_x,
-            0x99: self._STA_absolute_y,
-            0x81: self._STA_indirect_x,
-            0x91: self._STA_indirect_y,
-            # INX
-            0xE8: self._INX,
-            # DEX
-            0xCA: self._DEX,
-            # INY
-            0xC8: self._INY,
-            # DEY
-            0x88: self._DEY,
-            # JMP
-            0x4C: self._JMP_absolute,
-            0x6C: self._JMP_indirect,
-            # JSR and RTS
-            0x20: self._JSR,
-            0x60: self._RTS,
-            # Branch Instructions
-            0x10: self._BPL,
-            0x30: self._BMI,
-            0x50: self._BVC,
-            0x70: self._BVS,
-            0x90: self._BCC,
-            0xB0: self._BCS,
-            0xD0: self._BNE,
-            0xF0: self._BEQ,
-            # System Functions
-            0x00: self._BRK,
-            0x40: self._RTI,
-            # Flag Instructions
-            0x18: self._CLC,
-            0x38: self._SEC,
-            0x58: self._CLI,
-            0x78: self._SEI,
-            0xB8: self._CLV,
-            # NOP
-            0xEA: self._NOP,
-            # Add more opcode mappings as needed...
-            0xD8: self._CLD,  # Add this line for CLD
-            0xA2: self._LDX_immediate,  # LDX Immediate
-            0xA6: self._LDX_zero_page,    # LDX Zero Page
-            0xB6: self._LDX_zero_page_y,  # LDX Zero Page,Y
-            0xAE: self._LDX_absolute,     # LDX Absolute
-            0xBE: self._LDX_absolute_y,   # LDX Absolute,Y
-            0xA0: self._LDY_immediate,    # LDY Immediate
-            0xA4: self._LDY_zero_page,    # LDY Zero Page
-            0xB4: self._LDY_zero_page_x,  # LDY Zero Page,X
-            0xAC: self._LDY_absolute,     # LDY Absolute
-            0xBC: self._LDY_absolute_x,   # LDY Absolute,X
-            0xAA: self._TAX,  # TAX
-            0x8A: self._TXA,  # TXA
-            0xA8: self._TAY,  # TAY
-            0x98: self._TYA,  # TYA
-            0x29: self._AND_immediate,  # AND Immediate
-            0x9A: self._TXS,  # TXS
-            0xBA: self._TSX,  # TSX
-            0x48: self._PHA,  # PHA
-            0x68: self._PLA,  # PLA
-            0x86: self._STX_zero_page,  # STX Zero Page
-            # Add other variants of STX as needed
-            0x96: self._STX_zero_page_y,  # STX Zero Page,Y
-            0x8E: self._STX_absolute,     # STX Absolute
-            0x24: self._BIT_zero_page,  # BIT Zero Page
-            0x2C: self._BIT_absolute,   # BIT Absolute (if you need to implement it)
-            0xF8: self._SED,  # SED
-            0x08: self._PHP,  # PHP
-            0x28: self._PLP,  # PLP
-            0x09: self._ORA_immediate,  # ORA Immediate
-            0x05: self._ORA_zero_page,  # ORA Zero Page (if needed)
-            0x15: self._ORA_zero_page_x,  # ORA Zero Page,X (if needed)
-            0x0D: self._ORA_absolute,   # ORA Absolute (if needed)
-            0x1D: self._ORA_absolute_x, # ORA Absolute,X (if needed)
-            0x19: self._ORA_absolute_y, # ORA Absolute,Y (if needed)
-            0x01: self._ORA_indirect_x, # ORA Indexed Indirect (if needed)
-            0x11: self._ORA_indirect_y, # ORA Indirect Indexed (if needed)
-            0x49: self._EOR_immediate,  # EOR Immediate
-            0x45: self._EOR_zero_page,  # EOR Zero Page
-            0x55: self._EOR_zero_page_x,  # EOR Zero Page,X
-            0x4D: self._EOR_absolute,   # EOR Absolute
-            0x5D: self._EOR_absolute_x, # EOR Absolute,X
-            0x59: self._EOR_absolute_y, # EOR Absolute,Y
-            0x41: self._EOR_indirect_x, # EOR Indexed Indirect (Indirect,X)
-            0x51: self._EOR_indirect_y, # EOR Indirect Indexed (Indirect,Y)
-            0x69: self._ADC_immediate,  # ADC Immediate
-            0x65: self._ADC_zero_page,  # ADC Zero Page
-            0x75: self._ADC_zero_page_x,  # ADC Zero Page,X
-            0x6D: self._ADC_absolute,   # ADC Absolute
-            0x7D: self._ADC_absolute_x, # ADC Absolute,X
-            0x79: self._ADC_absolute_y, # ADC Absolute,Y
-            0x61: self._ADC_indirect_x, # ADC Indexed Indirect (Indirect,X)
-            0x71: self._ADC_indirect_y, # ADC Indirect Indexed (Indirect,Y)
-            0xC0: self._CPY_immediate,  # CPY Immediate
-            0xC4: self._CPY_zero_page,  # CPY Zero Page
-            0xCC: self._CPY_absolute,   # CPY Absolute
-            0xE0: self._CPX_immediate,  # CPX Immediate
-            0xE4: self._CPX_zero_page,  # CPX Zero Page
-            0xEC: self._CPX_absolute,   # CPX Absolute
-            0xE9: self._SBC_immediate,  # SBC Immediate
-            0xE5: self._SBC_zero_page,  # SBC Zero Page
-            0xF5: self._SBC_zero_page_x,  # SBC Zero Page,X
-            0xED: self._SBC_absolute,   # SBC Absolute
-            0xFD: self._SBC_absolute_x, # SBC Absolute,X
-            0xF9: self._SBC_absolute_y, # SBC Absolute,Y
-            0xE1: self._SBC_indirect_x, # SBC Indexed Indirect (Indirect,X)
-            0xF1: self._SBC_indirect_y, # SBC Indirect Indexed (Indirect,Y)
-            0x4A: self._LSR_accumulator,  # LSR Accumulator
-            0x46: self._LSR_zero_page,  # LSR Zero Page
-            0x56: self._LSR_zero_page_x,  # LSR Zero Page,X
-            0x4E: self._LSR_absolute,   # LSR Absolute
-            0x5E: self._LSR_absolute_x, # LSR Absolute,X
-            0x0A: self._ASL_accumulator,  # ASL Accumulator
-            0x06: self._ASL_zero_page,  # ASL Zero Page
-            0x16: self._ASL_zero_page_x,  # ASL Zero Page,X
-            0x0E: self._ASL_absolute,   # ASL Absolute
-            0x1E: self._ASL_absolute_x, # ASL Absolute,X
-            0x6A: self._ROR_accumulator,  # ROR Accumulator
-            0x66: self._ROR_zero_page,  # ROR Zero Page
-            0x76: self._ROR_zero_page_x,  # ROR Zero Page,X
-            0x6E: self._ROR_absolute,   # ROR Absolute
-            0x7E: self._ROR_absolute_x, # ROR Absolute,X
-            0x2A: self._ROL_accumulator,  # ROL Accumulator
-            0x26: self._ROL_zero_page,  # ROL Zero Page
-            0x36: self._ROL_zero_page_x,  # ROL Zero Page,X
-            0x2E: self._ROL_absolute,   # ROL Absolute
-            0x3E: self._ROL_absolute_x, # ROL Absolute,X
-            0x21: self._AND_indirect_x,  # AND (Indirect,X)
-            0x25: self._AND_zero_page,   # AND Zero Page
-            0x29: self._AND_immediate,   # AND Immediate
-            0x2D: self._AND_absolute,    # AND Absolute
-            0x31: self._AND_indirect_y,  # AND (Indirect,Y)
-            0x35: self._AND_zero_page_x, # AND Zero Page,X
-            0x39: self._AND_absolute_y,  # AND Absolute,Y
-            0x3D: self._AND_absolute_x,  # AND Absolute,X
-            0xC1: self._CMP_indirect_x,  # CMP (Indirect,X)
-            0xC5: self._CMP_zero_page,   # CMP Zero Page
-            0xC9: self._CMP_immediate,   # CMP Immediate
-            0xCD: self._CMP_absolute,    # CMP Absolute
-            0xD1: self._CMP_indirect_y,  # CMP (Indirect,Y)
-            0xD5: self._CMP_zero_page_x, # CMP Zero Page,X
-            0xD9: self._CMP_absolute_y,  # CMP Absolute,Y
-            0xDD: self._CMP_absolute_x,  # CMP Absolute,X
-            0x84: self._STY_zero_page,  # STY Zero Page
-            0x94: self._STY_zero_page_x,  # STY Zero Page,X
-            0x8C: self._STY_absolute,   # STY Absolute
-            0xE6: self._INC_zero_page,  # INC Zero Page
-            0xF6: self._INC_zero_page_x,  # INC Zero Page,X
-            0xEE: self._INC_absolute,   # INC Absolute
-            0xFE: self._INC_absolute_x, # INC Absolute,X
-            0xC6: self._DEC_zero_page,  # DEC Zero Page
-            0xD6: self._DEC_zero_page_x,  # DEC Zero Page,X
-            0xCE: self._DEC_absolute,   # DEC Absolute
-            0xDE: self._DEC_absolute_x, # DEC Absolute,X
-            0xA7: self._LAX_zero_page,   # LAX Zero Page
-            0xAF: self._LAX_absolute,    # LAX Absolute
-            0xA3: self._LAX_indirect_x,  # LAX (Indirect,X)
-            0xB3: self._LAX_indirect_y,  # LAX (Indirect,Y)
-            0xB7: self._LAX_zero_page_y,
-            0xBF: self._LAX_absolute_y,        
-            0x83: self._SAX_indirect_x,  # Map opcode 0x83 to the SAX (Indirect,X) method   
-            0x87: self._SAX_zero_page,    # SAX Zero Page
-            0x8F: self._SAX_absolute,     # SAX Absolute
-            0x97: self._SAX_zero_page_y,  # SAX Zero Page,Y
-            0x9F: self._SAX_absolute_y,   # SAX Absolute,Y
-            0xEB: self._SBC_immediate_illegal,    # SBC Immediate
-
-            0xC7: self._DCP_zero_page,       # DCP Zero Page
-            0xD7: self._DCP_zero_page_x,     # DCP Zero Page,X
-            0xCF: self._DCP_absolute,        # DCP Absolute
-            0xDF: self._DCP_absolute_x,      # DCP Absolute,X
-            0xDB: self._DCP_absolute_y,      # DCP Absolute,Y
-            0xC3: self._DCP_indirect_x,      # DCP (Indirect,X)
-            0xD3: self._DCP_indirect_y,      # DCP (Indirect,Y)
-
-            0xE3: self._ISC_indirect_x,    # ISC Indirect,X
-            0xE7: self._ISC_zero_page,     # ISC Zero Page
-            0xEF: self._ISC_absolute,      # ISC Absolute
-            0xF3: self._ISC_indirect_y,    # ISC Indirect,Y
-            0xF7: self._ISC_zero_page_x,   # ISC Zero Page,X
-            0xFB: self._ISC_absolute_y,    # ISC Absolute,Y
-            0xFF: self._ISC_absolute_x,    # ISC Absolute,X
-
-            0x07: self._SLO_zero_page,
-            0x17: self._SLO_zero_page_x,
-            0x0F: self._SLO_absolute,
-            0x1F: self._SLO_absolute_x,
-            0x1B: self._SLO_absolute_y,
-            0x03: self._SLO_indirect_x,  # Already defined in previous message
-            0x13: self._SLO_indirect_y,
-
-            0x23: self._RLA_indirect_x,  # RLA (Indirect,X)
-            0x27: self._RLA_zero_page,
-            0x37: self._RLA_zero_page_x,
-            0x2F: self._RLA_absolute,
-            0x3F: self._RLA_absolute_x,
-            0x3B: self._RLA_absolute_y,
-            0x33: self._RLA_indirect_y,
-
-            0x43: self._SRE_indirect_x,
-            0x47: self._SRE_zero_page,
-            0x57: self._SRE_zero_page_x,
-            0x4F: self._SRE_absolute,
-            0x5F: self._SRE_absolute_x,
-            0x5B: self._SRE_absolute_y,
-            0x53: self._SRE_indirect_y,
-
-            0x63: self._RRA_indirect_x,
-            0x67: self._RRA_zero_page,
-            0x73: self._RRA_indirect_y,
-            0x77: self._RRA_zero_page_x,
-            0x6F: self._RRA_absolute,
-            0x7B: self._RRA_absolute_y,
-            0x7F: self._RRA_absolute_x,
-        
-            0x04: self._NOP_illegal_1x,  # Treat 04 as illegal NOP
-            0x44: self._NOP_illegal_1x,  # Handle 44 as an illegal NOP
-            0x64: self._NOP_illegal_1x,  # Handle 64 as an illegal NOP
-            0x0C: self._NOP_illegal_2x,  # Handle 0C as an illegal NOP
-            0x1C: self._NOP_illegal_2x,  # Handle 1C as an illegal NOP
-            0x14: self._NOP_illegal_1x,  # Handle 14 as an illegal NOP
-            0x34: self._NOP_illegal_1x,  # Handle 34 as an illegal NOP
-            0x54: self._NOP_illegal_1x,  # Handle 54 as an illegal NOP
-            0x74: self._NOP_illegal_1x,  # Handle 74 as an illegal NOP
-            0xD4: self._NOP_illegal_1x,  # Handle D4 as an illegal NOP
-            0xF4: self._NOP_illegal_1x,  # Handle F4 as an illegal NOP
-            0x1A: self._NOP_illegal_0x,  # Handle 1A as an illegal NOP
-            0x3A: self._NOP_illegal_0x,  # Handle 3A as an illegal NOP
-            0x5A: self._NOP_illegal_0x,  # Handle 5A as an illegal NOP
-            0x7A: self._NOP_illegal_0x,  # Handle 7A as an illegal NOP
-            0xDA: self._NOP_illegal_0x,  # Handle DA as an illegal NOP
-            0xFA: self._NOP_illegal_0x,  # Handle FA as an illegal NOP
-            0x80: self._NOP_illegal_1x,  # Handle 80 as an illegal NOP
-            0x3C: self._NOP_illegal_2x,  # Handle 3C as an illegal NOP
-            0x5C: self._NOP_illegal_2x,  # Handle 5C as an illegal NOP
-            0x7C: self._NOP_illegal_2x,  # Handle 7C as an illegal NOP
-            0xDC: self._NOP_illegal_2x,  # Handle DC as an illegal NOP
-            0xFC: self._NOP_illegal_2x,  # Handle FC as an illegal NOP
-            # 0xA3: self._NOP_illegal_1x,  # Handle A3 as an illegal NOP
-        }
-        return opcode_map.get(opcode, self._illegal_opcode)
+        instruction = self._dispatch[opcode]
+        # Count cycles up front so register accesses during the instruction
+        # sync devices to (approximately) the cycle on which they happen.
+        self.cycles += _CYCLES[opcode]
+        self._page_crossed = 0
+        instruction(self)  # Execute the instruction
+        if self._page_crossed:
+            self.cycles += _PAGE_PENALTY[opcode]
+
+    # Name of the handler for each opcode. Opcodes missing here run _illegal_opcode.
+    _OPCODE_HANDLERS = {
+        # LDA
+        0xA9: "_LDA_immediate",
+        0xA5: "_LDA_zero_page",
+        0xB5: "_LDA_zero_page_x",
+        0xAD: "_LDA_absolute",
+        0xBD: "_LDA_absolute_x",
+        0xB9: "_LDA_absolute_y",
+        0xA1: "_LDA_indirect_x",
+        0xB1: "_LDA_indirect_y",
+        # STA
+        0x85: "_STA_zero_page",
+        0x95: "_STA_zero_page_x",
+        0x8D: "_STA_absolute",
+        0x9D: "_STA_absolute_x",
+        0x99: "_STA_absolute_y",
+        0x81: "_STA_indirect_x",
+        0x91: "_STA_indirect_y",
+        # INX
+        0xE8: "_INX",
+        # DEX
+        0xCA: "_DEX",
+        # INY
+        0xC8: "_INY",
+        # DEY
+        0x88: "_DEY",
+        # JMP
+        0x4C: "_JMP_absolute",
+        0x6C: "_JMP_indirect",
+        # JSR and RTS
+        0x20: "_JSR",
+        0x60: "_RTS",
+        # Branch Instructions
+        0x10: "_BPL",
+        0x30: "_BMI",
+        0x50: "_BVC",
+        0x70: "_BVS",
+        0x90: "_BCC",
+        0xB0: "_BCS",
+        0xD0: "_BNE",
+        0xF0: "_BEQ",
+        # System Functions
+        0x00: "_BRK",
+        0x40: "_RTI",
+        # Flag Instructions
+        0x18: "_CLC",
+        0x38: "_SEC",
+        0x58: "_CLI",
+        0x78: "_SEI",
+        0xB8: "_CLV",
+        # NOP
+        0xEA: "_NOP",
+        # Add more opcode mappings as needed...
+        0xD8: "_CLD",  # Add this line for CLD
+        0xA2: "_LDX_immediate",  # LDX Immediate
+        0xA6: "_LDX_zero_page",    # LDX Zero Page
+        0xB6: "_LDX_zero_page_y",  # LDX Zero Page,Y
+        0xAE: "_LDX_absolute",     # LDX Absolute
+        0xBE: "_LDX_absolute_y",   # LDX Absolute,Y
+        0xA0: "_LDY_immediate",    # LDY Immediate
+        0xA4: "_LDY_zero_page",    # LDY Zero Page
+        0xB4: "_LDY_zero_page_x",  # LDY Zero Page,X
+        0xAC: "_LDY_absolute",     # LDY Absolute
+        0xBC: "_LDY_absolute_x",   # LDY Absolute,X
+        0xAA: "_TAX",  # TAX
+        0x8A: "_TXA",  # TXA
+        0xA8: "_TAY",  # TAY
+        0x98: "_TYA",  # TYA
+        0x29: "_AND_immediate",  # AND Immediate
+        0x9A: "_TXS",  # TXS
+        0xBA: "_TSX",  # TSX
+        0x48: "_PHA",  # PHA
+        0x68: "_PLA",  # PLA
+        0x86: "_STX_zero_page",  # STX Zero Page
+        # Add other variants of STX as needed
+        0x96: "_STX_zero_page_y",  # STX Zero Page,Y
+        0x8E: "_STX_absolute",     # STX Absolute
+        0x24: "_BIT_zero_page",  # BIT Zero Page
+        0x2C: "_BIT_absolute",   # BIT Absolute (if you need to implement it)
+        0xF8: "_SED",  # SED
+        0x08: "_PHP",  # PHP
+        0x28: "_PLP",  # PLP
+        0x09: "_ORA_immediate",  # ORA Immediate
+        0x05: "_ORA_zero_page",  # ORA Zero Page (if needed)
+        0x15: "_ORA_zero_page_x",  # ORA Zero Page,X (if needed)
+        0x0D: "_ORA_absolute",   # ORA Absolute (if needed)
+        0x1D: "_ORA_absolute_x", # ORA Absolute,X (if needed)
+        0x19: "_ORA_absolute_y", # ORA Absolute,Y (if needed)
+        0x01: "_ORA_indirect_x", # ORA Indexed Indirect (if needed)
+        0x11: "_ORA_indirect_y", # ORA Indirect Indexed (if needed)
+        0x49: "_EOR_immediate",  # EOR Immediate
+        0x45: "_EOR_zero_page",  # EOR Zero Page
+        0x55: "_EOR_zero_page_x",  # EOR Zero Page,X
+        0x4D: "_EOR_absolute",   # EOR Absolute
+        0x5D: "_EOR_absolute_x", # EOR Absolute,X
+        0x59: "_EOR_absolute_y", # EOR Absolute,Y
+        0x41: "_EOR_indirect_x", # EOR Indexed Indirect (Indirect,X)
+        0x51: "_EOR_indirect_y", # EOR Indirect Indexed (Indirect,Y)
+        0x69: "_ADC_immediate",  # ADC Immediate
+        0x65: "_ADC_zero_page",  # ADC Zero Page
+        0x75: "_ADC_zero_page_x",  # ADC Zero Page,X
+        0x6D: "_ADC_absolute",   # ADC Absolute
+        0x7D: "_ADC_absolute_x", # ADC Absolute,X
+        0x79: "_ADC_absolute_y", # ADC Absolute,Y
+        0x61: "_ADC_indirect_x", # ADC Indexed Indirect (Indirect,X)
+        0x71: "_ADC_indirect_y", # ADC Indirect Indexed (Indirect,Y)
+        0xC0: "_CPY_immediate",  # CPY Immediate
+        0xC4: "_CPY_zero_page",  # CPY Zero Page
+        0xCC: "_CPY_absolute",   # CPY Absolute
+        0xE0: "_CPX_immediate",  # CPX Immediate
+        0xE4: "_CPX_zero_page",  # CPX Zero Page
+        0xEC: "_CPX_absolute",   # CPX Absolute
+        0xE9: "_SBC_immediate",  # SBC Immediate
+        0xE5: "_SBC_zero_page",  # SBC Zero Page
+        0xF5: "_SBC_zero_page_x",  # SBC Zero Page,X
+        0xED: "_SBC_absolute",   # SBC Absolute
+        0xFD: "_SBC_absolute_x", # SBC Absolute,X
+        0xF9: "_SBC_absolute_y", # SBC Absolute,Y
+        0xE1: "_SBC_indirect_x", # SBC Indexed Indirect (Indirect,X)
+        0xF1: "_SBC_indirect_y", # SBC Indirect Indexed (Indirect,Y)
+        0x4A: "_LSR_accumulator",  # LSR Accumulator
+        0x46: "_LSR_zero_page",  # LSR Zero Page
+        0x56: "_LSR_zero_page_x",  # LSR Zero Page,X
+        0x4E: "_LSR_absolute",   # LSR Absolute
+        0x5E: "_LSR_absolute_x", # LSR Absolute,X
+        0x0A: "_ASL_accumulator",  # ASL Accumulator
+        0x06: "_ASL_zero_page",  # ASL Zero Page
+        0x16: "_ASL_zero_page_x",  # ASL Zero Page,X
+        0x0E: "_ASL_absolute",   # ASL Absolute
+        0x1E: "_ASL_absolute_x", # ASL Absolute,X
+        0x6A: "_ROR_accumulator",  # ROR Accumulator
+        0x66: "_ROR_zero_page",  # ROR Zero Page
+        0x76: "_ROR_zero_page_x",  # ROR Zero Page,X
+        0x6E: "_ROR_absolute",   # ROR Absolute
+        0x7E: "_ROR_absolute_x", # ROR Absolute,X
+        0x2A: "_ROL_accumulator",  # ROL Accumulator
+        0x26: "_ROL_zero_page",  # ROL Zero Page
+        0x36: "_ROL_zero_page_x",  # ROL Zero Page,X
+        0x2E: "_ROL_absolute",   # ROL Absolute
+        0x3E: "_ROL_absolute_x", # ROL Absolute,X
+        0x21: "_AND_indirect_x",  # AND (Indirect,X)
+        0x25: "_AND_zero_page",   # AND Zero Page
+        0x29: "_AND_immediate",   # AND Immediate
+        0x2D: "_AND_absolute",    # AND Absolute
+        0x31: "_AND_indirect_y",  # AND (Indirect,Y)
+        0x35: "_AND_zero_page_x", # AND Zero Page,X
+        0x39: "_AND_absolute_y",  # AND Absolute,Y
+        0x3D: "_AND_absolute_x",  # AND Absolute,X
+        0xC1: "_CMP_indirect_x",  # CMP (Indirect,X)
+        0xC5: "_CMP_zero_page",   # CMP Zero Page
+        0xC9: "_CMP_immediate",   # CMP Immediate
+        0xCD: "_CMP_absolute",    # CMP Absolute
+        0xD1: "_CMP_indirect_y",  # CMP (Indirect,Y)
+        0xD5: "_CMP_zero_page_x", # CMP Zero Page,X
+        0xD9: "_CMP_absolute_y",  # CMP Absolute,Y
+        0xDD: "_CMP_absolute_x",  # CMP Absolute,X
+        0x84: "_STY_zero_page",  # STY Zero Page
+        0x94: "_STY_zero_page_x",  # STY Zero Page,X
+        0x8C: "_STY_absolute",   # STY Absolute
+        0xE6: "_INC_zero_page",  # INC Zero Page
+        0xF6: "_INC_zero_page_x",  # INC Zero Page,X
+        0xEE: "_INC_absolute",   # INC Absolute
+        0xFE: "_INC_absolute_x", # INC Absolute,X
+        0xC6: "_DEC_zero_page",  # DEC Zero Page
+        0xD6: "_DEC_zero_page_x",  # DEC Zero Page,X
+        0xCE: "_DEC_absolute",   # DEC Absolute
+        0xDE: "_DEC_absolute_x", # DEC Absolute,X
+        0xA7: "_LAX_zero_page",   # LAX Zero Page
+        0xAF: "_LAX_absolute",    # LAX Absolute
+        0xA3: "_LAX_indirect_x",  # LAX (Indirect,X)
+        0xB3: "_LAX_indirect_y",  # LAX (Indirect,Y)
+        0xB7: "_LAX_zero_page_y",
+        0xBF: "_LAX_absolute_y",        
+        0x83: "_SAX_indirect_x",  # Map opcode 0x83 to the SAX (Indirect,X) method   
+        0x87: "_SAX_zero_page",    # SAX Zero Page
+        0x8F: "_SAX_absolute",     # SAX Absolute
+        0x97: "_SAX_zero_page_y",  # SAX Zero Page,Y
+        0x9F: "_SAX_absolute_y",   # SAX Absolute,Y
+        0xEB: "_SBC_immediate_illegal",    # SBC Immediate
+
+        0xC7: "_DCP_zero_page",       # DCP Zero Page
+        0xD7: "_DCP_zero_page_x",     # DCP Zero Page,X
+        0xCF: "_DCP_absolute",        # DCP Absolute
+        0xDF: "_DCP_absolute_x",      # DCP Absolute,X
+        0xDB: "_DCP_absolute_y",      # DCP Absolute,Y
+        0xC3: "_DCP_indirect_x",      # DCP (Indirect,X)
+        0xD3: "_DCP_indirect_y",      # DCP (Indirect,Y)
+
+        0xE3: "_ISC_indirect_x",    # ISC Indirect,X
+        0xE7: "_ISC_zero_page",     # ISC Zero Page
+        0xEF: "_ISC_absolute",      # ISC Absolute
+        0xF3: "_ISC_indirect_y",    # ISC Indirect,Y
+        0xF7: "_ISC_zero_page_x",   # ISC Zero Page,X
+        0xFB: "_ISC_absolute_y",    # ISC Absolute,Y
+        0xFF: "_ISC_absolute_x",    # ISC Absolute,X
+
+        0x07: "_SLO_zero_page",
+        0x17: "_SLO_zero_page_x",
+        0x0F: "_SLO_absolute",
+        0x1F: "_SLO_absolute_x",
+        0x1B: "_SLO_absolute_y",
+        0x03: "_SLO_indirect_x",  # Already defined in previous message
+        0x13: "_SLO_indirect_y",
+
+        0x23: "_RLA_indirect_x",  # RLA (Indirect,X)
+        0x27: "_RLA_zero_page",
+        0x37: "_RLA_zero_page_x",
+        0x2F: "_RLA_absolute",
+        0x3F: "_RLA_absolute_x",
+        0x3B: "_RLA_absolute_y",
+        0x33: "_RLA_indirect_y",
+
+        0x43: "_SRE_indirect_x",
+        0x47: "_SRE_zero_page",
+        0x57: "_SRE_zero_page_x",
+        0x4F: "_SRE_absolute",
+        0x5F: "_SRE_absolute_x",
+        0x5B: "_SRE_absolute_y",
+        0x53: "_SRE_indirect_y",
+
+        0x63: "_RRA_indirect_x",
+        0x67: "_RRA_zero_page",
+        0x73: "_RRA_indirect_y",
+        0x77: "_RRA_zero_page_x",
+        0x6F: "_RRA_absolute",
+        0x7B: "_RRA_absolute_y",
+        0x7F: "_RRA_absolute_x",
+    
+        0x04: "_NOP_illegal_1x",  # Treat 04 as illegal NOP
+        0x44: "_NOP_illegal_1x",  # Handle 44 as an illegal NOP
+        0x64: "_NOP_illegal_1x",  # Handle 64 as an illegal NOP
+        0x0C: "_NOP_illegal_2x",  # Handle 0C as an illegal NOP
+        0x1C: "_NOP_illegal_absolute_x",  # Handle 1C as an illegal NOP
+        0x14: "_NOP_illegal_1x",  # Handle 14 as an illegal NOP
+        0x34: "_NOP_illegal_1x",  # Handle 34 as an illegal NOP
+        0x54: "_NOP_illegal_1x",  # Handle 54 as an illegal NOP
+        0x74: "_NOP_illegal_1x",  # Handle 74 as an illegal NOP
+        0xD4: "_NOP_illegal_1x",  # Handle D4 as an illegal NOP
+        0xF4: "_NOP_illegal_1x",  # Handle F4 as an illegal NOP
+        0x1A: "_NOP_illegal_0x",  # Handle 1A as an illegal NOP
+        0x3A: "_NOP_illegal_0x",  # Handle 3A as an illegal NOP
+        0x5A: "_NOP_illegal_0x",  # Handle 5A as an illegal NOP
+        0x7A: "_NOP_illegal_0x",  # Handle 7A as an illegal NOP
+        0xDA: "_NOP_illegal_0x",  # Handle DA as an illegal NOP
+        0xFA: "_NOP_illegal_0x",  # Handle FA as an illegal NOP
+        0x80: "_NOP_illegal_1x",  # Handle 80 as an illegal NOP
+        0x3C: "_NOP_illegal_absolute_x",  # Handle 3C as an illegal NOP
+        0x5C: "_NOP_illegal_absolute_x",  # Handle 5C as an illegal NOP
+        0x7C: "_NOP_illegal_absolute_x",  # Handle 7C as an illegal NOP
+        0xDC: "_NOP_illegal_absolute_x",  # Handle DC as an illegal NOP
+        0xFC: "_NOP_illegal_absolute_x",  # Handle FC as an illegal NOP
+        # 0xA3: "_NOP_illegal_1x",  # Handle A3 as an illegal NOP
+    }
+
+    # Superinstructions
+    #
+    # With fuse set, step() runs these common sequences of ROM code in one
+    # dispatch. Every instruction but the last only touches registers or zero
+    # page, and fusing only happens when no device sync falls due before the
+    # last instruction, so the result and cycle count match stepping each one.
+    # Handlers get the address of the first opcode; the caller has already
+    # added the base cycles of the whole sequence.
+
+    # (opcodes, instruction lengths, handler)
+    _FUSIONS = (
+        ((0xCA, 0xD0), (1, 2), "_fused_DEX_BNE"),
+        ((0x88, 0xD0), (1, 2), "_fused_DEY_BNE"),
+        ((0xE8, 0xD0), (1, 2), "_fused_INX_BNE"),
+        ((0xC8, 0xD0), (1, 2), "_fused_INY_BNE"),
+        ((0xC9, 0xF0), (2, 2), "_fused_CMP_BEQ"),
+        ((0xC9, 0xD0), (2, 2), "_fused_CMP_BNE"),
+        ((0xA5, 0x8D), (2, 3), "_fused_LDA_STA"),
+        ((0xE6, 0xA5), (2, 2), "_fused_INC_LDA"),
+        ((0xA5, 0xF0), (2, 2), "_fused_LDA_BEQ"),
+        ((0xA5, 0xD0), (2, 2), "_fused_LDA_BNE"),
+        ((0xA5, 0xC9, 0xD0), (2, 2, 2), "_fused_LDA_CMP_BNE"),
+    )
+
+    def _step_fused(self, opcode, pc):
+        """Runs a superinstruction starting at pc if one matches; returns whether one ran."""
+        if pc < 0x8000:
+            return False
+        rom = self._rom
+        base = pc - 0x8000
+        for pattern, length, prefix_cycles, cycles, handler, name in self._fusions[opcode]:
+            if self.cycles + prefix_cycles >= self._sync_cycle or base + length > 0x8000:
+                continue
+            for offset, expected in pattern:
+                if rom[base + offset] != expected:
+                    break
+            else:
+                self.cycles += cycles
+                handler(self, pc)
+                self.instructions += len(pattern)   # step() counted the first one
+                counts = self.fused_counts
+                counts[name] = counts.get(name, 0) + 1
+                return True
+        return False
+
+    def fusion_rate(self):
+        """Fraction of instructions run inside superinstructions since fuse was set."""
+        sizes = {name: len(opcodes) for opcodes, _, name in self._FUSIONS}
+        fused = sum(count * sizes[name] for name, count in self.fused_counts.items())
+        total = fused + self.unfused
+        return fused / total if total else 0.0
+
+    def _fused_branch(self, taken, pc):
+        """Finishes a sequence ending in a branch whose opcode is at pc."""
+        self.PC = pc + 2
+        if taken:
+            offset = self._rom[pc - 0x7FFF]
+            self._branch(offset - 0x100 if offset & 0x80 else offset)
+
+    def _fused_DEX_BNE(self, pc):
+        value = self.X = (self.X - 1) & 0xFF
+        self.Z = value == 0
+        self.N = value >= 0x80
+        self._fused_branch(value, pc + 1)
+
+    def _fused_DEY_BNE(self, pc):
+        value = self.Y = (self.Y - 1) & 0xFF
+        self.Z = value == 0
+        self.N = value >= 0x80
+        self._fused_branch(value, pc + 1)
+
+    def _fused_INX_BNE(self, pc):
+        value = self.X = (self.X + 1) & 0xFF
+        self.Z = value == 0
+        self.N = value >= 0x80
+        self._fused_branch(value, pc + 1)
+
+    def _fused_INY_BNE(self, pc):
+        value = self.Y = (self.Y + 1) & 0xFF
+        self.Z = value == 0
+        self.N = value >= 0x80
+        self._fused_branch(value, pc + 1)
+
+    def _fused_CMP_BEQ(self, pc):
+        self._compare(self.A, self._rom[pc - 0x7FFF])
+        self._fused_branch(self.Z, pc + 2)
+
+    def _fused_CMP_BNE(self, pc):
+        self._compare(self.A, self._rom[pc - 0x7FFF])
+        self._fused_branch(not self.Z, pc + 2)
+
+    def _fused_LDA_STA(self, pc):
+        rom = self._rom
+        base = pc - 0x8000
+        value = self.A = self._ram[rom[base + 1]]
+        self.Z = value == 0
+        self.N = value >= 0x80
+        self.PC = pc + 5
+        self._write_byte(rom[base + 3] | (rom[base + 4] << 8), value)
+
+    def _fused_INC_LDA(self, pc):
+        rom = self._rom
+        base = pc - 0x8000
+        addr = rom[base + 1]
+        self._write_zero_page(addr, self._ram[addr] + 1)
+        value = self.A = self._ram[rom[base + 3]]
+        self.Z = value == 0
+        self.N = value >= 0x80
+        self.PC = pc + 4
+
+    def _fused_LDA_BEQ(self, pc):
+        value = self.A = self._ram[self._rom[pc - 0x7FFF]]
+        self.Z = value == 0
+        self.N = value >= 0x80
+        self._fused_branch(not value, pc + 2)
+
+    def _fused_LDA_BNE(self, pc):
+        value = self.A = self._ram[self._rom[pc - 0x7FFF]]
+        self.Z = value == 0
+        self.N = value >= 0x80
+        self._fused_branch(value, pc + 2)
+
+    def _fused_LDA_CMP_BNE(self, pc):
+        self.A = self._ram[self._rom[pc - 0x7FFF]]
+        self._compare(self.A, self._rom[pc - 0x7FFD])
+        self._fused_branch(not self.Z, pc + 4)
 
     def _NOP_illegal_0x(self):
         """Handle the illegal opcode 04 as a NOP (No Operation)."""
@@ -413,6 +1294,10 @@ class Ricoh2A03:
         """Handle the illegal opcode 04 as a NOP (No Operation)."""
         self.PC += 2  # Increment program counter if necessary, depending on actual behavior.
 
+    def _NOP_illegal_absolute_x(self):
+        """Handle the illegal absolute,X NOPs, which read (and may cross a page) like LDA."""
+        self._absolute_x()
+
     def _NOP_illegal_3x(self):
         """Handle the illegal opcode 04 as a NOP (No Operation)."""
         self.PC += 3  # Increment program counter if necessary, depending on actual behavior.
@@ -447,9 +1332,8 @@ class Ricoh2A03:
 
     def _read_word_zero_page(self, addr):
         """Read a 16-bit address from zero-page, wrapping around the zero-page if necessary."""
-        lo = self._read_byte(addr)
-        hi = self._read_byte((addr + 1) & 0xFF)  # Wrap around zero-page
-        return (hi << 8) | lo
+        ram = self._ram
+        return ram[addr] | (ram[(addr + 1) & 0xFF] << 8)  # Wrap around zero-page
 
 
     # Instruction implementations
@@ -467,21 +1351,21 @@ class Ricoh2A03:
 
     def _RRA_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         old_carry = self.C
         self.C = value & 0x01
         value = (value >> 1) | (old_carry << 7)
-        self._write_byte(addr, value)
+        self._write_zero_page(addr, value)
         self._adc(value)
 
 
     def _RRA_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         old_carry = self.C
         self.C = value & 0x01
         value = (value >> 1) | (old_carry << 7)
-        self._write_byte(addr, value)
+        self._write_zero_page(addr, value)
         self._adc(value)
 
 
@@ -539,20 +1423,20 @@ class Ricoh2A03:
 
     def _SRE_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self.C = value & 0x01
         value >>= 1
-        self._write_byte(addr, value)
+        self._write_zero_page(addr, value)
         self.A ^= value
         self._set_flags(self.A)
 
 
     def _SRE_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self.C = value & 0x01
         value >>= 1
-        self._write_byte(addr, value)
+        self._write_zero_page(addr, value)
         self.A ^= value
         self._set_flags(self.A)
 
@@ -612,22 +1496,22 @@ class Ricoh2A03:
 
     def _RLA_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         old_carry = self.C
         self.C = (value >> 7) & 1
         value = ((value << 1) | old_carry) & 0xFF
-        self._write_byte(addr, value)
+        self._write_zero_page(addr, value)
         self.A &= value
         self._set_flags(self.A)
 
 
     def _RLA_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         old_carry = self.C
         self.C = (value >> 7) & 1
         value = ((value << 1) | old_carry) & 0xFF
-        self._write_byte(addr, value)
+        self._write_zero_page(addr, value)
         self.A &= value
         self._set_flags(self.A)
 
@@ -678,19 +1562,19 @@ class Ricoh2A03:
 
     def _SLO_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self.C = (value >> 7) & 1
         value = (value << 1) & 0xFF
-        self._write_byte(addr, value)
+        self._write_zero_page(addr, value)
         self.A |= value
         self._set_flags(self.A)
 
     def _SLO_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self.C = (value >> 7) & 1
         value = (value << 1) & 0xFF
-        self._write_byte(addr, value)
+        self._write_zero_page(addr, value)
         self.A |= value
         self._set_flags(self.A)
 
@@ -746,14 +1630,14 @@ class Ricoh2A03:
 
     def _ISC_zero_page(self):
         addr = self._zero_page()
-        value = (self._read_byte(addr) + 1) & 0xFF
-        self._write_byte(addr, value)
+        value = (self._ram[addr] + 1) & 0xFF
+        self._write_zero_page(addr, value)
         self._sbc(value)
 
     def _ISC_zero_page_x(self):
         addr = self._zero_page_x()
-        value = (self._read_byte(addr) + 1) & 0xFF
-        self._write_byte(addr, value)
+        value = (self._ram[addr] + 1) & 0xFF
+        self._write_zero_page(addr, value)
         self._sbc(value)
 
     def _ISC_absolute(self):
@@ -789,16 +1673,16 @@ class Ricoh2A03:
 
     def _DCP_zero_page(self):
         addr = self._zero_page()  # Fetch the zero-page address
-        value = self._read_byte(addr)  # Read the value from the specified address
+        value = self._ram[addr]  # Read the value from the specified address
         decremented_value = (value - 1) & 0xFF  # Decrement the value and ensure it wraps around 0xFF
-        self._write_byte(addr, decremented_value)  # Write the decremented value back to the same address
+        self._write_zero_page(addr, decremented_value)  # Write the decremented value back to the same address
         self._compare(self.A, decremented_value)  # Compare the accumulator with the decremented value
 
     def _DCP_zero_page_x(self):
         addr = self._zero_page_x()  # Calculate the zero-page address offset by X
-        value = self._read_byte(addr)  # Read the current value from the calculated address
+        value = self._ram[addr]  # Read the current value from the calculated address
         decremented_value = (value - 1) & 0xFF  # Decrement the value and ensure it wraps around at 0xFF
-        self._write_byte(addr, decremented_value)  # Write the decremented value back to memory at the same address
+        self._write_zero_page(addr, decremented_value)  # Write the decremented value back to memory at the same address
         self._compare(self.A, decremented_value)  # Compare the decremented value with the accumulator
 
     def _DCP_absolute(self):
@@ -868,7 +1752,7 @@ class Ricoh2A03:
         value_to_store = self.A & self.X
         
         # Write the computed value to the calculated zero page address
-        self._write_byte(addr, value_to_store)
+        self._write_zero_page(addr, value_to_store)
         
     def _SAX_absolute(self):
         # Fetch the absolute address from the next two bytes in the program counter
@@ -890,7 +1774,7 @@ class Ricoh2A03:
         value_to_store = self.A & self.X
 
         # Write the computed value to the zero-page address
-        self._write_byte(addr, value_to_store)
+        self._write_zero_page(addr, value_to_store)
 
     def _SAX_indirect_x(self):
         # Fetch the zero-page address to start from, then add X to it for indirect indexing
@@ -907,9 +1791,7 @@ class Ricoh2A03:
         
     def _LAX_absolute_y(self):
         # Calculate the absolute address from the next two program bytes and add the Y register
-        base_addr = self._read_word(self.PC)
-        self.PC += 2  # Move program counter past the two bytes of the address
-        addr = (base_addr + self.Y) & 0xFFFF  # Ensure correct wrapping for 16-bit addresses
+        addr = self._absolute_y()
 
         value = self._read_byte(addr)  # Read the value from memory at the calculated address
 
@@ -924,7 +1806,7 @@ class Ricoh2A03:
         # Fetch zero-page address from next program byte and add Y with zero-page wrapping
         addr = (self._read_byte(self.PC) + self.Y) & 0xFF
         self.PC += 1  # Increment program counter after reading the address
-        value = self._read_byte(addr)  # Read the value from the computed address
+        value = self._ram[addr]  # Read the value from the computed address
 
         # Load the value into both the accumulator (A) and the X register
         self.A = value
@@ -949,7 +1831,7 @@ class Ricoh2A03:
         
     def _LAX_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self.A = value
         self.X = value
         self._set_flags(value)
@@ -964,17 +1846,17 @@ class Ricoh2A03:
     def _DEC_zero_page(self):
         """DEC Zero Page - Decrement the value in zero page memory location."""
         addr = self._zero_page()  # Fetch the zero page address
-        value = self._read_byte(addr)  # Read the current value from memory
+        value = self._ram[addr]  # Read the current value from memory
         value = (value - 1) & 0xFF  # Decrement the value and ensure it wraps at 0xFF
-        self._write_byte(addr, value)  # Write the decremented value back to memory
+        self._write_zero_page(addr, value)  # Write the decremented value back to memory
         self._set_flags(value)  # Update the zero and negative flags based on the new value
 
     def _DEC_zero_page_x(self):
         """DEC Zero Page,X - Decrement the value in zero page memory location offset by X."""
         addr = self._zero_page_x()  # Fetch the zero page address offset by X
-        value = self._read_byte(addr)  # Read the current value from memory
+        value = self._ram[addr]  # Read the current value from memory
         value = (value - 1) & 0xFF  # Decrement the value and wrap at 0xFF
-        self._write_byte(addr, value)  # Write back the decremented value
+        self._write_zero_page(addr, value)  # Write back the decremented value
         self._set_flags(value)  # Update flags
 
 
@@ -998,18 +1880,18 @@ class Ricoh2A03:
     def _INC_zero_page(self):
         """INC Zero Page - Increment the value in zero page memory location."""
         addr = self._zero_page()  # Fetch the zero page address
-        value = self._read_byte(addr)  # Read the current value from memory
+        value = self._ram[addr]  # Read the current value from memory
         value = (value + 1) & 0xFF  # Increment the value and ensure it wraps at 0xFF
-        self._write_byte(addr, value)  # Write the incremented value back to memory
+        self._write_zero_page(addr, value)  # Write the incremented value back to memory
         self._set_flags(value)  # Update the zero and negative flags based on the new value
 
 
     def _INC_zero_page_x(self):
         """INC Zero Page,X - Increment the value in zero page memory location offset by X."""
         addr = self._zero_page_x()  # Fetch the zero page address offset by X
-        value = self._read_byte(addr)  # Read the current value from memory
+        value = self._ram[addr]  # Read the current value from memory
         value = (value + 1) & 0xFF  # Increment the value and wrap at 0xFF
-        self._write_byte(addr, value)  # Write back the incremented value
+        self._write_zero_page(addr, value)  # Write back the incremented value
         self._set_flags(value)  # Update flags
 
 
@@ -1033,12 +1915,12 @@ class Ricoh2A03:
     def _STY_zero_page(self):
         """STY Zero Page - Store Y register in zero page memory location."""
         addr = self._zero_page()  # Fetch the zero page address
-        self._write_byte(addr, self.Y)  # Write the Y register's value to memory
+        self._write_zero_page(addr, self.Y)  # Write the Y register's value to memory
 
     def _STY_zero_page_x(self):
         """STY Zero Page,X - Store Y register in zero page memory location offset by X."""
         addr = self._zero_page_x()  # Fetch the zero page address offset by X
-        self._write_byte(addr, self.Y)  # Write the Y register's value to memory
+        self._write_zero_page(addr, self.Y)  # Write the Y register's value to memory
 
 
     def _STY_absolute(self):
@@ -1059,13 +1941,13 @@ class Ricoh2A03:
 
     def _CMP_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self._compare(self.A, value)
 
 
     def _CMP_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self._compare(self.A, value)
 
 
@@ -1107,13 +1989,13 @@ class Ricoh2A03:
 
     def _AND_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self.A &= value
         self._set_flags(self.A)
 
     def _AND_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self.A &= value
         self._set_flags(self.A)
 
@@ -1149,174 +2031,113 @@ class Ricoh2A03:
         self.A &= value
         self._set_flags(self.A)
 
+    def _rol(self, value):
+        """Rotates value left through carry; returns the result."""
+        result = ((value << 1) | self.C) & 0xFF
+        self.C = (value >> 7) & 0x01  # Carry takes the old bit 7
+        self._set_flags(result)
+        return result
+
+    def _ror(self, value):
+        """Rotates value right through carry; returns the result."""
+        result = (value >> 1) | (self.C << 7)
+        self.C = value & 0x01  # Carry takes the old bit 0
+        self._set_flags(result)
+        return result
+
+    def _asl(self, value):
+        """Shifts value left into carry; returns the result."""
+        result = (value << 1) & 0xFE
+        self.C = (value >> 7) & 0x01
+        self._set_flags(result)
+        return result
+
+    def _lsr(self, value):
+        """Shifts value right into carry; returns the result."""
+        result = value >> 1
+        self.C = value & 0x01
+        self._set_flags(result)
+        return result
+
     def _ROL_accumulator(self):
         """ROL Accumulator - Rotate Left the accumulator."""
-        old_carry = self.C
-        self.C = (self.A >> 7) & 0x01  # Set the carry flag to the old bit 7
-        self.A = ((self.A << 1) | old_carry) & 0xFF  # Rotate left through carry
-        self._set_flags(self.A)  # Update the zero and negative flags
+        self.A = self._rol(self.A)
 
     def _ROL_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
-        old_carry = self.C
-        self.C = (value >> 7) & 0x01
-        value = ((value << 1) | old_carry) & 0xFF
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_zero_page(addr, self._rol(self._ram[addr]))
 
     def _ROL_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
-        old_carry = self.C
-        self.C = (value >> 7) & 0x01
-        value = ((value << 1) | old_carry) & 0xFF
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_zero_page(addr, self._rol(self._ram[addr]))
 
     def _ROL_absolute(self):
         addr = self._absolute()
-        value = self._read_byte(addr)
-        old_carry = self.C
-        self.C = (value >> 7) & 0x01
-        value = ((value << 1) | old_carry) & 0xFF
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_byte(addr, self._rol(self._read_byte(addr)))
 
     def _ROL_absolute_x(self):
         addr = self._absolute_x()
-        value = self._read_byte(addr)
-        old_carry = self.C
-        self.C = (value >> 7) & 0x01
-        value = ((value << 1) | old_carry) & 0xFF
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_byte(addr, self._rol(self._read_byte(addr)))
 
     def _ROR_accumulator(self):
         """ROR Accumulator - Rotate Right the accumulator."""
-        old_carry = self.C
-        self.C = self.A & 0x01  # Set the carry flag to the old bit 0
-        self.A = (self.A >> 1) | (old_carry << 7)  # Rotate right through carry
-        self._set_flags(self.A)  # Update the zero and negative flags
+        self.A = self._ror(self.A)
 
     def _ROR_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
-        old_carry = self.C
-        self.C = value & 0x01
-        value = (value >> 1) | (old_carry << 7)
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_zero_page(addr, self._ror(self._ram[addr]))
 
     def _ROR_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
-        old_carry = self.C
-        self.C = value & 0x01
-        value = (value >> 1) | (old_carry << 7)
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_zero_page(addr, self._ror(self._ram[addr]))
 
     def _ROR_absolute(self):
         addr = self._absolute()
-        value = self._read_byte(addr)
-        old_carry = self.C
-        self.C = value & 0x01
-        value = (value >> 1) | (old_carry << 7)
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_byte(addr, self._ror(self._read_byte(addr)))
 
     def _ROR_absolute_x(self):
         addr = self._absolute_x()
-        value = self._read_byte(addr)
-        old_carry = self.C
-        self.C = value & 0x01
-        value = (value >> 1) | (old_carry << 7)
-        self._write_byte(addr, value)
-        self._set_flags(value)
-
+        self._write_byte(addr, self._ror(self._read_byte(addr)))
 
     def _ASL_accumulator(self):
         """ASL Accumulator - Arithmetic Shift Left the accumulator."""
-        self.C = (self.A >> 7) & 0x01  # Set the carry flag to the old bit 7
-        self.A = (self.A << 1) & 0xFE  # Perform the shift, ensure bit 0 is 0
-        self._set_flags(self.A)  # Update the zero and negative flags
+        self.A = self._asl(self.A)
 
     def _ASL_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
-        self.C = (value >> 7) & 0x01
-        value = (value << 1) & 0xFE
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_zero_page(addr, self._asl(self._ram[addr]))
 
     def _ASL_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
-        self.C = (value >> 7) & 0x01
-        value = (value << 1) & 0xFE
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_zero_page(addr, self._asl(self._ram[addr]))
 
     def _ASL_absolute(self):
         addr = self._absolute()
-        value = self._read_byte(addr)
-        self.C = (value >> 7) & 0x01
-        value = (value << 1) & 0xFE
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_byte(addr, self._asl(self._read_byte(addr)))
 
     def _ASL_absolute_x(self):
         addr = self._absolute_x()
-        value = self._read_byte(addr)
-        self.C = (value >> 7) & 0x01
-        value = (value << 1) & 0xFE
-        self._write_byte(addr, value)
-        self._set_flags(value)
-
+        self._write_byte(addr, self._asl(self._read_byte(addr)))
 
     def _LSR_accumulator(self):
         """LSR Accumulator - Logical Shift Right the accumulator."""
-        self.C = self.A & 0x01  # Set the carry flag to the old bit 0
-        self.A >>= 1  # Perform the shift
-        self.A &= 0x7F  # Ensure bit 7 is 0
-        self._set_flags(self.A)  # Update the zero and negative flags
+        self.A = self._lsr(self.A)
 
     def _LSR_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
-        self.C = value & 0x01
-        value >>= 1
-        value &= 0x7F
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_zero_page(addr, self._lsr(self._ram[addr]))
 
     def _LSR_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
-        self.C = value & 0x01
-        value >>= 1
-        value &= 0x7F
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_zero_page(addr, self._lsr(self._ram[addr]))
 
     def _LSR_absolute(self):
         addr = self._absolute()
-        value = self._read_byte(addr)
-        self.C = value & 0x01
-        value >>= 1
-        value &= 0x7F
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_byte(addr, self._lsr(self._read_byte(addr)))
 
     def _LSR_absolute_x(self):
         addr = self._absolute_x()
-        value = self._read_byte(addr)
-        self.C = value & 0x01
-        value >>= 1
-        value &= 0x7F
-        self._write_byte(addr, value)
-        self._set_flags(value)
+        self._write_byte(addr, self._lsr(self._read_byte(addr)))
 
     def _SBC_immediate(self):
         """SBC Immediate - Subtract with carry the accumulator with an immediate value."""
@@ -1335,12 +2156,12 @@ class Ricoh2A03:
 
     def _SBC_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self._sbc(value)
 
     def _SBC_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self._sbc(value)
 
     def _SBC_absolute(self):
@@ -1376,7 +2197,7 @@ class Ricoh2A03:
 
     def _CPX_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self._compare(self.X, value)
 
     def _CPX_absolute(self):
@@ -1391,7 +2212,7 @@ class Ricoh2A03:
 
     def _CPY_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self._compare(self.Y, value)
 
     def _CPY_absolute(self):
@@ -1418,12 +2239,12 @@ class Ricoh2A03:
 
     def _ADC_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self._adc(value)
 
     def _ADC_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self._adc(value)
 
     def _ADC_absolute(self):
@@ -1459,13 +2280,13 @@ class Ricoh2A03:
 
     def _EOR_zero_page(self):
         addr = self._zero_page()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self.A ^= value
         self._set_flags(self.A)
 
     def _EOR_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self.A ^= value
         self._set_flags(self.A)
 
@@ -1502,7 +2323,7 @@ class Ricoh2A03:
     def _ORA_zero_page(self):
         """ORA Zero Page - Logical Inclusive OR with the accumulator."""
         addr = self._zero_page()  # Fetch the zero page address
-        value = self._read_byte(addr)  # Read the value from memory
+        value = self._ram[addr]  # Read the value from memory
         self.A |= value  # Perform bitwise OR
         self._set_flags(self.A)  # Update flags
 
@@ -1514,7 +2335,7 @@ class Ricoh2A03:
 
     def _ORA_zero_page_x(self):
         addr = self._zero_page_x()
-        value = self._read_byte(addr)
+        value = self._ram[addr]
         self.A |= value
         self._set_flags(self.A)
 
@@ -1569,7 +2390,7 @@ class Ricoh2A03:
     def _BIT_zero_page(self):
         """BIT Zero Page - Test bits in memory with accumulator."""
         addr = self._zero_page()  # Fetch the zero page address
-        value = self._read_byte(addr)  # Read the value from memory
+        value = self._ram[addr]  # Read the value from memory
         test = self.A & value  # AND operation with accumulator
         self.Z = (test == 0)  # Set Zero flag
         self.N = (value & 0x80) != 0  # Set Negative flag from bit 7
@@ -1588,7 +2409,7 @@ class Ricoh2A03:
         """STX Zero Page,Y - Store X register to zero page address offset by Y."""
         addr = (self._read_byte(self.PC) + self.Y) & 0xFF
         self.PC += 1
-        self._write_byte(addr, self.X)
+        self._write_zero_page(addr, self.X)
 
     def _STX_absolute(self):
         """STX Absolute - Store X register to an absolute address."""
@@ -1598,7 +2419,7 @@ class Ricoh2A03:
     def _STX_zero_page(self):
         """STX Zero Page - Store X register to zero page address."""
         addr = self._zero_page()  # Fetch the zero page address
-        self._write_byte(addr, self.X)  # Store the value of X register at the address
+        self._write_zero_page(addr, self.X)  # Store the value of X register at the address
 
 
     def _PLA(self):
@@ -1651,12 +2472,12 @@ class Ricoh2A03:
 
     def _LDY_zero_page(self):
         addr = self._zero_page()
-        self.Y = self._read_byte(addr)
+        self.Y = self._ram[addr]
         self._set_flags(self.Y)
 
     def _LDY_zero_page_x(self):
         addr = self._zero_page_x()
-        self.Y = self._read_byte(addr)
+        self.Y = self._ram[addr]
         self._set_flags(self.Y)
 
     def _LDY_absolute(self):
@@ -1672,12 +2493,12 @@ class Ricoh2A03:
 
     def _LDX_zero_page(self):
         addr = self._zero_page()
-        self.X = self._read_byte(addr)
+        self.X = self._ram[addr]
         self._set_flags(self.X)
 
     def _LDX_zero_page_y(self):
         addr = self._zero_page_y()
-        self.X = self._read_byte(addr)
+        self.X = self._ram[addr]
         self._set_flags(self.X)
 
     def _LDX_absolute(self):
@@ -1709,12 +2530,12 @@ class Ricoh2A03:
 
     def _LDA_zero_page(self):
         addr = self._zero_page()
-        self.A = self._read_byte(addr)
+        self.A = self._ram[addr]
         self._set_flags(self.A)
 
     def _LDA_zero_page_x(self):
         addr = self._zero_page_x()
-        self.A = self._read_byte(addr)
+        self.A = self._ram[addr]
         self._set_flags(self.A)
 
     def _LDA_absolute(self):
@@ -1745,11 +2566,11 @@ class Ricoh2A03:
 
     def _STA_zero_page(self):
         addr = self._zero_page()
-        self._write_byte(addr, self.A)
+        self._write_zero_page(addr, self.A)
 
     def _STA_zero_page_x(self):
         addr = self._zero_page_x()
-        self._write_byte(addr, self.A)
+        self._write_zero_page(addr, self.A)
 
     def _STA_absolute(self):
         addr = self._absolute()
@@ -1851,8 +2672,10 @@ class Ricoh2A03:
             self._branch(offset)
 
     def _branch(self, offset):
-        self.PC = (self.PC + offset) & 0xFFFF
-        # Note: In an accurate emulator, you would account for additional cycles and page crossings.
+        target = (self.PC + offset) & 0xFFFF
+        # Taken branches cost one extra cycle, and another if they cross a page.
+        self.cycles += 2 if (target ^ self.PC) & 0xFF00 else 1
+        self.PC = target
 
     # System Functions
     def _BRK(self):
@@ -1922,12 +2745,14 @@ class Ricoh2A03:
         base = self._read_word(self.PC)
         self.PC += 2
         addr = (base + self.X) & 0xFFFF
+        self._page_crossed = (base ^ addr) >> 8 & 1
         return addr
 
     def _absolute_y(self):
         base = self._read_word(self.PC)
         self.PC += 2
         addr = (base + self.Y) & 0xFFFF
+        self._page_crossed = (base ^ addr) >> 8 & 1
         return addr
 
     def _indirect(self):
@@ -1945,21 +2770,57 @@ class Ricoh2A03:
     def _indirect_x(self):
         ptr = (self._read_byte(self.PC) + self.X) & 0xFF
         self.PC += 1
-        lo = self._read_byte(ptr)
-        hi = self._read_byte((ptr + 1) & 0xFF)
-        return (hi << 8) | lo
+        return self._read_word_zero_page(ptr)
 
     def _indirect_y(self):
         ptr = self._read_byte(self.PC)
         self.PC += 1
-        lo = self._read_byte(ptr)
-        hi = self._read_byte((ptr + 1) & 0xFF)
-        addr = ((hi << 8) | lo) + self.Y
-        return addr & 0xFFFF
+        base = self._read_word_zero_page(ptr)
+        addr = (base + self.Y) & 0xFFFF
+        self._page_crossed = (base ^ addr) >> 8 & 1
+        return addr
 
     def _relative(self):
         offset = self._read_byte(self.PC)
         self.PC += 1
         if offset & 0x80:
             offset -= 0x100
-        return offset
\ No newline at end of file
+        return offset
+
+
+Ricoh2A03._build_dispatch()
+
+# Instruction length in bytes of each addressing mode.
+LENGTHS = {
+    "implied": 1, "accumulator": 1,
+    "immediate": 2, "zero_page": 2, "zero_page_x": 2, "zero_page_y": 2,
+    "indirect_x": 2, "indirect_y": 2, "relative": 2,
+    "absolute": 3, "absolute_x": 3, "absolute_y": 3, "indirect": 3,
+}
+
+
+def _decode_table():
+    """Returns (mnemonic, mode, handler name) for every opcode, from the interpreter's dispatch table."""
+    table = []
+    for opcode in range(256):
+        name = Ricoh2A03._OPCODE_HANDLERS.get(opcode, "_illegal_opcode")
+        mnemonic = name[1:4]
+        mode = name[5:]
+        if name == "_illegal_opcode":
+            mnemonic, mode = None, "implied"
+        elif mnemonic in _BRANCH_CONDITIONS:
+            mode = "relative"
+        elif mnemonic == "JSR":
+            mode = "absolute"
+        elif mnemonic == "NOP" and mode:
+            # Unofficial NOPs: _NOP_illegal_0x/1x/2x skip that many operand bytes.
+            mode = {"illegal_0x": "implied", "illegal_1x": "immediate"}.get(mode, "absolute")
+        elif mode == "immediate_illegal":
+            mode = "immediate"
+        elif not mode:
+            mode = "implied"
+        table.append((mnemonic, mode, name))
+    return table
+
+
+DECODE = _decode_table()
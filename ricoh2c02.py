@@ -0,0 +1,494 @@
+import copy
+
+import numpy as np
+
+# NTSC timing
+DOTS_PER_SCANLINE = 341
+SCANLINES_PER_FRAME = 262
+VISIBLE_SCANLINES = 240
+VBLANK_SCANLINE = 241
+PRERENDER_SCANLINE = 261
+
+# Nametable layouts: offset into VRAM of each of the four logical nametables.
+MIRRORING = {
+    "horizontal": (0x000, 0x000, 0x400, 0x400),
+    "vertical": (0x000, 0x400, 0x000, 0x400),
+    "single0": (0x000, 0x000, 0x000, 0x000),
+    "single1": (0x400, 0x400, 0x400, 0x400),
+    "four": (0x000, 0x400, 0x800, 0xC00),
+}
+
+# 2C02 master palette as RGB, indexed by the 6 bit color values in the framebuffer.
+PALETTE = np.array([
+    (84, 84, 84), (0, 30, 116), (8, 16, 144), (48, 0, 136), (68, 0, 100), (92, 0, 48), (84, 4, 0), (60, 24, 0),
+    (32, 42, 0), (8, 58, 0), (0, 64, 0), (0, 60, 0), (0, 50, 60), (0, 0, 0), (0, 0, 0), (0, 0, 0),
+    (152, 150, 152), (8, 76, 196), (48, 50, 236), (92, 30, 228), (136, 20, 176), (160, 20, 100), (152, 34, 32), (120, 60, 0),
+    (84, 90, 0), (40, 114, 0), (8, 124, 0), (0, 118, 40), (0, 102, 120), (0, 0, 0), (0, 0, 0), (0, 0, 0),
+    (236, 238, 236), (76, 154, 236), (120, 124, 236), (176, 98, 236), (228, 84, 236), (236, 88, 180), (236, 106, 100), (212, 136, 32),
+    (160, 170, 0), (116, 196, 0), (76, 208, 32), (56, 204, 108), (56, 180, 204), (60, 60, 60), (0, 0, 0), (0, 0, 0),
+    (236, 238, 236), (168, 204, 236), (188, 188, 236), (212, 178, 236), (236, 174, 236), (236, 174, 212), (236, 180, 176), (228, 196, 144),
+    (204, 210, 120), (180, 222, 120), (168, 226, 144), (152, 226, 180), (160, 214, 228), (160, 162, 160), (0, 0, 0), (0, 0, 0),
+], dtype=np.uint8)
+
+_TILE_COLUMNS = np.arange(33)
+_BIT_SHIFTS = np.arange(7, -1, -1, dtype=np.uint8)
+
+
+# Scalar attributes saved by save_state().
+_STATE_FIELDS = (
+    "ctrl", "mask", "status", "oam_addr", "v", "t", "x", "w", "data_buffer", "latch",
+    "scanline", "dot", "frame", "clock", "_line_clock", "mirroring",
+)
+
+
+def decode_patterns(chr_data):
+    """Decodes 2bpp CHR data into a (tiles, 8, 8) array of pixel values 0-3."""
+    planes = np.frombuffer(bytes(chr_data), dtype=np.uint8).reshape(-1, 2, 8)
+    low = (planes[:, 0, :, None] >> _BIT_SHIFTS) & 1
+    high = (planes[:, 1, :, None] >> _BIT_SHIFTS) & 1
+    return (low | (high << 1)).astype(np.uint8)
+
+
+class Ricoh2C02:
+    """NES Picture Processing Unit.
+
+    Registers at $2000-$2007 are exposed through read_register/write_register,
+    and OAM DMA through write_oam_dma. The PPU is advanced with run(), which
+    takes the CPU cycle count and catches the PPU up to it (three dots per CPU
+    cycle). Rendering is done a whole scanline at a time: each visible line is
+    drawn into `framebuffer`, a (240, 256) uint8 array of master palette
+    indices, when the PPU passes dot 256 of that line.
+    """
+
+    def __init__(self, chr_data=None, mirroring="horizontal"):
+        # Pattern tables live on the cartridge; boards without CHR ROM have 8KB of CHR RAM.
+        self.chr_writable = not chr_data
+        self.chr = bytearray(chr_data) if chr_data else bytearray(0x2000)
+        self._patterns = decode_patterns(self.chr)
+        self._patterns_dirty = False
+
+        self.vram = bytearray(0x1000)     # Nametables (only 2KB used unless four screen)
+        self.palette = bytearray(0x20)
+        self.oam = bytearray(0x100)
+        self._vram_np = np.frombuffer(self.vram, dtype=np.uint8)
+        self._palette_np = np.frombuffer(self.palette, dtype=np.uint8)
+        self._oam_np = np.frombuffer(self.oam, dtype=np.uint8).reshape(64, 4)
+        self.set_mirroring(mirroring)
+
+        self.framebuffer = np.zeros((VISIBLE_SCANLINES, 256), dtype=np.uint8)
+        self._framebuffer_shared = False  # Set by clone(); copied before the next draw
+        self.render = True       # When False, scanlines are not drawn into the framebuffer
+        self.cpu = None          # Set by Ricoh2A03.attach_ppu to deliver NMI
+
+        self.reset()
+
+    def reset(self):
+        """Resets registers and timing to power up state."""
+        self.ctrl = 0x00         # $2000
+        self.mask = 0x00         # $2001
+        self.status = 0x00       # $2002
+        self.oam_addr = 0x00     # $2003
+        self.v = 0x0000          # Current VRAM address (15 bits)
+        self.t = 0x0000          # Temporary VRAM address
+        self.x = 0               # Fine X scroll
+        self.w = 0               # First/second write toggle
+        self.data_buffer = 0x00  # $2007 read buffer
+        self.latch = 0x00        # Last value written to any register (open bus)
+
+        self.scanline = 0
+        self.dot = 0
+        self.frame = 0           # Completed frames
+        self.clock = 0           # Dots since power on
+        self._line_clock = 0     # Value of clock at dot 0 of the current scanline
+
+    def clone(self):
+        """Returns a PPU in the same state, not attached to any CPU.
+
+        CHR ROM and the decoded patterns are shared, since they never change,
+        and so is the framebuffer until either PPU next draws into it.
+        """
+        other = copy.copy(self)
+        if self.chr_writable:
+            other.chr = bytearray(self.chr)
+        other.vram = bytearray(self.vram)
+        other.palette = bytearray(self.palette)
+        other.oam = bytearray(self.oam)
+        other._vram_np = np.frombuffer(other.vram, dtype=np.uint8)
+        other._palette_np = np.frombuffer(other.palette, dtype=np.uint8)
+        other._oam_np = np.frombuffer(other.oam, dtype=np.uint8).reshape(64, 4)
+        self._framebuffer_shared = other._framebuffer_shared = True
+        other.cpu = None
+        return other
+
+    def save_state(self):
+        """Returns registers, timing and PPU memory as a dict of plain values and bytes."""
+        state = {name: getattr(self, name) for name in _STATE_FIELDS}
+        state["vram"] = bytes(self.vram)
+        state["palette"] = bytes(self.palette)
+        state["oam"] = bytes(self.oam)
+        if self.chr_writable:
+            state["chr"] = bytes(self.chr)
+        return state
+
+    def load_state(self, state):
+        """Restores a state returned by save_state()."""
+        for name in _STATE_FIELDS:
+            setattr(self, name, state[name])
+        self.set_mirroring(state["mirroring"])
+        # Copy into the existing buffers so the NumPy views over them stay valid.
+        self.vram[:] = state["vram"]
+        self.palette[:] = state["palette"]
+        self.oam[:] = state["oam"]
+        if "chr" in state:
+            self.chr[:] = state["chr"]
+            self._patterns_dirty = True
+
+    def set_mirroring(self, mirroring):
+        self.mirroring = mirroring
+        self._nametables = np.array(MIRRORING[mirroring], dtype=np.intp)
+
+    def rgb(self):
+        """Returns the framebuffer converted to a (240, 256, 3) RGB array."""
+        return PALETTE[self.framebuffer]
+
+    # Timing
+
+    def run(self, cpu_cycle):
+        """Advances the PPU to the dot that corresponds to the given CPU cycle."""
+        target = cpu_cycle * 3
+        while True:
+            event = self._next_event_dot()
+            if self._line_clock + event > target:
+                self.dot = target - self._line_clock
+                self.clock = target
+                return
+            self.dot = event
+            self.clock = self._line_clock + event
+            self._event()
+
+    def next_sync_cycle(self):
+        """Predicts the CPU cycle by which the PPU must next be run.
+
+        That is the start of vblank if NMI is enabled, since the CPU has to take
+        the interrupt, and otherwise the end of the frame. Everything else the
+        PPU does is only observable through its registers, which sync on access.
+        """
+        scanline = self.scanline
+        line_clock = self._line_clock
+        prerender = DOTS_PER_SCANLINE - 1 if self.frame & 1 and self._rendering() else DOTS_PER_SCANLINE
+        target = line_clock + (PRERENDER_SCANLINE - scanline) * DOTS_PER_SCANLINE + prerender
+        if self.ctrl & 0x80 and (scanline < VBLANK_SCANLINE or (scanline == VBLANK_SCANLINE and self.dot < 1)):
+            target = line_clock + (VBLANK_SCANLINE - scanline) * DOTS_PER_SCANLINE + 1
+        return (target + 2) // 3
+
+    def next_status_cycle(self):
+        """Predicts the first CPU cycle at which a $2002 read may return something new.
+
+        That is the next vblank flag change, or the first line sprite 0 could hit on.
+        """
+        scanline = self.scanline
+        dot = self.dot
+        line_clock = self._line_clock
+        if scanline < VBLANK_SCANLINE or (scanline == VBLANK_SCANLINE and dot < 1):
+            target = line_clock + (VBLANK_SCANLINE - scanline) * DOTS_PER_SCANLINE + 1
+        elif scanline < PRERENDER_SCANLINE or dot < 1:
+            target = line_clock + (PRERENDER_SCANLINE - scanline) * DOTS_PER_SCANLINE + 1
+        else:
+            # Past the pre-render clear; the next change is in the next frame.
+            target = line_clock + self._scanline_length() + VBLANK_SCANLINE * DOTS_PER_SCANLINE + 1
+
+        if self.mask & 0x18 == 0x18 and not self.status & 0x40:
+            # Sprite 0 hit is detected when a line is rendered, at dot 256.
+            top = self.oam[0] + 1
+            bottom = min(top + (16 if self.ctrl & 0x20 else 8), VISIBLE_SCANLINES)
+            if scanline == PRERENDER_SCANLINE:
+                line = top
+                frame_start = line_clock + self._scanline_length()
+            else:
+                line = max(top, scanline if dot < 256 else scanline + 1)
+                frame_start = line_clock - scanline * DOTS_PER_SCANLINE
+            if line < bottom:
+                target = min(target, frame_start + line * DOTS_PER_SCANLINE + 256)
+        return (target + 2) // 3
+
+    def _rendering(self):
+        return self.mask & 0x18
+
+    def _scanline_length(self):
+        # Odd frames skip the last dot of the pre-render line while rendering.
+        if self.scanline == PRERENDER_SCANLINE and self.frame & 1 and self._rendering():
+            return DOTS_PER_SCANLINE - 1
+        return DOTS_PER_SCANLINE
+
+    def _next_event_dot(self):
+        """Returns the dot within the current scanline of the next event after self.dot."""
+        scanline = self.scanline
+        dot = self.dot
+        if scanline < VISIBLE_SCANLINES:
+            if dot < 256:
+                return 256
+        elif scanline == VBLANK_SCANLINE:
+            if dot < 1:
+                return 1
+        elif scanline == PRERENDER_SCANLINE:
+            if dot < 1:
+                return 1
+            if dot < 304:
+                return 304
+        return self._scanline_length()
+
+    def _event(self):
+        scanline = self.scanline
+        dot = self.dot
+        if dot == self._scanline_length():
+            self._line_clock += dot
+            self.dot = 0
+            if scanline == PRERENDER_SCANLINE:
+                self.scanline = 0
+                self.frame += 1
+            else:
+                self.scanline = scanline + 1
+        elif scanline < VISIBLE_SCANLINES:
+            self._render_scanline(scanline)
+            if self._rendering():
+                self._increment_y()
+                self.v = (self.v & ~0x041F) | (self.t & 0x041F)
+        elif scanline == VBLANK_SCANLINE:
+            self.status |= 0x80
+            if self.ctrl & 0x80:
+                self._signal_nmi()
+        elif dot == 1:
+            # Pre-render line clears vblank, sprite 0 hit and sprite overflow.
+            self.status &= ~0xE0
+        elif self._rendering():
+            self.v = (self.v & ~0x7BE0) | (self.t & 0x7BE0)
+
+    def _signal_nmi(self):
+        if self.cpu is not None:
+            self.cpu.nmi_pending = True
+
+    def _increment_y(self):
+        v = self.v
+        if (v & 0x7000) != 0x7000:
+            v += 0x1000
+        else:
+            v &= ~0x7000
+            y = (v & 0x03E0) >> 5
+            if y == 29:
+                y = 0
+                v ^= 0x0800
+            elif y == 31:
+                y = 0
+            else:
+                y += 1
+            v = (v & ~0x03E0) | (y << 5)
+        self.v = v
+
+    # Rendering
+
+    def _render_scanline(self, line):
+        if self.render and self._framebuffer_shared:
+            self.framebuffer = self.framebuffer.copy()
+            self._framebuffer_shared = False
+        row = self.framebuffer[line]
+        mask = self.mask
+        palette = self._palette_np
+        if not self.render:
+            # Nothing is drawn, but lines with sprite 0 on them are still composited
+            # (and thrown away) because games poll sprite 0 hit to time splits.
+            top = self.oam[0] + 1
+            height = 16 if self.ctrl & 0x20 else 8
+            if self.status & 0x40 or mask & 0x18 != 0x18 or not top <= line < top + height:
+                return
+        elif not mask & 0x18:
+            row[:] = palette[0] & 0x3F
+            return
+
+        if self._patterns_dirty:
+            self._patterns = decode_patterns(self.chr)
+            self._patterns_dirty = False
+
+        # Background: decode the 33 tiles that overlap the line in one gather.
+        if mask & 0x08:
+            v = self.v
+            columns = (v & 0x1F) + _TILE_COLUMNS
+            coarse_x = columns & 0x1F
+            coarse_y = (v >> 5) & 0x1F
+            nametable = ((v >> 10) & 3) ^ ((columns >> 5) & 1)
+            base = self._nametables[nametable]
+            vram = self._vram_np
+            tiles = vram[base + coarse_y * 32 + coarse_x].astype(np.intp)
+            attributes = vram[base + 0x3C0 + (coarse_y >> 2) * 8 + (coarse_x >> 2)]
+            attributes = (attributes >> (((coarse_y & 2) << 1) | (coarse_x & 2))) & 3
+            bank = 256 if self.ctrl & 0x10 else 0
+            pixels = self._patterns[bank + tiles, (v >> 12) & 7]
+            background = np.where(pixels, (attributes[:, None] << 2) | pixels, 0).ravel()
+            background = background[self.x:self.x + 256]
+            if not mask & 0x02:
+                background[:8] = 0
+        else:
+            background = np.zeros(256, dtype=np.uint8)
+
+        colors = background
+        if mask & 0x10:
+            colors = self._render_sprites(line, background)
+
+        if self.render:
+            row[:] = palette[colors] & (0x30 if mask & 0x01 else 0x3F)
+
+    def _render_sprites(self, line, background):
+        """Composites the sprites on this line over the background color indices."""
+        tall = self.ctrl & 0x20
+        height = 16 if tall else 8
+        oam = self._oam_np
+        rows = line - (oam[:, 0].astype(np.intp) + 1)
+        visible = np.flatnonzero((rows >= 0) & (rows < height))
+        if not len(visible):
+            return background
+        if len(visible) > 8:
+            self.status |= 0x20
+            visible = visible[:8]
+
+        colors = np.zeros(264, dtype=np.uint8)
+        behind = np.zeros(264, dtype=bool)
+        patterns = self._patterns
+        sprite_zero = None
+        # Draw in reverse so that lower OAM indices end up on top.
+        for index in visible[::-1]:
+            y, tile, attributes, x = oam[index].tolist()
+            row = int(rows[index])
+            if attributes & 0x80:
+                row = height - 1 - row
+            if tall:
+                tile = ((tile & 1) << 8) | (tile & 0xFE)
+                if row >= 8:
+                    tile += 1
+                    row -= 8
+            else:
+                tile += 256 if self.ctrl & 0x08 else 0
+            pixels = patterns[tile, row]
+            if attributes & 0x40:
+                pixels = pixels[::-1]
+            opaque = pixels != 0
+            span = slice(x, x + 8)
+            colors[span] = np.where(opaque, 0x10 | ((attributes & 3) << 2) | pixels, colors[span])
+            behind[span] = np.where(opaque, bool(attributes & 0x20), behind[span])
+            if index == 0:
+                sprite_zero = (x, opaque)
+
+        colors = colors[:256]
+        behind = behind[:256]
+        if not self.mask & 0x04:
+            colors[:8] = 0
+
+        opaque_background = background != 0
+        if sprite_zero is not None and self.mask & 0x08 and not self.status & 0x40:
+            x, opaque = sprite_zero
+            hits = np.zeros(264, dtype=bool)
+            hits[x:x + 8] = opaque
+            hits = hits[:256] & opaque_background
+            hits[255] = False
+            if not self.mask & 0x06 == 0x06:
+                hits[:8] = False
+            if hits.any():
+                self.status |= 0x40
+
+        show = (colors != 0) & ~(behind & opaque_background)
+        return np.where(show, colors, background)
+
+    # Registers
+
+    def read_register(self, register):
+        """Reads $2000-$2007 (register is the address & 7)."""
+        if register == 2:
+            value = (self.status & 0xE0) | (self.latch & 0x1F)
+            self.status &= ~0x80
+            self.w = 0
+        elif register == 4:
+            value = self.oam[self.oam_addr]
+        elif register == 7:
+            addr = self.v & 0x3FFF
+            if addr >= 0x3F00:
+                # Palette reads are not buffered, but still refill the buffer from VRAM below.
+                value = (self.palette[self._palette_index(addr)] & 0x3F) | (self.latch & 0xC0)
+                self.data_buffer = self._read_vram(addr - 0x1000)
+            else:
+                value = self.data_buffer
+                self.data_buffer = self._read_vram(addr)
+            self.v = (self.v + (32 if self.ctrl & 0x04 else 1)) & 0x7FFF
+        else:
+            return self.latch
+        self.latch = value
+        return value
+
+    def write_register(self, register, value):
+        """Writes $2000-$2007 (register is the address & 7)."""
+        self.latch = value
+        if register == 0:
+            # Enabling NMI during vblank raises it immediately.
+            if value & 0x80 and not self.ctrl & 0x80 and self.status & 0x80:
+                self._signal_nmi()
+            self.ctrl = value
+            self.t = (self.t & ~0x0C00) | ((value & 0x03) << 10)
+        elif register == 1:
+            self.mask = value
+        elif register == 3:
+            self.oam_addr = value
+        elif register == 4:
+            self.oam[self.oam_addr] = value
+            self.oam_addr = (self.oam_addr + 1) & 0xFF
+        elif register == 5:
+            if not self.w:
+                self.t = (self.t & ~0x001F) | (value >> 3)
+                self.x = value & 0x07
+            else:
+                self.t = (self.t & ~0x73E0) | ((value & 0x07) << 12) | ((value & 0xF8) << 2)
+            self.w ^= 1
+        elif register == 6:
+            if not self.w:
+                self.t = (self.t & 0x00FF) | ((value & 0x3F) << 8)
+            else:
+                self.t = (self.t & 0x7F00) | value
+                self.v = self.t
+            self.w ^= 1
+        elif register == 7:
+            self._write_vram(self.v & 0x3FFF, value)
+            self.v = (self.v + (32 if self.ctrl & 0x04 else 1)) & 0x7FFF
+
+    def write_oam_dma(self, data):
+        """Copies 256 bytes into OAM starting at the current OAM address."""
+        start = self.oam_addr
+        if not start:
+            self.oam[:] = data
+            return
+        data = bytes(data)
+        self.oam[start:] = data[:256 - start]
+        self.oam[:start] = data[256 - start:]
+
+    # PPU address space
+
+    def _palette_index(self, addr):
+        index = addr & 0x1F
+        # $3F10/$3F14/$3F18/$3F1C mirror the background entries.
+        if index & 0x13 == 0x10:
+            index &= 0x0F
+        return index
+
+    def _read_vram(self, addr):
+        addr &= 0x3FFF
+        if addr < 0x2000:
+            return self.chr[addr]
+        if addr < 0x3F00:
+            return self.vram[self._nametables[(addr >> 10) & 3] + (addr & 0x3FF)]
+        return self.palette[self._palette_index(addr)]
+
+    def _write_vram(self, addr, value):
+        addr &= 0x3FFF
+        if addr < 0x2000:
+            if self.chr_writable:
+                self.chr[addr] = value
+                self._patterns_dirty = True
+        elif addr < 0x3F00:
+            self.vram[self._nametables[(addr >> 10) & 3] + (addr & 0x3FF)] = value
+        else:
+            self.palette[self._palette_index(addr)] = value
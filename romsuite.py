@@ -0,0 +1,245 @@
+"""Runs a directory of test ROMs in parallel and writes a JUnit report.
+
+    python romsuite.py roms/ [--expected roms/expected.json] [--jobs 8]
+                             [--timeout 50000000] [--junit report.xml]
+
+Every .nes file under the directory is a test. How each one passes is read
+from the expected results file (by default expected.json in the directory),
+keyed by the ROM's path relative to the directory:
+
+    {
+        "nestest.nes": {"log": "nestest.log"},
+        "instr_test/01-basics.nes": {"status": 0},
+        "custom.nes": {"trap": "$C66E", "memory": {"$0002": 0, "$0003": 0}}
+    }
+
+"log" steps the CPU against a nestest style log, as test.py does. "status"
+follows the convention of the common test ROMs: $6001-$6003 hold DE B0 61
+once $6000 is valid, $6000 reads $80 while running, $81 when the ROM wants
+a reset and the result code when done, with a message from $6004. Otherwise
+the ROM passes when it traps in a `JMP *` (or a branch to itself) at "trap",
+with the listed memory bytes; without "trap", any such loop run with NMI
+disabled ends the test. ROMs without an entry are run as "status": 0. A ROM
+that runs out of instructions fails with a timeout.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from nes import Cartridge, power_on
+from nestest import initialize_memory, load_expected_log, load_test_rom, state_of
+from ricoh2a03 import Ricoh2A03
+
+DEFAULT_TIMEOUT = 50_000_000    # Instructions per ROM
+STATUS_SIGNATURE = b"\xDE\xB0\x61"
+STATUS_RUNNING = 0x80
+STATUS_RESET = 0x81
+RESET_DELAY = 178_977           # Cycles (100 ms) between a reset request and the reset
+
+# Instructions run between checks for a result or a trap.
+_CHECK_EVERY = 1000
+
+
+def run_rom(root, name, expected, timeout):
+    """Runs one ROM; returns a result dict with name, outcome, message, output, instructions and seconds.
+
+    outcome is "passed", "failed", "timeout" or "error". Runs in a worker process.
+    """
+    start = time.perf_counter()
+    try:
+        if "log" in expected:
+            outcome, message, output, executed = _run_log(os.path.join(root, name),
+                                                         os.path.join(root, expected["log"]), timeout)
+        else:
+            outcome, message, output, executed = _run_machine(os.path.join(root, name), expected, timeout)
+    except Exception as e:
+        outcome, message, output, executed = "error", f"{type(e).__name__}: {e}", traceback.format_exc(), 0
+    return {
+        "name": name,
+        "outcome": outcome,
+        "message": message,
+        "output": output,
+        "instructions": executed,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _run_log(rom_path, log_path, timeout):
+    """Steps the CPU in nestest automation mode, comparing registers against each log line."""
+    expected_states = load_expected_log(log_path)
+    if expected_states is None:
+        return "error", f"Could not read {log_path}", "", 0
+    cpu = Ricoh2A03(initialize_memory(load_test_rom(rom_path)), trace=False)
+    cpu.reset()
+    for line, expected in enumerate(expected_states[:timeout]):
+        actual = state_of(cpu)
+        if actual != expected:
+            return "failed", f"Mismatch at line {line + 1}", f"Expected {expected}\n  Actual {actual}", line
+        cpu.step()
+    if len(expected_states) > timeout:
+        return "timeout", f"Stopped after {timeout} instructions", "", timeout
+    return "passed", f"{len(expected_states)} instructions match", "", len(expected_states)
+
+
+def _run_machine(rom_path, expected, timeout):
+    """Runs a full machine until the ROM reports a status, traps, or the timeout expires."""
+    cpu = power_on(Cartridge.from_file(rom_path), sample_rate=None, prg_ram=True)
+    cpu.ppu.render = False
+    memory = cpu.memory
+    sram = memory.sram
+    wanted_status = expected.get("status", 0)
+    wanted_trap = expected.get("trap")
+    if wanted_trap is not None:
+        wanted_trap = _number(wanted_trap)
+    executed = 0
+    reset_at = None
+    reset_done = False      # Set once a reset request is served, until $6000 stops reading $81
+    step = cpu.step
+    while executed < timeout:
+        batch = min(_CHECK_EVERY, timeout - executed)
+        for _ in range(batch):
+            step()
+        executed += batch
+
+        if sram[1:4] == STATUS_SIGNATURE and wanted_trap is None:
+            status = sram[0]
+            if status < STATUS_RUNNING:
+                output = _status_text(sram)
+                if status == wanted_status:
+                    return "passed", f"Status {status:#04x}", output, executed
+                return "failed", f"Status {status:#04x}, expected {wanted_status:#04x}", output, executed
+            if status != STATUS_RESET:
+                reset_done = False
+            elif reset_at is None and not reset_done:
+                reset_at = cpu.cycles + RESET_DELAY
+        if reset_at is not None and cpu.cycles >= reset_at:
+            cpu.reset()
+            reset_at = None
+            reset_done = True
+
+        # A self jump with NMI enabled is usually a wait for vblank, not the end of the test.
+        trap = _trap_address(memory, cpu.PC)
+        if trap is not None and (trap == wanted_trap or not cpu.ppu.ctrl & 0x80):
+            return _judge_trap(memory, trap, wanted_trap, expected.get("memory", {}), executed)
+    return "timeout", f"No result after {timeout} instructions (PC=${cpu.PC:04X})", "", executed
+
+
+def _trap_address(memory, pc):
+    """Returns pc if the instruction there jumps or branches to itself, otherwise None."""
+    opcode = memory[pc]
+    if opcode == 0x4C and memory[(pc + 1) & 0xFFFF] | (memory[(pc + 2) & 0xFFFF] << 8) == pc:
+        return pc
+    if opcode & 0x1F == 0x10 and memory[(pc + 1) & 0xFFFF] == 0xFE:
+        return pc
+    return None
+
+
+def _judge_trap(memory, pc, wanted_trap, wanted_memory, executed):
+    if wanted_trap is None and not wanted_memory:
+        return "failed", f"Trapped at ${pc:04X} without reporting a status", "", executed
+    if wanted_trap is not None and pc != wanted_trap:
+        return "failed", f"Trapped at ${pc:04X}, expected ${wanted_trap:04X}", "", executed
+    wrong = []
+    for addr, value in wanted_memory.items():
+        addr, value = _number(addr), _number(value)
+        if memory[addr] != value:
+            wrong.append(f"${addr:04X}={memory[addr]:02X} (expected {value:02X})")
+    if wrong:
+        return "failed", f"Trapped at ${pc:04X} with " + ", ".join(wrong), "", executed
+    return "passed", f"Trapped at ${pc:04X}", "", executed
+
+
+def _status_text(sram):
+    """The NUL terminated message the ROM left at $6004."""
+    text = bytes(sram[4:])
+    return text.split(b"\0", 1)[0].decode("ascii", "replace").strip()
+
+
+def _number(value):
+    """Accepts ints or hex strings ("$C000", "0xC000")."""
+    if isinstance(value, str):
+        text = value.strip()
+        return int(text[1:], 16) if text.startswith("$") else int(text, 0)
+    return value
+
+
+def discover(root):
+    """Returns the paths of the .nes files under root, relative to it, in sorted order."""
+    names = []
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            if filename.lower().endswith(".nes"):
+                names.append(os.path.relpath(os.path.join(directory, filename), root).replace(os.sep, "/"))
+    return sorted(names)
+
+
+def run_suite(root, expected=None, jobs=None, timeout=DEFAULT_TIMEOUT, progress=None):
+    """Runs every ROM under root across a process pool; returns the results sorted by name.
+
+    expected maps ROM names to their expected results (see the module
+    docstring). progress, when given, is called with each result as it arrives.
+    """
+    expected = expected or {}
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_rom, root, name, expected.get(name, {}), timeout) for name in discover(root)]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return sorted(results, key=lambda result: result["name"])
+
+
+def junit_report(results, suite="py6502"):
+    """Returns the results as a JUnit XML document."""
+    failures = sum(1 for result in results if result["outcome"] in ("failed", "timeout"))
+    errors = sum(1 for result in results if result["outcome"] == "error")
+    root = ET.Element("testsuite", name=suite, tests=str(len(results)), failures=str(failures),
+                      errors=str(errors), skipped="0", time=f"{sum(r['seconds'] for r in results):.3f}")
+    for result in results:
+        case = ET.SubElement(root, "testcase", classname=suite, name=result["name"], time=f"{result['seconds']:.3f}")
+        if result["outcome"] in ("failed", "timeout"):
+            failure = ET.SubElement(case, "failure", message=result["message"], type=result["outcome"])
+            failure.text = result["output"]
+        elif result["outcome"] == "error":
+            error = ET.SubElement(case, "error", message=result["message"])
+            error.text = result["output"]
+        elif result["output"]:
+            ET.SubElement(case, "system-out").text = result["output"]
+    ET.indent(root)
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(root, encoding="unicode") + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a directory of test ROMs in parallel.")
+    parser.add_argument("directory", help="Directory searched for .nes files")
+    parser.add_argument("--expected", help="Expected results JSON (default: expected.json in the directory)")
+    parser.add_argument("--jobs", type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help="Instructions allowed per ROM")
+    parser.add_argument("--junit", help="Write a JUnit XML report to this file")
+    args = parser.parse_args()
+
+    expected_path = args.expected or os.path.join(args.directory, "expected.json")
+    expected = {}
+    if os.path.exists(expected_path):
+        with open(expected_path) as f:
+            expected = json.load(f)
+    elif args.expected:
+        sys.exit(f"No such file: {args.expected}")
+
+    def progress(result):
+        print(f"{result['outcome'].upper():<8}{result['name']}  {result['message']} ({result['seconds']:.1f}s)")
+
+    results = run_suite(args.directory, expected, args.jobs, args.timeout, progress)
+    if args.junit:
+        with open(args.junit, 'w') as f:
+            f.write(junit_report(results))
+    passed = sum(1 for result in results if result["outcome"] == "passed")
+    print(f"{passed} of {len(results)} passed")
+    sys.exit(0 if passed == len(results) else 1)
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+
+from memory import PAGE_SIZE
+
+MAGIC = b"PY6502PG"
+_HEADER = struct.Struct("<8sQ")     # Magic, number of pages in use
+
+# The page file grows by at least this many pages at a time.
+_GROW_PAGES = 4096
+
+
+class PageStore:
+    """Content-addressed store of 256 byte pages in a memory-mapped file.
+
+    Each distinct page is written once and referred to by its page number.
+    save() splits a machine state into pages, so snapshots of the same game
+    share their identical RAM, nametable and register pages and each costs
+    little more than its list of page numbers:
+
+        with PageStore("states.pages") as store:
+            snapshot = store.save(cpu)
+            ...
+            store.restore(cpu, snapshot)
+
+    Snapshots are array('I') objects; keep them in memory, or persist them with
+    tobytes() and snapshot_from_bytes() to reopen them against the same page file.
+    Page 0 of the file holds the header, so page numbers start at 1.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) >= PAGE_SIZE
+        self._file = open(path, "r+b" if exists else "w+b")
+        if not exists:
+            self._file.truncate(PAGE_SIZE * _GROW_PAGES)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._index = {}
+        if exists:
+            magic, self.pages = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a page store")
+            # The index is not persisted; rebuild it from the pages themselves.
+            for number in range(1, self.pages + 1):
+                offset = number * PAGE_SIZE
+                self._index[_digest(self._map[offset:offset + PAGE_SIZE])] = number
+        else:
+            self.pages = 0
+            self._write_header()
+
+    def __len__(self):
+        """Number of distinct pages stored."""
+        return self.pages
+
+    def put(self, data):
+        """Stores data, zero padded to whole pages; returns its page numbers."""
+        numbers = array("I")
+        for offset in range(0, len(data), PAGE_SIZE):
+            page = bytes(data[offset:offset + PAGE_SIZE]).ljust(PAGE_SIZE, b"\0")
+            key = _digest(page)
+            number = self._index.get(key)
+            if number is None:
+                number = self._append(page)
+                self._index[key] = number
+            numbers.append(number)
+        return numbers
+
+    def get(self, numbers, length):
+        """Gathers the given pages and returns their first length bytes."""
+        mapped = self._map
+        return b"".join(mapped[number * PAGE_SIZE:(number + 1) * PAGE_SIZE] for number in numbers)[:length]
+
+    def save(self, cpu):
+        """Stores the machine's state (see Ricoh2A03.save_state) and returns a snapshot."""
+        blobs = []
+        meta = json.dumps(_split(cpu.save_state(), blobs), separators=(",", ":")).encode()
+        snapshot = array("I", [len(blobs) + 1])
+        # Each blob starts on a page boundary so identical RAM pages dedupe across snapshots.
+        for blob in (meta, *blobs):
+            snapshot.append(len(blob))
+            snapshot.extend(self.put(blob))
+        self._write_header()
+        return snapshot
+
+    def load(self, snapshot):
+        """Returns the state dict stored by save()."""
+        blobs = []
+        position = 1
+        for _ in range(snapshot[0]):
+            length = snapshot[position]
+            count = -(-length // PAGE_SIZE)
+            blobs.append(self.get(snapshot[position + 1:position + 1 + count], length))
+            position += 1 + count
+        return _join(json.loads(blobs[0]), blobs[1:])
+
+    def restore(self, cpu, snapshot):
+        """Restores a snapshot into a machine built from the same cartridge."""
+        cpu.load_state(self.load(snapshot))
+
+    def flush(self):
+        self._write_header()
+        self._map.flush()
+
+    def close(self):
+        if self._map is None:
+            return
+        self.flush()
+        self._map.close()
+        self._file.close()
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _append(self, page):
+        number = self.pages + 1
+        if (number + 1) * PAGE_SIZE > len(self._map):
+            size = len(self._map) + PAGE_SIZE * max(_GROW_PAGES, number)
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        self._map[number * PAGE_SIZE:(number + 1) * PAGE_SIZE] = page
+        self.pages = number
+        return number
+
+    def _write_header(self):
+        _HEADER.pack_into(self._map, 0, MAGIC, self.pages)
+
+
+def snapshot_from_bytes(data):
+    """Rebuilds a snapshot from the bytes of snapshot.tobytes()."""
+    snapshot = array("I")
+    snapshot.frombytes(data)
+    return snapshot
+
+
+# The state is stored as JSON, which has no bytes type. Bytes values become
+# single key objects under these keys; state dicts are keyed by attribute
+# names, so they never clash.
+_BLOB = "$blob"     # Index of a value of at least a page, stored as its own pages
+_HEX = "$hex"       # Shorter values, inline as hex
+
+
+def _split(value, blobs):
+    """Returns value as JSON-serializable data, moving bytes values of at least a page to blobs."""
+    if isinstance(value, dict):
+        return {key: _split(item, blobs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_split(item, blobs) for item in value]
+    if isinstance(value, bytes):
+        if len(value) < PAGE_SIZE:
+            return {_HEX: value.hex()}
+        blobs.append(value)
+        return {_BLOB: len(blobs) - 1}
+    return value
+
+
+def _join(value, blobs):
+    if isinstance(value, dict):
+        if _BLOB in value:
+            return blobs[value[_BLOB]]
+        if _HEX in value:
+            return bytes.fromhex(value[_HEX])
+        return {key: _join(item, blobs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_join(item, blobs) for item in value]
+    return value
+
+
+def _digest(page):
+    return hashlib.blake2b(page, digest_size=16).digest()
@@ -1,109 +1,415 @@
+import os
 import sys
+import tempfile
 
+import recompiler
+from alu import TableALU
+from controller import START
+from memory import ROM_SIZE, SRAM_SIZE, Memory
+from metrics import Metrics
+from nes import Cartridge, power_on
+from nestest import initialize_memory, load_expected_log, load_test_rom, state_of
 # Import the Ricoh2A03 emulator class
 from ricoh2a03 import Ricoh2A03
+from ricoh2c02 import Ricoh2C02
+from snapshot import PageStore, snapshot_from_bytes
 
-def load_test_rom(filename):
-    """Loads the test ROM into memory."""
-    with open(filename, 'rb') as f:
-        rom_data = f.read()
-    return rom_data
-
-def extract_register_value(register, line):
-    # Search line for "register:" and extract its value
-    start = line.find(register + ":") + len(register) + 1
-    end = line.find(" ", start)
-    if end == -1:  # If no space is found, take the rest of the line
-        end = len(line)
-    return line[start:end].strip()
-
-def load_expected_log(log_filename):
-    """Loads expected states from a log file."""
-    expected_states = []
-    with open(log_filename, 'r') as f:
-        for line in f:
-            parts = line.strip().split()
-            if parts:
-                expected_states.append({
-                    "PC": parts[0],
-                    "OP": parts[1],
-                    "A": extract_register_value("A", line),
-                    "X": extract_register_value("X", line),
-                    "Y": extract_register_value("Y", line),
-                    "P": extract_register_value("P", line),
-                    "SP": extract_register_value("SP", line),
-                    "CYC": "IGNORED",
-                })
-            else:
-                print ("Empty line in log file!")
-                return
-    return expected_states
-
-def initialize_memory(rom_data):
-    """Initializes memory and loads the ROM data."""
-    memory = [0x00] * 0x10000  # 64KB of memory
-
-    # NES ROMs have a header of 16 bytes; we'll skip it
-    header_size = 16
-    prg_rom_size = len(rom_data) - header_size
-    prg_rom = rom_data[header_size:]
-
-    # Load PRG ROM into $C000-$FFFF
-    memory[0xC000:0xC000+prg_rom_size] = prg_rom
-
-    # Set the reset vector to point to $C004 for automatic mode
-    memory[0xFFFC] = 0x00
-    memory[0xFFFD] = 0xC0
-
-    return memory
-
-def run_test(cpu, expected_states):
-    """Runs the test ROM and checks CPU state against expected log."""
+def instructions_run(cpu, steps):
+    """Instructions behind steps calls to cpu.step(); a superinstruction counts each one it ran."""
+    if not cpu.fuse or cpu.predecode:
+        return steps
+    sizes = {name: len(opcodes) for opcodes, _, name in cpu._FUSIONS}
+    return cpu.unfused + sum(count * sizes[name] for name, count in cpu.fused_counts.items())
+
+def run_test(cpu, expected_states, reference=None):
+    """Runs the test ROM and checks CPU state against expected log.
+
+    With a reference CPU, cpu may run several instructions per step (fuse) or
+    run them another way (predecode): the reference steps through the log one
+    instruction at a time, and whenever both have run the same instructions
+    their registers, cycles and memory must be identical.
+    """
 
     instructions_executed = 0
+    steps = 0
+    checked = cpu if reference is None else reference
 
     while instructions_executed < len(expected_states):
-        pc_hex = f"{cpu.PC:04X}"
-        op = cpu.memory[cpu.PC]
-        
-        actual_state = {
-            "PC": pc_hex,
-            "OP": f"{op:02X}",
-            "A": f"{cpu.A:02X}",
-            "X": f"{cpu.X:02X}",
-            "Y": f"{cpu.Y:02X}",
-            "P": f"{cpu._get_status():02X}",
-            "SP": f"{cpu.SP:02X}",
-            "CYC": "IGNORED"  # Placeholder if cycle exact timing isn't being tested
-        }
+        pc_hex = f"{checked.PC:04X}"
+        actual_state = state_of(checked)
 
         expected_state = expected_states[instructions_executed]
 
         if actual_state != expected_state:
             print(f"Line {instructions_executed} Mismatch at PC={pc_hex}:\n Expected {expected_state},\n   Actual {actual_state}")
-            break
+            return False
+
+        if reference is not None and instructions_run(cpu, steps) == instructions_executed:
+            if state_of(cpu) != actual_state or cpu.cycles != reference.cycles or cpu.memory != reference.memory:
+                print(f"Line {instructions_executed} Divergence from the reference at PC={pc_hex}:\n"
+                      f" Reference {actual_state} cycles {reference.cycles},\n"
+                      f"    Actual {state_of(cpu)} cycles {cpu.cycles}")
+                return False
+            cpu.step()
+            steps += 1
 
         instructions_executed += 1
+        checked.step()
+    return True
+
+def check_self_modifying_code():
+    """Runs RAM code that patches an instruction it has already run, with predecode set.
+
+    The patch goes through a mirror of the instruction's address, so the
+    predecode cache must map it back to the page it decoded the code from.
+    """
+    program = bytes((
+        0xA2, 0x11,         # $0300 LDX #$11
+        0xE0, 0x22,         # $0302 CPX #$22
+        0xF0, 0x08,         # $0304 BEQ $030E
+        0xA9, 0x22,         # $0306 LDA #$22
+        0x8D, 0x01, 0x0B,   # $0308 STA $0B01 (mirror of $0301, LDX's operand)
+        0x4C, 0x00, 0x03,   # $030B JMP $0300
+        0x4C, 0x0E, 0x03,   # $030E JMP $030E
+    ))
+    cpu = Ricoh2A03(Memory(memoryview(bytes(ROM_SIZE))), trace=False)
+    cpu.predecode = True
+    cpu.load(0x0300, program)
+    cpu.PC = 0x0300
+    for _ in range(20):
         cpu.step()
+    if cpu.PC != 0x030E or cpu.X != 0x22:
+        print(f"Self-modifying code: expected X=22 at PC=030E, got X={cpu.X:02X} at PC={cpu.PC:04X}")
+        return False
+    print("Self-modifying code runs its patched instruction")
+    return True
+
+def check_table_alu():
+    """Compares every input of TableALU's helpers with the branching ones in Ricoh2A03."""
+    table = TableALU(bytearray(0x10000), trace=False)
+    branching = Ricoh2A03(bytearray(0x10000), trace=False)
+    for reg in range(256):
+        for value in range(256):
+            table._compare(reg, value)
+            branching._compare(reg, value)
+            if table._get_status() != branching._get_status():
+                print(f"TableALU: compare {reg:02X} with {value:02X} differs")
+                return False
+    for name in ("_asl", "_lsr"):
+        for carry in (0, 1):
+            for value in range(256):
+                table.C = branching.C = carry
+                if (getattr(table, name)(value) != getattr(branching, name)(value)
+                        or table._get_status() != branching._get_status()):
+                    print(f"TableALU: {name[1:]} of {value:02X} with carry {carry} differs")
+                    return False
+    print("TableALU matches the branching ALU for every input")
+    return True
+
+def machine_state(cpu):
+    """Registers, cycle count and work RAM of a full machine, for comparing two runs."""
+    return (cpu.A, cpu.X, cpu.Y, cpu.SP, cpu.PC, cpu._get_status(), cpu.cycles, bytes(cpu.memory.ram))
+
+def check_skip_idle(cartridge, frames=180):
+    """Runs the cartridge with and without skip_idle (and fuse) and compares every frame.
+
+    Start is pressed a few times so that the ROM runs more than its menu loop.
+    """
+    inputs = bytearray(frames)
+    for first in range(20, frames, 60):
+        inputs[first:first + 4] = bytes((START,)) * 4
+    runs = []
+    for skip_idle, fuse in ((False, False), (True, False), (True, True)):
+        cpu = power_on(cartridge, sample_rate=None)
+        cpu.ppu.render = False
+        cpu.skip_idle = skip_idle
+        cpu.fuse = fuse
+        cpu.controllers[0].play(inputs)
+        runs.append(cpu)
+    reference = runs[0]
+    for frame in range(frames):
+        for cpu in runs:
+            cpu.run_frame()
+        expected = machine_state(reference)
+        for cpu in runs[1:]:
+            if machine_state(cpu) != expected:
+                print(f"skip_idle: frame {frame} differs with fuse={cpu.fuse}:\n"
+                      f" Expected {expected[:7]},\n   Actual {machine_state(cpu)[:7]}")
+                return False
+    print(f"skip_idle: {frames} frames match, {runs[1].idle_cycles} of {runs[1].cycles} cycles skipped")
+    return True
+
+def hashes_agree(cpu):
+    """Whether cpu.state_hash(), updated from the pages marked dirty, equals a rehash of all of memory."""
+    incremental = cpu.state_hash()
+    # Rehash from scratch, then put the incremental cache back so that stale
+    # page hashes keep accumulating if a write path forgets to mark its page.
+    cached = cpu._page_hashes, cpu._memory_hash
+    cpu._page_hashes, cpu._memory_hash = {}, 0
+    cpu.invalidate_state_hash()
+    full = cpu.state_hash()
+    cpu._page_hashes, cpu._memory_hash = cached
+    return incremental == full
+
+def check_state_hash(cartridge, frames=120):
+    """Checks the incremental state_hash() against a full rehash across every write path.
+
+    A ROM program writes zero page, the stack, RAM and cartridge RAM through
+    plain, fused and predecoded handlers, checked after every step; then the
+    cartridge runs whole frames. Each run is cloned halfway and both machines
+    are checked from then on.
+    """
+    program = bytes((
+        0xA2, 0x10,         # $8000 LDX #$10
+        0xA5, 0x10,         # $8002 LDA $10
+        0x8D, 0x00, 0x60,   # $8004 STA $6000
+        0xE6, 0x11,         # $8007 INC $11
+        0xA5, 0x11,         # $8009 LDA $11
+        0x91, 0x20,         # $800B STA ($20),Y
+        0x9D, 0x00, 0x04,   # $800D STA $0400,X
+        0x48,               # $8010 PHA
+        0x20, 0x30, 0x80,   # $8011 JSR $8030
+        0x68,               # $8014 PLA
+        0xC8,               # $8015 INY
+        0xCA,               # $8016 DEX
+        0xD0, 0xE9,         # $8017 BNE $8002
+        0xE6, 0x10,         # $8019 INC $10
+        0x4C, 0x00, 0x80,   # $801B JMP $8000
+    ))
+    subroutine = bytes((
+        0x95, 0x31,         # $8030 STA $31,X
+        0xEE, 0x23, 0x01,   # $8032 INC $0123
+        0x60,               # $8035 RTS
+    ))
+    rom = bytearray(ROM_SIZE)
+    rom[:len(program)] = program
+    rom[0x30:0x30 + len(subroutine)] = subroutine
+    rom = memoryview(bytes(rom))
+    for fuse, predecode in ((False, False), (True, False), (False, True)):
+        cpu = Ricoh2A03(Memory(rom, sram=bytearray(SRAM_SIZE)), trace=False)
+        cpu.load(0x20, bytes((0x00, 0x7F)))    # ($20) -> $7F00, in cartridge RAM
+        cpu.fuse = fuse
+        cpu.predecode = predecode
+        cpu.PC = 0x8000
+        machines = [cpu]
+        for step in range(2000):
+            if step == 1000:
+                machines.append(cpu.clone())
+            for machine in machines:
+                machine.step()
+                if not hashes_agree(machine):
+                    print(f"state_hash: stale after step {step} at PC={machine.PC:04X} "
+                          f"(fuse={fuse}, predecode={predecode}, clone={machine is not cpu})")
+                    return False
+
+    for fuse, predecode in ((False, False), (True, False), (False, True)):
+        cpu = power_on(cartridge, sample_rate=None, prg_ram=True)
+        cpu.ppu.render = False
+        cpu.fuse = fuse
+        cpu.predecode = predecode
+        machines = [cpu]
+        for frame in range(frames):
+            if frame == frames // 2:
+                machines.append(cpu.clone())
+            for machine in machines:
+                machine.run_frame()
+                if not hashes_agree(machine):
+                    print(f"state_hash: stale after frame {frame} (fuse={fuse}, predecode={predecode}, "
+                          f"clone={machine is not cpu})")
+                    return False
+    print("state_hash: incremental hashes match full rehashes")
+    return True
+
+def check_page_store(cartridge, frames=60, every=10):
+    """Saves snapshots to a PageStore, restores them, and does it again after reopening the page file.
+
+    Every restored machine must have the saved state_hash(); the last one must
+    then run on exactly like the original, and after reopening, saving the
+    same states must add no pages.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "states.pages")
+        cpu = power_on(cartridge, sample_rate=None, prg_ram=True)
+        cpu.ppu.render = False
+        saved = []
+        with PageStore(path) as store:
+            for frame in range(1, frames + 1):
+                cpu.run_frame()
+                if frame % every == 0:
+                    saved.append((store.save(cpu).tobytes(), cpu.state_hash()))
+            pages = len(store)
+            restored = power_on(cartridge, sample_rate=None, prg_ram=True)
+            restored.ppu.render = False
+            for number, (snapshot, expected) in enumerate(saved):
+                store.restore(restored, snapshot_from_bytes(snapshot))
+                if restored.state_hash() != expected:
+                    print(f"PageStore: snapshot {number} restores to a different state_hash()")
+                    return False
+            for _ in range(every):
+                cpu.run_frame()
+                restored.run_frame()
+                if machine_state(restored) != machine_state(cpu):
+                    print(f"PageStore: restored machine diverges at frame {restored.ppu.frame}")
+                    return False
+
+        with PageStore(path) as store:
+            if len(store) != pages:
+                print(f"PageStore: reopened with {len(store)} pages, expected {pages}")
+                return False
+            for number, (snapshot, expected) in enumerate(saved):
+                store.restore(restored, snapshot_from_bytes(snapshot))
+                if restored.state_hash() != expected:
+                    print(f"PageStore: snapshot {number} restores differently after reopening")
+                    return False
+                if store.save(restored).tobytes() != snapshot or len(store) != pages:
+                    print(f"PageStore: saving snapshot {number} again after reopening added pages")
+                    return False
+    print(f"PageStore: {len(saved)} snapshots in {pages} pages round trip, before and after reopening")
+    return True
+
+def check_metrics(cartridge, frames=60):
+    """Runs the cartridge plainly, with fuse and with predecode; all must count the same instructions.
+
+    Metrics.update() must then report instructions per second, and the
+    predecode hit rate, from those counts alone.
+    """
+    runs = []
+    for fuse, predecode in ((False, False), (True, False), (False, True)):
+        cpu = power_on(cartridge, sample_rate=None)
+        cpu.ppu.render = False
+        cpu.fuse = fuse
+        cpu.predecode = predecode
+        runs.append(cpu)
+    metrics = Metrics()
+    metrics.update(runs[2])
+    for _ in range(frames):
+        for cpu in runs:
+            cpu.run_frame()
+    metrics.update(runs[2])
+    counts = [cpu.instructions for cpu in runs]
+    if len(set(counts)) != 1 or len({machine_state(cpu) for cpu in runs}) != 1:
+        print(f"metrics: plain, fuse and predecode runs count {counts} instructions")
+        return False
+    text = metrics.render()
+    for metric in ("py6502_instructions_total", "py6502_instructions_per_second", "py6502_predecode_hit_rate"):
+        if f"\n{metric}{{" not in text:
+            print(f"metrics: {metric} missing from\n{text}")
+            return False
+    print(f"metrics: {counts[0]} instructions counted alike by every run loop")
+    return True
+
+def check_recompiler(cartridge, frames=300):
+    """Runs the cartridge with compiled blocks and with the interpreter and compares every frame.
+
+    Registers, cycles and RAM must match after each frame, so interrupts
+    must be taken at the same instruction in both.
+    """
+    inputs = bytearray(frames)
+    for first in range(20, frames, 60):
+        inputs[first:first + 4] = bytes((START,)) * 4
+    runs = []
+    for _ in range(2):
+        cpu = power_on(cartridge, sample_rate=None)
+        cpu.ppu.render = False
+        cpu.controllers[0].play(inputs)
+        runs.append(cpu)
+    reference, cpu = runs
+    with tempfile.TemporaryDirectory() as directory:
+        compiled = recompiler.load(cartridge, directory)
+    for frame in range(frames):
+        reference.run_frame()
+        compiled.run_frame(cpu)
+        expected = machine_state(reference)
+        if machine_state(cpu) != expected or cpu.instructions != reference.instructions:
+            print(f"recompiler: frame {frame} differs:\n"
+                  f" Expected {expected[:7]} after {reference.instructions} instructions,\n"
+                  f"   Actual {machine_state(cpu)[:7]} after {cpu.instructions} instructions")
+            return False
+    print(f"recompiler: {frames} frames match, {compiled.compiled} blocks and "
+          f"{compiled.interpreted} interpreted instructions")
+    return check_recompiled_self_modifying_code()
+
+def check_recompiled_self_modifying_code():
+    """Runs ROM code that patches the block it is running from, in writable flat memory."""
+    program = bytes((
+        0xA9, 0x01,         # $8000 LDA #$01
+        0x8D, 0x06, 0x80,   # $8002 STA $8006 (LDX's operand, in the same block)
+        0xA2, 0x00,         # $8005 LDX #$00
+        0x4C, 0x07, 0x80,   # $8007 JMP $8007
+    ))
+    prg = bytearray(0x4000)
+    prg[:len(program)] = program
+    prg[0x3FFC:0x3FFE] = b"\x00\x80"
+    cartridge = Cartridge(b"NES\x1a\x01\x01" + bytes(10) + prg + bytes(0x2000))
+    runs = []
+    for _ in range(2):
+        memory = bytearray(0x10000)
+        cartridge.load_prg(memory)
+        cpu = Ricoh2A03(memory, trace=False)
+        cpu.attach_ppu(Ricoh2C02(cartridge.chr_rom, cartridge.mirroring))
+        cpu.ppu.render = False
+        cpu.reset()
+        runs.append(cpu)
+    reference, cpu = runs
+    with tempfile.TemporaryDirectory() as directory:
+        compiled = recompiler.load(cartridge, directory)
+    reference.run_frame()
+    compiled.run_frame(cpu)
+    if cpu.X != 0x01 or state_of(cpu) != state_of(reference) or cpu.cycles != reference.cycles:
+        print(f"recompiler: patched code expected X=01 as in {state_of(reference)}, got {state_of(cpu)}")
+        return False
+    print("recompiler: blocks are dropped when the code they were compiled from is written")
+    return True
+
+# Checks run by --machine, each given the cartridge and returning whether it passed.
+MACHINE_CHECKS = (check_skip_idle, check_state_hash, check_page_store, check_metrics, check_recompiler)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python test.py path_to_test_rom path_to_log")
+    options = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    paths = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if options == ["--alu"] and not paths:
+        sys.exit(0 if check_table_alu() else 1)
+    if options == ["--machine"] and len(paths) == 1:
+        cartridge = Cartridge.from_file(paths[0])
+        results = [check(cartridge) for check in MACHINE_CHECKS]
+        sys.exit(0 if all(results) else 1)
+    if len(paths) != 2 or not set(options) <= {"--fuse", "--predecode"}:
+        print("Usage: python test.py path_to_test_rom path_to_log [--fuse] [--predecode]")
+        print("       python test.py path_to_test_rom --machine")
+        print("       python test.py --alu")
+        print("  --fuse        run with superinstructions, checked against a plain CPU (cycles included)")
+        print("  --predecode   run from the predecode cache, checked the same way, then run self-modifying code")
+        print("  --machine     run the ROM as a full machine and check that the fast paths change nothing")
+        print("  --alu         check alu.TableALU against the branching ALU for every input")
         sys.exit(1)
 
-    test_rom_path = sys.argv[1]
-    log_path = sys.argv[2]
+    test_rom_path, log_path = paths
 
     # Load the test ROM and log
     rom_data = load_test_rom(test_rom_path)
     expected_log = load_expected_log(log_path)
 
-    # Initialize memory with ROM data
-    memory = initialize_memory(rom_data)
+    if not options:
+        # Initialize memory with ROM data
+        memory = initialize_memory(rom_data)
 
-    # Create CPU instance and reset to initial state
-    cpu = Ricoh2A03(memory)
-    cpu.reset()
+        # Create CPU instance and reset to initial state
+        cpu = Ricoh2A03(memory)
+        cpu.reset()
 
-    # Run the test with comparison to expected log
-    run_test(cpu, expected_log)
+        # Run the test with comparison to expected log
+        passed = run_test(cpu, expected_log)
+    else:
+        cpu = Ricoh2A03(initialize_memory(rom_data), trace=False)
+        cpu.fuse = "--fuse" in options
+        cpu.predecode = "--predecode" in options
+        reference = Ricoh2A03(initialize_memory(rom_data), trace=False)
+        cpu.reset()
+        reference.reset()
+        passed = run_test(cpu, expected_log, reference)
+        if passed and cpu.predecode:
+            print(f"{len(expected_log)} instructions match, {len(cpu._decoded)} instructions predecoded")
+            passed = check_self_modifying_code()
+        elif passed and cpu.fuse:
+            print(f"{len(expected_log)} instructions match, fusion rate {cpu.fusion_rate():.0%}")
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,172 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from env import NESEnv
+from memory import RAM_SIZE
+
+# Commands sent to workers. Only these single bytes travel through the pipes;
+# actions and results are exchanged through shared memory.
+_RESET = b"r"
+_STEP = b"s"
+_CLOSE = b"q"
+_DONE = b"k"
+
+
+def _attach(name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _worker(conn, names, count, start, env_args):
+    """Hosts the machines for rows start..start+count of the shared arrays."""
+    total = names["total"]
+    handles = []
+    arrays = {}
+    for key, shape, dtype in _layout(total):
+        shm, array = _attach(names[key], shape, dtype)
+        handles.append(shm)
+        arrays[key] = array[start:start + count]
+    actions = arrays["actions"]
+    observations = arrays["observations"]
+    rewards = arrays["rewards"]
+    dones = arrays["dones"]
+
+    envs = [NESEnv(**env_args) for _ in range(count)]
+    try:
+        while True:
+            command = conn.recv_bytes()
+            if command == _STEP:
+                for i, env in enumerate(envs):
+                    observation, reward, done, _ = env.step(int(actions[i]))
+                    if done:
+                        # Finished episodes restart straight away, as in Gym's vector envs.
+                        observation = env.reset()
+                    observations[i] = observation
+                    rewards[i] = reward
+                    dones[i] = done
+            elif command == _RESET:
+                for i, env in enumerate(envs):
+                    observations[i] = env.reset()
+            elif command == _CLOSE:
+                break
+            conn.send_bytes(_DONE)
+    finally:
+        del actions, observations, rewards, dones, arrays
+        for shm in handles:
+            shm.close()
+        conn.close()
+
+
+def _layout(total):
+    return (
+        ("actions", (total,), np.uint8),
+        ("observations", (total, RAM_SIZE), np.uint8),
+        ("rewards", (total,), np.float64),
+        ("dones", (total,), np.bool_),
+    )
+
+
+class VecEnv:
+    """Runs num_workers processes hosting envs_per_worker RAM-observation NESEnvs each.
+
+    Actions, observations, rewards and done flags live in shared memory arrays
+    with one row per environment; each worker reads and writes only its own
+    rows, and the pipes to the workers carry nothing but one byte commands.
+    Environments that finish are reset automatically and report the first
+    observation of their next episode.
+
+    reward_fn and done_fn are passed to every NESEnv, so they must be picklable
+    when the spawn start method is used.
+    """
+
+    def __init__(self, rom, num_workers, envs_per_worker=1, frame_skip=4,
+                 reward_fn=None, done_fn=None, max_steps=None, context=None):
+        self.num_envs = num_workers * envs_per_worker
+        ctx = multiprocessing.get_context(context)
+
+        self._handles = []
+        names = {"total": self.num_envs}
+        arrays = {}
+        for key, shape, dtype in _layout(self.num_envs):
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            self._handles.append(shm)
+            names[key] = shm.name
+            arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            arrays[key][...] = 0
+        self.actions = arrays["actions"]
+        self.observations = arrays["observations"]
+        self.rewards = arrays["rewards"]
+        self.dones = arrays["dones"]
+
+        env_args = {
+            "rom": rom,
+            "frame_skip": frame_skip,
+            "observation": "ram",
+            "reward_fn": reward_fn,
+            "done_fn": done_fn,
+            "max_steps": max_steps,
+        }
+        self._conns = []
+        self._processes = []
+        for i in range(num_workers):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(child, names, envs_per_worker, i * envs_per_worker, env_args),
+                daemon=True,
+            )
+            process.start()
+            child.close()
+            self._conns.append(parent)
+            self._processes.append(process)
+        self.closed = False
+
+    def _broadcast(self, command):
+        for conn in self._conns:
+            conn.send_bytes(command)
+        for conn in self._conns:
+            conn.recv_bytes()
+
+    def reset(self):
+        """Resets every environment; returns the (num_envs, 2048) observation array."""
+        self._broadcast(_RESET)
+        return self.observations
+
+    def step(self, actions):
+        """Steps every environment with one action each; returns (observations, rewards, dones).
+
+        The returned arrays are the shared buffers themselves and are
+        overwritten by the next call.
+        """
+        self.actions[:] = actions
+        self._broadcast(_STEP)
+        return self.observations, self.rewards, self.dones
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for conn in self._conns:
+            try:
+                conn.send_bytes(_CLOSE)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+        del self.actions, self.observations, self.rewards, self.dones
+        for shm in self._handles:
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()